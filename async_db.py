@@ -0,0 +1,217 @@
+# async_db.py
+#
+# Async facade over db.py and reports.py for the Telegram handlers. Blocking
+# work runs on bounded executors so one slow query or report never stalls the
+# event loop, and calls for the same user run in the order they were made.
+
+import os
+import time
+import asyncio
+import weakref
+import functools
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import render
+import database
+import metrics
+import bulk_import
+import write_queue
+import reports
+import sessions
+import throttle
+
+DB_WORKERS = int(os.getenv("DB_WORKERS", os.getenv("DB_POOL_SIZE", "4")))
+# Report threads mostly wait on the render process pool, one per render process.
+RENDER_WORKERS = render.RENDER_PROCESSES
+# File imports run for seconds to minutes; they get their own threads so they
+# never hold the ones every message's queries run on.
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "1"))
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+_render_executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+_import_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import")
+_user_locks = weakref.WeakValueDictionary()
+_in_flight = {}  # (function, user_id, flags) -> task rendering it
+_pending_renders = 0
+_pending_imports = 0
+
+
+def _user_lock(user_id):
+    # asyncio.Lock wakes waiters first-in first-out, which gives per-user ordering.
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _user_locks[user_id] = lock
+    return lock
+
+
+async def run_for_user(user_id, executor, fn, *args, **kwargs):
+    lock = _user_lock(user_id)
+    waited = time.perf_counter()
+    async with lock:
+        metrics.LOCK_WAIT_SECONDS.observe(time.perf_counter() - waited)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+
+def _query(fn):
+    # Runs on the db thread, so the timing excludes the wait for the user lock.
+    @functools.wraps(fn)
+    def measured(*args, **kwargs):
+        with metrics.span(metrics.QUERY_SECONDS, fn.__name__):
+            result = fn(*args, **kwargs)
+        rows = result[0] if isinstance(result, tuple) else result  # paging returns (rows, prev, next)
+        if isinstance(rows, list):
+            metrics.QUERY_ROWS.observe(len(rows), fn.__name__)
+        return result
+    return measured
+
+
+def _for_user(fn, executor=_db_executor):
+    if executor is _db_executor:
+        fn = _query(fn)
+
+    @functools.wraps(fn)
+    async def wrapper(user_id, *args, **kwargs):
+        return await run_for_user(user_id, executor, fn, user_id, *args, **kwargs)
+    return wrapper
+
+
+# --- SAVE FUNCTIONS ---
+# Inserts go through write_queue so writes from all chats on the same shard
+# share commits. The user lock is held until the batch has committed, which
+# keeps per-user order.
+ROW_BUILDERS = {
+    "expenses": db.expense_row,
+    "income": db.income_row,
+    "investments": db.investment_row,
+    "losses": db.loss_row,
+}
+
+
+async def save_each(user_id, kind, entries):
+    """Queue one insert per argument tuple in entries and wait for all of them.
+
+    Returns one item per entry: None if it was committed, else the exception.
+    A failed row never takes the others down (write_queue retries one by one).
+    """
+    rows = [ROW_BUILDERS[kind](user_id, *args) for args in entries]
+    path = database.user_db(user_id)
+    async with _user_lock(user_id):
+        results = await asyncio.gather(
+            *(asyncio.wrap_future(write_queue.submit(sql, params, path)) for sql, params in rows),
+            return_exceptions=True)
+    return [result if isinstance(result, BaseException) else None for result in results]
+
+
+async def save_many(user_id, kind, entries):
+    """Like save_each, but raises the first failure."""
+    for error in await save_each(user_id, kind, entries):
+        if error is not None:
+            raise error
+
+
+def _batched(kind):
+    async def wrapper(user_id, *args):
+        await save_many(user_id, kind, [args])
+    return wrapper
+
+
+save_expense = _batched("expenses")
+save_income = _batched("income")
+save_investment = _batched("investments")
+save_loss = _batched("losses")
+
+# --- GET FUNCTIONS ---
+get_recent_expenses = _for_user(db.get_recent_expenses)
+get_recent_income = _for_user(db.get_recent_income)
+get_recent_investments = _for_user(db.get_recent_investments)
+get_recent_losses = _for_user(db.get_recent_losses)
+get_paginated_entries = _for_user(db.get_paginated_entries)
+search_entries = _for_user(db.search_entries)
+
+# --- UPDATE / DELETE FUNCTIONS ---
+update_expense = _for_user(db.update_expense)
+update_income = _for_user(db.update_income)
+update_investment = _for_user(db.update_investment)
+update_loss = _for_user(db.update_loss)
+delete_entry = _for_user(db.delete_entry)
+
+# --- SESSIONS ---
+load_session = _for_user(sessions.load)
+save_session = _for_user(sessions.save)
+
+
+@asynccontextmanager
+async def user_session(user_id):
+    """The user's sessions.Session, saved afterwards if the handler changed it (even if it then failed)."""
+    session = await load_session(user_id)
+    before = session.state()
+    try:
+        yield session
+    finally:
+        if session.state() != before:
+            await save_session(user_id, session)
+
+_import_file = _query(bulk_import.import_file)
+
+
+async def import_file(user_id, path, default_kind=None):
+    """Import a file on the import executor; raises throttle.Busy when every import worker is taken."""
+    global _pending_imports
+    if _pending_imports >= IMPORT_WORKERS:
+        metrics.THROTTLED.inc("import")
+        raise throttle.Busy()
+    _pending_imports += 1
+    try:
+        return await run_for_user(user_id, _import_executor, _import_file, path, user_id, default_kind)
+    finally:
+        _pending_imports -= 1
+
+# --- REPORTS ---
+# An identical request already in flight is joined rather than repeated: its
+# result is current, because writes take the user lock too and so cannot
+# complete between its version read and the new request. At most
+# throttle.RENDER_MAX_PENDING renders are running or queued; past that,
+# requests raise throttle.Busy.
+def _coalesced(fn):
+    run = _for_user(fn, _render_executor)
+
+    @functools.wraps(fn)
+    async def wrapper(user_id, flags):
+        global _pending_renders
+        key = (fn.__name__, user_id, flags)
+        task = _in_flight.get(key)
+        if task is not None:
+            metrics.COALESCED.inc()
+        elif _pending_renders >= throttle.RENDER_MAX_PENDING:
+            metrics.THROTTLED.inc("busy")
+            raise throttle.Busy()
+        else:
+            _pending_renders += 1
+            task = _in_flight[key] = asyncio.ensure_future(run(user_id, flags))
+            task.add_done_callback(functools.partial(_finished, key))
+        # shield: one waiter giving up must not cancel the render for the others.
+        return await asyncio.shield(task)
+    return wrapper
+
+
+def _finished(key, task):
+    global _pending_renders
+    _pending_renders -= 1
+    del _in_flight[key]
+    if not task.cancelled():
+        task.exception()  # retrieved here in case every waiter was cancelled
+
+
+generate_report = _coalesced(reports.generate_report)
+generate_chart = _coalesced(reports.generate_chart)
+
+
+def shutdown(wait=True):
+    write_queue.stop()
+    _db_executor.shutdown(wait=wait)
+    _render_executor.shutdown(wait=wait)
+    _import_executor.shutdown(wait=wait)
@@ -0,0 +1,75 @@
+# benchmarks/bench_db.py
+#
+# Inserts/sec and reads/sec for a connect-per-call baseline against the pooled
+# connection layer. Run with: python -m benchmarks.bench_db [--ops N]
+
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+import database
+from units import to_cents, now_ts
+
+
+def legacy_save(path, user_id, amount, category):
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO expenses (user_id, amount_cents, category, ts) VALUES (?, ?, ?, ?)",
+                     (user_id, to_cents(amount), category, now_ts()))
+
+
+def legacy_recent(path, user_id, limit=5):
+    with sqlite3.connect(path) as conn:
+        conn.row_factory = sqlite3.Row
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM expenses WHERE user_id = ? ORDER BY ts DESC LIMIT ?", (user_id, limit))
+        return [dict(row) for row in cur.fetchall()]
+
+
+def rate(fn, ops, users):
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(i % users)
+    return ops / (time.perf_counter() - start)
+
+
+def run(ops, users):
+    import db
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        pooled_path = os.path.join(tmp, "pooled.db")
+
+        database.DB_PATH = legacy_path
+        db.init_db()
+        database.close_all()
+        # The baseline also has to run in rollback-journal mode to be a fair "before".
+        with sqlite3.connect(legacy_path) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        results["legacy_inserts_per_sec"] = rate(lambda u: legacy_save(legacy_path, u, 12.5, "food"), ops, users)
+        results["legacy_reads_per_sec"] = rate(lambda u: legacy_recent(legacy_path, u), ops, users)
+
+        database.DB_PATH = pooled_path
+        db.init_db()
+        results["pooled_inserts_per_sec"] = rate(lambda u: db.save_expense(u, 12.5, "food"), ops, users)
+        results["pooled_reads_per_sec"] = rate(lambda u: db.get_recent_expenses(u), ops, users)
+        database.close_all()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the database connection layer")
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+
+    results = run(args.ops, args.users)
+    for key, value in results.items():
+        print(f"{key:28} {value:12,.0f}")
+    print(f"{'insert speedup':28} {results['pooled_inserts_per_sec'] / results['legacy_inserts_per_sec']:12.1f}x")
+    print(f"{'read speedup':28} {results['pooled_reads_per_sec'] / results['legacy_reads_per_sec']:12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_export.py
+#
+# Peak RSS and wall time of the Full Breakdown export for one user with a
+# long history (1M rows by default): the old "read every ledger into pandas,
+# concat, to_excel" path against the streaming writers in export.py. Each
+# export runs in a fresh interpreter so ru_maxrss is that export's peak alone.
+# The streaming figure levels off at the interpreter plus SQLite's page cache
+# and mmap window (database.PRAGMAS), whatever the row count.
+# Run with: python -m benchmarks.bench_export [--rows 1000000] [--skip-legacy]
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.datagen import generate
+from benchmarks.bench_reports import HEAVY_USER
+
+PROBE = """
+import sys, json, time, resource
+sys.path.insert(0, %(root)r)
+start = time.perf_counter()
+%(body)s
+print(json.dumps({"seconds": time.perf_counter() - start,
+                  "peak_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "bytes": __import__("os").path.getsize(%(out)r)}))
+"""
+
+LEGACY = """
+import sqlite3
+import pandas as pd
+conn = sqlite3.connect(%(db)r)
+frames = []
+for table, name in (("expenses", "Expense"), ("income", "Income"), ("investments", "Investment"), ("losses", "Loss")):
+    df = pd.read_sql(f"SELECT * FROM {table} WHERE user_id={%(user)d}", conn)
+    df["Type"] = name
+    frames.append(df)
+conn.close()
+pd.concat(frames).to_excel(%(out)r, index=False)
+"""
+
+STREAMING = """
+import export
+export.export_full(%(db)r, %(user)d, 0, %(out)r, %(fmt)r)
+"""
+
+
+def measure(body, db_path, out, fmt="xlsx"):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    params = {"db": db_path, "user": HEAVY_USER, "out": out, "fmt": fmt, "root": root}
+    code = PROBE % dict(params, body=body % params)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Full Breakdown export memory")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows owned by the exporting user")
+    parser.add_argument("--skip-legacy", action="store_true", help="skip the (slow) pandas path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        generate(db_path, 200, args.rows, heavy_user=HEAVY_USER, heavy_share=1.0)
+        cases = [] if args.skip_legacy else [("pandas to_excel", LEGACY, "xlsx")]
+        cases += [("streaming xlsx", STREAMING, "xlsx"), ("streaming csv", STREAMING, "csv"),
+                  ("streaming csv.gz", STREAMING, "csv.gz")]
+        print(f"{args.rows:,} rows for user {HEAVY_USER}")
+        print(f"{'path':<18} {'seconds':>8} {'peak RSS':>10} {'file':>10}")
+        for name, body, fmt in cases:
+            r = measure(body, db_path, os.path.join(tmp, f"out.{fmt}"), fmt)
+            print(f"{name:<18} {r['seconds']:>8.1f} {r['peak_mib']:>7.0f} MiB {r['bytes'] / 2**20:>6.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_projection.py
+#
+# Time to project N investment positions over the default day grid, the
+# vectorized engine in projection.py vs a plain Python loop over positions
+# and days. Positions are random in memory; no database is involved.
+# Run with: python -m benchmarks.bench_projection [--positions 1000 10000 50000]
+
+import math
+import time
+import argparse
+
+import numpy as np
+
+import projection
+from projection import INTERVAL_DAYS, YEAR_DAYS, day_grid, project
+
+
+def sample_positions(n, today, seed=7):
+    rng = np.random.default_rng(seed)
+    amounts = np.round(rng.lognormal(math.log(50_000), 1.0, n))
+    rois = np.round(rng.normal(8, 5, n), 1)
+    intervals = rng.choice(list(INTERVAL_DAYS.values()), n)
+    starts = today - rng.integers(0, 730, n).astype(np.float64)
+    return amounts, rois, intervals, starts
+
+
+def project_loop(amounts, rois, intervals, starts, days):
+    values = []
+    for day in days:
+        total = 0.0
+        for amount, roi, interval, start in zip(amounts, rois, intervals, starts):
+            if day >= start:
+                rate = max(roi / 100 * interval / YEAR_DAYS, projection.MIN_RATE)
+                total += amount * (1 + rate) ** math.floor((day - start) / interval)
+        values.append(total)
+    return np.array(values)
+
+
+def best_of(fn, *args, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the investment projection engine")
+    parser.add_argument("--positions", type=int, nargs="+", default=[1000, 10_000, 50_000])
+    parser.add_argument("--loop-max", type=int, default=10_000, help="skip the Python loop above this size")
+    args = parser.parse_args()
+
+    today = 20_000
+    days = day_grid(today - 730, today, today + round(projection.PROJECTION_YEARS * YEAR_DAYS))
+    print(f"{len(days)} grid days")
+    print(f"{'positions':>9} {'numpy ms':>9} {'loop ms':>9} {'speedup':>8}")
+    for n in args.positions:
+        positions = sample_positions(n, today)
+        fast, values = best_of(project, *positions, days)
+        if n <= args.loop_max:
+            slow, expected = best_of(project_loop, *positions, days, repeat=1)
+            assert np.allclose(values, expected, rtol=1e-9), "vectorized and loop results differ"
+            print(f"{n:>9,} {fast * 1000:>9.1f} {slow * 1000:>9.0f} {slow / fast:>7.0f}x")
+        else:
+            print(f"{n:>9,} {fast * 1000:>9.1f} {'-':>9} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# benchmarks/bench_render.py
+#
+# Charts rendered per second by the render process pool as the number of
+# worker processes grows. Run with: python -m benchmarks.bench_render [--charts 64]
+
+import os
+import time
+import random
+import argparse
+import tempfile
+from concurrent.futures import wait
+from datetime import date, timedelta
+
+import render
+
+
+def sample_series(days=365):
+    rng = random.Random(7)
+    start = date.today() - timedelta(days=days)
+    return {name: {(start + timedelta(days=d)).isoformat(): rng.uniform(0, 500) for d in range(days)}
+            for name in ("Expenses", "Income")}
+
+
+def run(processes, charts, out_dir):
+    render.RENDER_PROCESSES = processes
+    render.warm_up()
+    series = sample_series()
+    start = time.perf_counter()
+    futures = [render.submit(render.render_daily_lines, "Expenses vs Income", series,
+                             os.path.join(out_dir, f"{processes}_{i}.png")) for i in range(charts)]
+    wait(futures)
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - start
+    render.shutdown()
+    return charts / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the render process pool")
+    parser.add_argument("--charts", type=int, default=64)
+    parser.add_argument("--max-processes", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    levels = sorted({1, 2, 4, args.max_processes} & set(range(1, args.max_processes + 1)))
+    with tempfile.TemporaryDirectory() as tmp:
+        base = None
+        print(f"{'processes':>9} {'charts/s':>9} {'scaling':>8}")
+        for processes in levels:
+            rate = run(processes, args.charts, tmp)
+            base = base or rate
+            print(f"{processes:>9} {rate:>9.1f} {rate / base:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
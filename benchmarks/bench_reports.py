@@ -0,0 +1,95 @@
+# benchmarks/bench_reports.py
+#
+# Latency and peak memory of report data loading: the old "SELECT * into
+# pandas, then filter and sum" pattern against the SQL pushdown in
+# report_queries.py, on a seeded database (1M rows by default).
+# Run with: python -m benchmarks.bench_reports [--rows 1000000]
+
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+import tracemalloc
+
+import database
+from benchmarks.datagen import generate
+
+HEAVY_USER = 1
+
+
+def legacy_totals(path, user_id, cutoff):
+    import pandas as pd
+
+    conn = sqlite3.connect(path)
+    df_exp = pd.read_sql(f"SELECT * FROM expenses WHERE user_id={user_id}", conn)
+    df_inc = pd.read_sql(f"SELECT * FROM income WHERE user_id={user_id}", conn)
+    df_inv = pd.read_sql(f"SELECT * FROM investments WHERE user_id={user_id}", conn)
+    df_loss = pd.read_sql(f"SELECT * FROM losses WHERE user_id={user_id}", conn)
+    conn.close()
+    df_exp = df_exp[df_exp['ts'] >= cutoff]
+    df_inc = df_inc[df_inc['ts'] >= cutoff]
+    df_loss = df_loss[df_loss['ts'] >= cutoff]
+    df_inv = df_inv[df_inv['ts'] >= cutoff]
+    return pd.DataFrame([{
+        "total_expenses": df_exp['amount_cents'].sum() / 100,
+        "total_income": df_inc['amount_cents'].sum() / 100,
+        "total_invested": df_inv['amount_cents'].sum() / 100,
+        "total_roi": (df_inv['amount_cents'] * df_inv['roi'] / 10000).sum(),
+        "total_losses": df_loss['amount_cents'].sum() / 100
+    }])
+
+
+def pushdown_rows(user_id, cutoff):
+    import pandas as pd
+    from report_queries import fetch_rows
+
+    frames = [pd.DataFrame(rows, columns=cols) for cols, rows in
+              (fetch_rows(user_id, kind, cutoff) for kind in ("expenses", "income", "investments", "losses"))]
+    return pd.concat(frames, ignore_index=True)
+
+
+def measure(fn, repeat):
+    fn()  # warm caches and imports
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark report data loading")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from report_queries import date_cutoff, fetch_totals
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        start = time.perf_counter()
+        generate(path, 200, args.rows, heavy_user=HEAVY_USER, heavy_share=0.25)
+        print(f"seeded {args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+        cases = []
+        for window in ("7d", "30d", "all"):
+            cutoff = date_cutoff(window)
+            cases.append((f"totals {window} legacy", lambda c=cutoff: legacy_totals(path, HEAVY_USER, c)))
+            cases.append((f"totals {window} pushdown", lambda c=cutoff: fetch_totals(HEAVY_USER, c)))
+        cutoff = date_cutoff("30d")
+        cases.append(("full 30d legacy load", lambda: legacy_totals(path, HEAVY_USER, cutoff)))
+        cases.append(("full 30d pushdown load", lambda: pushdown_rows(HEAVY_USER, cutoff)))
+
+        print(f"{'case':28} {'ms':>10} {'peak MiB':>10}")
+        for name, fn in cases:
+            ms, mib = measure(fn, args.repeat)
+            print(f"{name:28} {ms:10.1f} {mib:10.1f}")
+        database.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# benchmarks/bench_snapshot.py
+#
+# The Parquet snapshot (snapshot.py) on a scratch database from datagen.py:
+# time for the first full update, for an incremental one after --writes
+# mixed inserts, updates and deletes, and for the fleet-wide queries. For
+# query timings at a scale SQLite can't be filled at quickly, --scale copies
+# the snapshot into that many synthetic shards (user ids shifted so they stay
+# distinct), so --entries 1000000 --scale 20 queries 20 million rows.
+# Run with: python -m benchmarks.bench_snapshot [--entries 1000000] [--scale 20] [--writes 10000]
+
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+from benchmarks.datagen import generate
+
+
+def best_of(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def churn(db, database, users, writes, seed=3):
+    """writes ledger writes: 80% inserts, 10% updates, 10% deletes of existing expenses."""
+    rng = random.Random(seed)
+    for _ in range(writes):
+        user_id = rng.randint(1, users)
+        roll = rng.random()
+        if roll < 0.8:
+            db.save_expense(user_id, f"{rng.uniform(1, 90):.2f}", rng.choice(["food", "transport", "other"]))
+            continue
+        with database.connection(database.user_db(user_id)) as conn:
+            row = conn.execute("SELECT id FROM expenses WHERE user_id = ? ORDER BY ts DESC LIMIT 1 OFFSET ?",
+                               (user_id, rng.randint(0, 20))).fetchone()
+        if row is None:
+            continue
+        if roll < 0.9:
+            db.update_expense(user_id, row[0], f"{rng.uniform(1, 90):.2f}", "fixed")
+        else:
+            db.delete_entry(user_id, "expenses", row[0])
+
+
+def scale_out(snapshot, copies, users):
+    """Add copies - 1 synthetic shards holding the snapshot again, user ids shifted by users each time."""
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    manifest = snapshot.read_manifest()
+    originals = dict(manifest["shards"])
+    for copy in range(1, copies):
+        for shard, state in originals.items():
+            name = f"{copy}x{shard}"
+            for kind in snapshot.KINDS:
+                for n, path in enumerate(snapshot.live_parts(manifest, kind).get(shard, [])):
+                    table = pq.read_table(path)
+                    shifted = pc.add(table["user_id"], copy * users)
+                    table = table.set_column(table.schema.get_field_index("user_id"), "user_id", shifted)
+                    target = snapshot.part_path(snapshot.SNAPSHOT_DIR, kind, name, n)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    pq.write_table(table, target, compression="zstd", row_group_size=snapshot.ROW_GROUP)
+            manifest["shards"][name] = dict(state, db=f"{state['db']} (copy {copy})")
+    snapshot.write_manifest(manifest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time snapshot updates and fleet-wide snapshot queries")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--writes", type=int, default=10_000)
+    parser.add_argument("--scale", type=int, default=1, help="query a snapshot this many times larger")
+    args = parser.parse_args()
+
+    root = os.getcwd()
+    tmp = tempfile.mkdtemp(prefix="ceefinance-snapshot-")
+    os.environ["FINANCE_DB"] = os.path.join(tmp, "snapshot.db")
+    os.chdir(tmp)  # SNAPSHOT_DIR is relative to the working directory
+    try:
+        import db
+        import units
+        import database
+        import snapshot
+
+        start = time.perf_counter()
+        written = generate(database.DB_PATH, args.users, args.entries, 42, 730)
+        print(f"seeded {sum(written.values()):,} entries for {args.users} users in {time.perf_counter() - start:.1f}s")
+        db.init_db()
+
+        start = time.perf_counter()
+        rows = sum(snapshot.update().values())
+        elapsed = time.perf_counter() - start
+        print(f"full update         {elapsed:8.2f}s  {rows:,} rows ({rows / elapsed:,.0f} rows/s)")
+
+        churn(db, database, args.users, args.writes)
+        start = time.perf_counter()
+        rows = sum(snapshot.update().values())
+        print(f"incremental update  {time.perf_counter() - start:8.2f}s  {rows:,} changed rows after {args.writes:,} writes")
+
+        if args.scale > 1:
+            scale_out(snapshot, args.scale, args.users)
+        total = sum(snapshot.load(kind, ["id"]).num_rows for kind in snapshot.KINDS)
+        month = units.format_ts(units.now_ts(), "%Y-%m")
+        since, until = units.period(month)
+        queries = {
+            "totals per user": lambda: snapshot.totals_per_user("expenses"),
+            "label totals": lambda: snapshot.label_totals("expenses"),
+            "monthly totals (all ledgers)": lambda: snapshot.monthly_totals(),
+            f"totals per user, {month}": lambda: snapshot.totals_per_user("expenses", since, until),
+        }
+        for stage in ("before compact", "after compact"):
+            if stage == "after compact":
+                start = time.perf_counter()
+                merged = snapshot.compact()
+                print(f"compact             {time.perf_counter() - start:8.2f}s  {merged} parts merged")
+            print(f"\nqueries over {total:,} current rows, {stage}")
+            for name, query in queries.items():
+                elapsed, result = best_of(query)
+                print(f"  {name:32} {elapsed * 1000:9.1f} ms  {result.num_rows:,} result rows")
+        database.close_all()
+    finally:
+        os.chdir(root)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
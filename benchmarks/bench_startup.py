@@ -0,0 +1,121 @@
+# benchmarks/bench_startup.py
+#
+# Bot start-up cost: time to import main, migrate the database, build and
+# initialize the Application, run post_init (render warm-up, precompute,
+# metrics server) and get the answer to the first getUpdates, RSS at that
+# point, and which heavy analytics modules got imported on the way. The Bot
+# API is bench_webhook's local stub. Each run is a fresh interpreter. Compare
+# against a saved baseline to catch regressions:
+#
+#   python -m benchmarks.bench_startup --save benchmarks/startup_baseline.json
+#   python -m benchmarks.bench_startup --baseline benchmarks/startup_baseline.json
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+HEAVY_MODULES = ["pandas", "numpy", "matplotlib", "openpyxl", "pyarrow"]
+TOLERANCE = 1.25  # fail when a metric is 25% worse than the baseline
+
+PROBE = """
+import os, sys, json, time, asyncio
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from benchmarks.bench_webhook import start_stub
+
+
+async def first_poll(app):
+    await app.initialize()
+    await app.post_init(app)
+    await app.bot.get_updates(timeout=0)
+
+
+stub = start_stub()
+main.init_db()
+app = main.build_app("123456:startup-benchmark", f"http://127.0.0.1:{stub.server_address[1]}/bot")
+loop = asyncio.new_event_loop()
+loop.run_until_complete(first_poll(app))
+ready = time.perf_counter()
+rss_kb = 0
+with open("/proc/self/status") as status:
+    for line in status:
+        if line.startswith("VmRSS:"):
+            rss_kb = int(line.split()[1])
+loop.run_until_complete(app.post_shutdown(app))
+loop.run_until_complete(app.shutdown())
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "ready_ms": (ready - start) * 1000,
+    "rss_mib": rss_kb / 1024,
+    "heavy_modules": sorted(m for m in %r if m in sys.modules),
+}))
+"""
+
+EAGER_PROBE = """
+import time
+start = time.perf_counter()
+import pandas, matplotlib.pyplot, openpyxl
+from matplotlib.backends.backend_pdf import PdfPages
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def probe(code, cwd, env):
+    out = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def run(runs):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=root, FINANCE_DB=os.path.join(tmp, "startup.db"))
+        samples = [probe(PROBE % HEAVY_MODULES, tmp, env) for _ in range(runs)]
+        eager_ms = statistics.median(probe(EAGER_PROBE, tmp, env) for _ in range(runs))
+    return {
+        "import_ms": statistics.median(s["import_ms"] for s in samples),
+        "ready_ms": statistics.median(s["ready_ms"] for s in samples),
+        "rss_mib": statistics.median(s["rss_mib"] for s in samples),
+        "heavy_modules": samples[-1]["heavy_modules"],
+        "eager_analytics_import_ms": eager_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bot start-up time and memory")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline", help="JSON file to compare against; exits 1 on regression")
+    parser.add_argument("--save", help="write this run's results to a JSON file")
+    args = parser.parse_args()
+
+    result = run(args.runs)
+    print(f"import main            {result['import_ms']:8.1f} ms")
+    print(f"ready to poll          {result['ready_ms']:8.1f} ms")
+    print(f"RSS at first poll      {result['rss_mib']:8.1f} MiB")
+    print(f"heavy modules loaded   {', '.join(result['heavy_modules']) or 'none'}")
+    print(f"(eager pandas/matplotlib/openpyxl import would add {result['eager_analytics_import_ms']:.0f} ms)")
+
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump(result, fh, indent=2)
+
+    failed = bool(result["heavy_modules"])
+    if failed:
+        print("REGRESSION: analytics modules are imported at start-up")
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        for metric in ("import_ms", "ready_ms", "rss_mib"):
+            if result[metric] > baseline[metric] * TOLERANCE:
+                print(f"REGRESSION: {metric} {result[metric]:.1f} vs baseline {baseline[metric]:.1f}")
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+# benchmarks/bench_webhook.py
+#
+# Offline throughput of webhook mode: the bot runs with its real handlers and
+# webhook server (webhook.py) on a scratch database, and Telegram is replaced
+# on both sides:
+#   - a client POSTs the recorded updates in benchmarks/updates.jsonl, one
+#     copy per simulated user (ids and update ids rewritten), over at most
+#     WEBHOOK_MAX_CONNECTIONS keep-alive connections, as Telegram does
+#   - the Bot API is a local stub (base_url) that accepts every send and
+#     returns a minimal Message, so replies cost a real HTTP round trip
+# Each simulated user sends their next update once the previous one was
+# handled, like a person waiting for the reply. --burst posts everything at
+# once and then shuts down straight away, to check that draining handles
+# every update that was accepted. The client shares the bot's event loop, so
+# POST latencies include waiting behind handlers and are an upper bound.
+# Run with: python -m benchmarks.bench_webhook [--levels 1,8,32,128] [--rounds 3] [--burst]
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RECORDED = os.path.join(os.path.dirname(os.path.abspath(__file__)), "updates.jsonl")
+TOKEN = "123456:webhook-benchmark"
+SECRET = "benchmark-secret"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "CeeFiBot", "username": "ceefibot"}
+
+
+# --- BOT API STUB ---
+class StubBotAPI(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out in two writes
+    calls = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        method = self.path.rsplit("/", 1)[-1]
+        StubBotAPI.calls += 1
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "getUpdates":
+            result = []
+        elif method.startswith("send"):
+            result = {"message_id": StubBotAPI.calls, "date": int(time.time()), "from": BOT_USER,
+                      "chat": {"id": 1, "type": "private"}}
+        else:
+            result = True  # answerCallbackQuery, setWebhook, deleteWebhook, ...
+        body = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubBotAPI)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="bot-api-stub", daemon=True).start()
+    return server
+
+
+# --- RECORDED UPDATES ---
+def load_recorded(path=RECORDED):
+    with open(path) as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def for_user(recorded, user_id, next_id):
+    """The recorded updates as sent by user_id, with fresh update ids from next_id."""
+    updates = []
+    for n, update in enumerate(recorded):
+        text = json.dumps(update).replace('"id": 1000,', f'"id": {user_id},')
+        copy = json.loads(text)
+        copy["update_id"] = next_id + n
+        updates.append(copy)
+    return updates
+
+
+# --- CLIENT ---
+# httpx's pool gets quadratic with hundreds of queued requests, which would
+# measure the client; like Telegram, this one keeps a fixed set of
+# keep-alive connections and sends each update on a free one.
+class Poster:
+    def __init__(self, port, connections, secret=SECRET):
+        self.port, self.size, self.secret = port, connections, secret
+        self._free = asyncio.Queue()
+
+    async def open(self):
+        for _ in range(self.size):
+            self._free.put_nowait(await asyncio.open_connection("127.0.0.1", self.port))
+
+    async def close(self):
+        while not self._free.empty():
+            _, writer = self._free.get_nowait()
+            writer.close()
+
+    async def post(self, update):
+        """POST update; returns the response status."""
+        body = json.dumps(update).encode()
+        reader, writer = await self._free.get()
+        try:
+            writer.write(f"POST / HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+                         f"X-Telegram-Bot-Api-Secret-Token: {self.secret}\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            head = await reader.readuntil(b"\r\n\r\n")  # the server always answers with an empty body
+        finally:
+            self._free.put_nowait((reader, writer))
+        return int(head.split(b" ", 2)[1])
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+# --- RUN ---
+async def run_level(bot, recorded, users, rounds, burst, first_user):
+    import webhook
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    app = bot.build_app(TOKEN, base_url=f"http://127.0.0.1:{STUB.server_address[1]}/bot")
+    app.post_shutdown = None  # the db and render pools serve every level; main() shuts them down
+    handled = {}  # update id -> future set once every handler group has run
+
+    async def done(update, context):
+        future = handled.get(update.update_id)
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+
+    app.add_handler(TypeHandler(Update, done), group=1)
+    server = await webhook.start(app, url="", listen="127.0.0.1", port=0, secret=SECRET)
+    client = Poster(server.port, webhook.WEBHOOK_MAX_CONNECTIONS)
+    await client.open()
+    post_times, handle_times = [], []
+    loop = asyncio.get_running_loop()
+
+    async def post(update):
+        handled[update["update_id"]] = loop.create_future()
+        start = time.perf_counter()
+        status = await client.post(update)
+        assert status == 200, status
+        post_times.append(time.perf_counter() - start)
+        return start
+
+    async def session(updates):
+        for update in updates:
+            start = await post(update)
+            handle_times.append(await handled[update["update_id"]] - start)
+
+    next_id = 1
+    start = time.perf_counter()
+    for r in range(rounds):
+        batch = []
+        for i in range(users):
+            batch.append(for_user(recorded, first_user + r * users + i, next_id))
+            next_id += len(recorded)
+        if burst:
+            await asyncio.gather(*(post(u) for updates in batch for u in updates))
+        else:
+            await asyncio.gather(*(session(updates) for updates in batch))
+    posted = time.perf_counter()
+    await client.close()
+    await webhook.drain(app, server)
+    drained = time.perf_counter()
+
+    finished = [f.result() for f in handled.values() if f.done()]
+    return {
+        "users": users,
+        "updates": len(handled),
+        "handled": len(finished),
+        "updates_per_sec": len(finished) / (max(finished) - start) if finished else 0.0,
+        "post_p50_ms": statistics.median(post_times) * 1000,
+        "post_p99_ms": percentile(post_times, 99) * 1000,
+        "handle_p99_ms": percentile(handle_times, 99) * 1000 if handle_times else None,
+        "drain_ms": (drained - posted) * 1000,
+    }
+
+
+def main():
+    global STUB
+
+    parser = argparse.ArgumentParser(description="Post recorded updates to the webhook server and time them")
+    parser.add_argument("--levels", default="1,8,32,128", help="simulated users sending at once")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--burst", action="store_true", help="post every update without waiting, then drain")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="ceefi-webhook-")
+    os.environ["FINANCE_DB"] = os.path.join(tmp, "webhook.db")
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["PRECOMPUTE"] = "off"
+    os.chdir(tmp)  # reports/ and charts/ are created relative to the working directory
+
+    import main as bot
+    bot.init_db()
+    STUB = start_stub()
+    recorded = load_recorded()
+
+    print(f"{'users':>5} {'updates':>8} {'handled':>8} {'upd/s':>8} {'POST p50 ms':>12} {'POST p99 ms':>12} "
+          f"{'handled p99 ms':>15} {'drain ms':>9}")
+    for n, level in enumerate(int(v) for v in args.levels.split(",")):
+        row = asyncio.run(run_level(bot, recorded, level, args.rounds, args.burst, 10_000 + n * 100_000))
+        handle = "-" if row["handle_p99_ms"] is None else f"{row['handle_p99_ms']:.1f}"
+        print(f"{row['users']:>5} {row['updates']:>8} {row['handled']:>8} {row['updates_per_sec']:>8.1f} "
+              f"{row['post_p50_ms']:>12.2f} {row['post_p99_ms']:>12.2f} {handle:>15} {row['drain_ms']:>9.1f}")
+    asyncio.run(bot.shutdown(None))
+    STUB.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# benchmarks/bench_writes.py
+#
+# Concurrent inserts: one commit per write (db.save_expense on the executor)
+# against group commit through write_queue, at the same concurrency, for one
+# or more shard counts (DB_SHARDS).
+# Run with: python -m benchmarks.bench_writes [--writers 200] [--writes 20] [--shards 1 2 4]
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+import database
+
+
+async def direct(async_db, db, writers, writes):
+    async def writer(user_id):
+        for i in range(writes):
+            await async_db.run_for_user(user_id, async_db._db_executor, db.save_expense, user_id, i, "bench")
+    await asyncio.gather(*(writer(u) for u in range(writers)))
+
+
+async def queued(async_db, writers, writes):
+    async def writer(user_id):
+        for i in range(writes):
+            await async_db.save_expense(user_id, i, "bench")
+    await asyncio.gather(*(writer(u) for u in range(writers)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-write commits vs the write queue")
+    parser.add_argument("--writers", type=int, default=200)
+    parser.add_argument("--writes", type=int, default=20)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1], help="shard counts to compare")
+    args = parser.parse_args()
+    total = args.writers * args.writes
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        import db
+        import async_db
+        import write_queue
+
+        print(f"{'shards':>6} {'mode':10} {'writes/s':>10} {'commits':>8}")
+        for shards in args.shards:
+            database.SHARDS = shards
+            database.DB_PATH = os.path.join(tmp, f"writes-{shards}.db")
+            db.init_db()
+
+            start = time.perf_counter()
+            asyncio.run(direct(async_db, db, args.writers, args.writes))
+            direct_rate = total / (time.perf_counter() - start)
+
+            batches = write_queue.stats()["batches"]
+            start = time.perf_counter()
+            asyncio.run(queued(async_db, args.writers, args.writes))
+            queued_rate = total / (time.perf_counter() - start)
+            batches = write_queue.stats()["batches"] - batches
+
+            print(f"{shards:>6} {'direct':10} {direct_rate:>10,.0f} {total:>8,}")
+            print(f"{shards:>6} {'queued':10} {queued_rate:>10,.0f} {batches:>8,}")
+
+        async_db.shutdown()
+        database.close_all()
+
+
+if __name__ == "__main__":
+    main()
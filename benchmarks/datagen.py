@@ -0,0 +1,153 @@
+# benchmarks/datagen.py
+#
+# Seeded synthetic data for benchmarks: N users and M ledger entries with
+# roughly realistic shapes, so the same seed always gives the same database
+# (relative to today, so 7d/30d windows stay populated):
+#   - activity per user is Zipf-like: a few heavy users, a long tail
+#   - ~70% expenses, 12% income, 6% investments, 12% losses
+#   - each label has its own log-normal amount (rent is large and steady,
+#     coffee-sized food entries are small and frequent)
+#   - entries spread over the last `days` days, mostly in waking hours
+# Rows go to each user's shard (DB_SHARDS) as they would in the bot.
+#
+# Fill a scratch database from the command line:
+#   FINANCE_DB=/tmp/bench.db python -m benchmarks.datagen --users 500 --entries 200000
+
+import sys
+import math
+import random
+import argparse
+from datetime import datetime
+
+import database
+from units import DAY, to_ts
+
+KIND_WEIGHTS = {"expenses": 0.70, "income": 0.12, "investments": 0.06, "losses": 0.12}
+# kind -> [(label, share, median amount, spread)]; amounts are log-normal.
+LABELS = {
+    "expenses": [("food", 0.35, 15, 0.6), ("transport", 0.15, 8, 0.5), ("rent", 0.03, 900, 0.2),
+                 ("utilities", 0.07, 60, 0.4), ("entertainment", 0.12, 25, 0.7),
+                 ("shopping", 0.15, 40, 0.8), ("health", 0.05, 50, 0.7), ("other", 0.08, 20, 0.9)],
+    "income": [("salary", 0.50, 2500, 0.3), ("freelance", 0.25, 400, 0.7), ("gift", 0.10, 100, 0.8),
+               ("sales", 0.15, 150, 0.9)],
+    "investments": [("stock", 0.45, 500, 0.8), ("bond", 0.25, 1000, 0.5), ("crypto", 0.20, 200, 1.1),
+                    ("real estate", 0.10, 5000, 0.6)],
+    "losses": [("fees", 0.50, 5, 0.6), ("fine", 0.20, 50, 0.5), ("theft", 0.10, 150, 0.9),
+               ("damage", 0.20, 80, 0.8)],
+}
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 8, 10, 9, 8, 9, 12, 10, 8, 8, 9, 11, 12, 11, 9, 6, 4, 2]
+CHUNK = 50_000
+
+
+def user_weights(users, heavy_user=None, heavy_share=None):
+    """Zipf-like weights for user ids 1..users; heavy_user can be given a fixed share of all entries."""
+    weights = [1 / rank ** 1.1 for rank in range(1, users + 1)]
+    if heavy_user is None or heavy_share is None:
+        return weights
+    weights[heavy_user - 1] = 0.0
+    if heavy_share >= 1:
+        return [1.0 if uid == heavy_user else 0.0 for uid in range(1, users + 1)]
+    weights[heavy_user - 1] = heavy_share / (1 - heavy_share) * sum(weights)
+    return weights
+
+
+def entries(rng, users, count, days, heavy_user=None, heavy_share=None):
+    """Yield (kind, params for the kind's db.INSERT_*) tuples."""
+    user_ids = list(range(1, users + 1))
+    cum_users = list(_cumulative(user_weights(users, heavy_user, heavy_share)))
+    kinds = list(KIND_WEIGHTS)
+    cum_kinds = list(_cumulative(KIND_WEIGHTS.values()))
+    labels = {kind: (specs, list(_cumulative(share for _, share, _, _ in specs))) for kind, specs in LABELS.items()}
+    cum_hours = list(_cumulative(HOUR_WEIGHTS))
+    today = to_ts(datetime.now().replace(hour=0, minute=0, second=0, microsecond=0))
+
+    for _ in range(count):
+        user = rng.choices(user_ids, cum_weights=cum_users)[0]
+        kind = rng.choices(kinds, cum_weights=cum_kinds)[0]
+        specs, cum = labels[kind]
+        label, _, median, spread = rng.choices(specs, cum_weights=cum)[0]
+        cents = max(1, round(rng.lognormvariate(math.log(median), spread) * 100))
+        hour = rng.choices(range(24), cum_weights=cum_hours)[0]
+        ts = today - rng.randrange(days) * DAY + hour * 3600 + rng.randrange(3600)
+        if kind == "investments":
+            roi = round(min(max(rng.gauss(8, 5), -20), 40), 1)
+            yield kind, (user, cents, label, roi, rng.choice(["monthly", "yearly"]), ts)
+        else:
+            yield kind, (user, cents, label, ts)
+
+
+def _cumulative(weights):
+    total = 0
+    for w in weights:
+        total += w
+        yield total
+
+
+def generate(path, users, count, seed=42, days=730, heavy_user=None, heavy_share=None):
+    """Fill the ledgers at path with count entries for users 1..users. Returns rows per kind."""
+    import db
+
+    database.DB_PATH = path
+    db.init_db()
+    inserts = {"expenses": db.INSERT_EXPENSE, "income": db.INSERT_INCOME,
+               "investments": db.INSERT_INVESTMENT, "losses": db.INSERT_LOSS}
+    written = dict.fromkeys(inserts, 0)
+    rng = random.Random(seed)
+    shards = database.shard_paths()
+    pending = {shard: {kind: [] for kind in inserts} for shard in shards}
+
+    def flush():
+        for shard, kinds in pending.items():
+            with database.connection(shard) as conn:
+                for kind, rows in kinds.items():
+                    conn.executemany(inserts[kind], rows)
+                    written[kind] += len(rows)
+                    rows.clear()
+
+    for n, (kind, params) in enumerate(entries(rng, users, count, days, heavy_user, heavy_share), start=1):
+        pending[database.user_db(params[0])][kind].append(params)
+        if n % CHUNK == 0:
+            flush()
+    flush()
+    for shard in shards:
+        with database.connection(shard) as conn:
+            conn.execute("ANALYZE")
+    return written
+
+
+def user_profile(path):
+    """(heaviest user id, median user id) by entry count, for picking benchmark subjects."""
+    database.DB_PATH = path
+    counts = []
+    for shard in database.shard_paths():
+        with database.connection(shard) as conn:
+            counts += conn.execute("SELECT user_id, SUM(entries) FROM daily_rollup GROUP BY user_id").fetchall()
+    counts.sort(key=lambda row: row[1], reverse=True)
+    return counts[0][0], counts[len(counts) // 2][0]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Fill a database with seeded synthetic ledger entries")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default=database.DB_PATH)
+    args = parser.parse_args(argv)
+
+    import db
+
+    database.DB_PATH = args.db
+    db.init_db()
+    for shard in database.shard_paths():
+        with database.connection(shard) as conn:
+            if any(conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() for table in db.TABLE_MAP):
+                print(f"{shard} already has ledger entries; use an empty database")
+                return 1
+    written = generate(args.db, args.users, args.entries, args.seed, args.days)
+    print(f"{args.db}: " + ", ".join(f"{n:,} {kind}" for kind, n in written.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
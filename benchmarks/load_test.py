@@ -0,0 +1,190 @@
+# benchmarks/load_test.py
+#
+# Drives main.handle_message / main.handle_callback with fake Update objects
+# and reports p50/p99 handler latency at rising concurrency.
+#
+# The flood case sends --flood taps from one user through main's
+# UserOrderedProcessor at once, as PTB would, while another user goes through
+# SESSION. The other user's slowest update that renders nothing may take at
+# most FLOOD_BOUND times as long as with no flood (exit code 1 otherwise):
+# one user's backlog must not take every concurrent-update slot and make
+# everyone else wait for it.
+# Run with: python -m benchmarks.load_test [--levels 1,8,32,128] [--rounds 3] [--flood 2048]
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from datetime import date
+
+FLOOD_BOUND = 3  # times the latency with no flood
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class FakeMessage:
+    def __init__(self, text=None):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None):
+        self.replies.append(text)
+
+    async def reply_document(self, document):
+        document.close()
+        self.replies.append(document.name)
+
+    async def reply_photo(self, photo):
+        photo.close()
+        self.replies.append(photo.name)
+
+
+class FakeCallbackQuery:
+    def __init__(self, data):
+        self.data = data
+        self.message = FakeMessage()
+
+    async def answer(self, text=None):
+        pass
+
+
+class FakeUpdate:
+    def __init__(self, user_id, text=None, callback_data=None):
+        self.effective_user = FakeUser(user_id)
+        self.message = FakeMessage(text) if text is not None else None
+        self.callback_query = FakeCallbackQuery(callback_data) if callback_data is not None else None
+
+
+class FakeContext:
+    def __init__(self):
+        self.user_data = {}
+
+
+# One user session: (kind, payload) steps, run in order like a real chat.
+SESSION = [
+    ("message", "➕ Add Expense"),
+    ("message", "12.50 groceries"),
+    ("message", "💵 Add Income"),
+    ("message", "2000 salary"),
+    ("callback", "pg_expenses"),
+    ("message", "🔍 Search Data"),
+    ("message", f"groc,{date.today().year}"),
+    ("message", "🔍 Search Data"),
+    ("message", "sal"),
+    ("callback", "editcat_expense"),
+    ("callback", "rpt_7d"),
+    ("callback", "chart_exp"),
+]
+
+
+async def run_session(main, user_id, latencies):
+    context = FakeContext()
+    for kind, payload in SESSION:
+        if kind == "message":
+            update, handler = FakeUpdate(user_id, text=payload), main.handle_message
+        else:
+            update, handler = FakeUpdate(user_id, callback_data=payload), main.handle_callback
+        start = time.perf_counter()
+        await handler(update, context)
+        latencies.setdefault(payload, []).append(time.perf_counter() - start)
+
+
+async def run_flood(main, taps, slots=None):
+    """Slowest non-render update of SESSION run alone, then while another user floods.
+
+    Returns (alone, during the flood, flood drain time), in seconds.
+    """
+    processor = main.UserOrderedProcessor(slots or main.CONCURRENT_UPDATES)
+    flooder = 1
+    for _ in range(5):
+        await main.handle_message(FakeUpdate(flooder, text="➕ Add Expense"), FakeContext())
+        await main.handle_message(FakeUpdate(flooder, text="3.20 coffee"), FakeContext())
+
+    def submit(update, handler):
+        # Application.create_task(process_update(...)) for each update it receives
+        return asyncio.ensure_future(processor.process_update(update, handler(update, FakeContext())))
+
+    async def slowest(user_id):
+        worst = 0.0
+        for kind, payload in SESSION:
+            if kind == "message":
+                update, handler = FakeUpdate(user_id, text=payload), main.handle_message
+            else:
+                update, handler = FakeUpdate(user_id, callback_data=payload), main.handle_callback
+            start = time.perf_counter()
+            await submit(update, handler)
+            if not payload.startswith(main.RENDER_PREFIXES):
+                worst = max(worst, time.perf_counter() - start)
+        return worst
+
+    alone = await slowest(2)
+    start = time.perf_counter()
+    flood = [submit(FakeUpdate(flooder, callback_data="pg_expenses"), main.handle_callback) for _ in range(taps)]
+    await asyncio.sleep(0)  # the flood is in before the other user's first update
+    during = await slowest(3)
+    await asyncio.gather(*flood)
+    return alone, during, time.perf_counter() - start
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_level(main, concurrency, rounds):
+    latencies = {}
+    start = time.perf_counter()
+    for r in range(rounds):
+        await asyncio.gather(*(run_session(main, 10_000 + r * concurrency + i, latencies)
+                               for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    every = [v for values in latencies.values() for v in values]
+    return {
+        "concurrency": concurrency,
+        "handled": len(every),
+        "updates_per_sec": len(every) / elapsed,
+        "p50_ms": statistics.median(every) * 1000,
+        "p99_ms": percentile(every, 99) * 1000,
+        "fast_p99_ms": percentile([v for k, values in latencies.items()
+                                   if not k.startswith(("rpt", "chart")) for v in values], 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Telegram handlers with fake updates")
+    parser.add_argument("--levels", default="1,8,32,128")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--flood", type=int, default=2048, help="taps from the flooding user (0: skip)")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="ceefi-load-")
+    os.environ["FINANCE_DB"] = os.path.join(tmp, "load.db")
+    os.chdir(tmp)  # reports/ and charts/ are created relative to the working directory
+
+    import main as bot
+    bot.init_db()
+
+    print(f"{'conc':>5} {'handled':>8} {'upd/s':>8} {'p50 ms':>8} {'p99 ms':>9} {'p99 (no render) ms':>19}")
+    for level in (int(v) for v in args.levels.split(",")):
+        row = asyncio.run(run_level(bot, level, args.rounds))
+        print(f"{row['concurrency']:>5} {row['handled']:>8} {row['updates_per_sec']:>8.1f} "
+              f"{row['p50_ms']:>8.1f} {row['p99_ms']:>9.1f} {row['fast_p99_ms']:>19.1f}")
+
+    if args.flood:
+        alone, during, drained = asyncio.run(run_flood(bot, args.flood))
+        print(f"\nflood of {args.flood} taps from one user drained in {drained * 1000:.0f} ms; another user's "
+              f"slowest update (no render) {during * 1000:.1f} ms, {alone * 1000:.1f} ms with no flood")
+        if during > alone * FLOOD_BOUND:
+            print(f"REGRESSION: the flood made another user's updates over {FLOOD_BOUND}x slower")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+# benchmarks/suite.py
+#
+# Benchmark cases for every db.py function, session load/save and every
+# report/chart option the bot offers, run against a fresh database from
+# datagen.py. Timing follows pytest-benchmark: one warm-up call, then rounds
+# until both --min-rounds and --min-time are reached, reported as
+# min/median/mean/stddev and ops/sec. Read cases run for the heaviest user
+# and for a median one. Reports and charts run cold (cache emptied before
+# every round) and warm (cache hit).
+#
+# Each run can be saved as JSON, together with the git commit and generator
+# parameters, and compared with an earlier run:
+#
+#   python -m benchmarks.suite --save benchmarks/results/
+#   python -m benchmarks.suite --compare benchmarks/results/<earlier>.json
+#   python -m benchmarks.suite -k search -k page       # only matching cases
+
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+from benchmarks.datagen import generate, user_profile
+
+REPORT_FLAGS = ["rpt_7d", "rpt_30d", "rpt_custom", "fmt_pdf", "fmt_xlsx", "fmt_csv", "fmt_csvgz",
+                "view_totals", "view_full", "rpt_proj"]
+CHART_FLAGS = ["chart_exp", "chart_inc", "chart_inv", "chart_ei", "chart_ii", "chart_all", "chart_proj"]
+KINDS = ["expenses", "income", "investments", "losses"]
+TOLERANCE = 1.25  # --compare fails when a median is 25% slower
+
+
+class Case:
+    def __init__(self, name, fn, setup=None):
+        self.name = name
+        self.fn = fn
+        self.setup = setup  # called before every round, untimed; returns fn's arguments
+
+
+def build_cases(users):
+    """users: {"heavy": id, "typical": id}. Returns every Case, reads before writes."""
+    import db
+    import reports
+    import sessions
+
+    cases = []
+    for profile, uid in users.items():
+        for kind in KINDS:
+            recent = getattr(db, f"get_recent_{kind}")
+            cases.append(Case(f"{recent.__name__}[{profile}]", lambda f=recent, u=uid: f(u)))
+            cursor = _mid_cursor(kind, uid)
+            cases.append(Case(f"get_paginated_entries[{kind}, first, {profile}]",
+                              lambda k=kind, u=uid: db.get_paginated_entries(u, k)))
+            cases.append(Case(f"get_paginated_entries[{kind}, next, {profile}]",
+                              lambda k=kind, u=uid, c=cursor: db.get_paginated_entries(u, k, c, "next")))
+            cases.append(Case(f"get_paginated_entries[{kind}, prev, {profile}]",
+                              lambda k=kind, u=uid, c=cursor: db.get_paginated_entries(u, k, c, "prev")))
+        year = str(datetime.now().year)
+        cases.append(Case(f"search_entries[prefix, {profile}]", lambda u=uid: db.search_entries(u, "fo")))
+        cases.append(Case(f"search_entries[prefix+year, {profile}]", lambda u=uid: db.search_entries(u, "s", year)))
+        cases.append(Case(f"search_entries[page 3, {profile}]", lambda u=uid: db.search_entries(u, "s", "", 20, 40)))
+        cases.append(Case(f"get_data_version[{profile}]", lambda u=uid: db.get_data_version(u)))
+        cases.append(Case(f"sessions.load[{profile}]", lambda u=uid: sessions.load(u)))
+
+    entry = db.get_recent_expenses(users["heavy"])[0]
+    token = db.encode_cursor(entry)
+    cases += [
+        Case("init_db[up to date]", db.init_db),
+        Case("encode_cursor", lambda: db.encode_cursor(entry)),
+        Case("decode_cursor", lambda: db.decode_cursor(token)),
+        Case("expense_row", lambda: db.expense_row(1, "12.50", "food")),
+        Case("income_row", lambda: db.income_row(1, "2500", "salary")),
+        Case("investment_row", lambda: db.investment_row(1, "500", "stock", "7.5%", "yearly")),
+        Case("loss_row", lambda: db.loss_row(1, "5", "fees")),
+    ]
+
+    for profile, uid in users.items():
+        for flag in REPORT_FLAGS:
+            cases.append(Case(f"generate_report[{flag}, cold, {profile}]",
+                              lambda f=flag, u=uid: reports.generate_report(u, f), _clear_render_cache))
+        for flag in CHART_FLAGS:
+            cases.append(Case(f"generate_chart[{flag}, cold, {profile}]",
+                              lambda f=flag, u=uid: reports.generate_chart(u, f), _clear_render_cache))
+    heavy = users["heavy"]
+    for flag in REPORT_FLAGS:
+        cases.append(Case(f"generate_report[{flag}, cached]", lambda f=flag: reports.generate_report(heavy, f)))
+    for flag in CHART_FLAGS:
+        cases.append(Case(f"generate_chart[{flag}, cached]", lambda f=flag: reports.generate_chart(heavy, f)))
+
+    # Writes go to a user of their own so they don't change what the reads see.
+    writer = max(users.values()) + 1_000_000
+    db.save_expense(writer, "1", "seed")
+    db.save_income(writer, "1", "seed")
+    db.save_investment(writer, "1", "seed", "5", "yearly")
+    db.save_loss(writer, "1", "seed")
+    ids = {kind: db.get_paginated_entries(writer, kind)[0][0]["id"] for kind in KINDS}
+    cases += [
+        Case("save_expense", lambda: db.save_expense(writer, "12.50", "food")),
+        Case("save_income", lambda: db.save_income(writer, "2500", "salary")),
+        Case("save_investment", lambda: db.save_investment(writer, "500", "stock", "7.5%", "yearly")),
+        Case("save_loss", lambda: db.save_loss(writer, "5", "fees")),
+        Case("update_expense", lambda: db.update_expense(writer, ids["expenses"], "13", "food")),
+        Case("update_income", lambda: db.update_income(writer, ids["income"], "2600", "salary")),
+        Case("update_investment", lambda: db.update_investment(writer, ids["investments"], "600", "bond")),
+        Case("update_loss", lambda: db.update_loss(writer, ids["losses"], "6", "fees")),
+        Case("delete_entry", lambda entry_id: db.delete_entry(writer, "expenses", entry_id),
+             lambda: (_new_expense(writer),)),
+        Case("sessions.save", lambda: sessions.save(writer, sessions.Session("edit_expense", 3))),
+    ]
+    return cases
+
+
+def _mid_cursor(kind, user_id):
+    """(ts, id) of the user's middle entry, so next/prev pages seek into the index."""
+    import database
+
+    with database.connection(database.user_db(user_id)) as conn:
+        count = conn.execute(f"SELECT COUNT(*) FROM {kind} WHERE user_id = ?", (user_id,)).fetchone()[0]
+        row = conn.execute(f"SELECT ts, id FROM {kind} WHERE user_id = ? ORDER BY ts DESC, id DESC LIMIT 1 OFFSET ?",
+                           (user_id, count // 2)).fetchone()
+    return tuple(row) if row else (0, 0)
+
+
+def _new_expense(user_id):
+    import db
+    import database
+
+    with database.connection(database.user_db(user_id)) as conn:
+        return conn.execute(*db.expense_row(user_id, "1", "to delete")).lastrowid
+
+
+def _clear_render_cache():
+    import reports
+
+    for directory in (reports.REPORT_DIR, reports.CHART_DIR):
+        for entry in os.scandir(directory):
+            os.remove(entry.path)
+    return ()
+
+
+# --- TIMING ---
+def run_case(case, min_time, min_rounds, max_rounds):
+    case.fn(*(case.setup() if case.setup else ()))  # warm-up
+    times = []
+    while len(times) < max_rounds and (len(times) < min_rounds or sum(times) < min_time):
+        args = case.setup() if case.setup else ()
+        start = time.perf_counter()
+        case.fn(*args)
+        times.append(time.perf_counter() - start)
+    mean = statistics.fmean(times)
+    return {
+        "min": min(times),
+        "max": max(times),
+        "mean": mean,
+        "stddev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "median": statistics.median(times),
+        "rounds": len(times),
+        "ops": 1 / mean if mean else 0.0,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit or "unknown",
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(old, new, tolerance=TOLERANCE):
+    """Print median ratios for cases in both runs; return the names that regressed."""
+    if old["params"] != new["params"]:
+        print(f"note: data parameters differ ({old['params']} vs {new['params']})")
+    regressed = []
+    print(f"\n{'case':60} {'before':>10} {'after':>10} {'ratio':>7}")
+    for name, result in new["results"].items():
+        before = old["results"].get(name)
+        if before is None:
+            continue
+        ratio = result["median"] / before["median"] if before["median"] else float("inf")
+        flag = ""
+        if ratio > tolerance:
+            regressed.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:60} {before['median'] * 1000:9.3f}ms {result['median'] * 1000:9.3f}ms {ratio:6.2f}x{flag}")
+    return regressed
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite on seeded synthetic data")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds per case (default 0.5)")
+    parser.add_argument("--min-rounds", type=int, default=5)
+    parser.add_argument("--max-rounds", type=int, default=10_000)
+    parser.add_argument("-k", action="append", default=[], help="only run cases whose name contains this")
+    parser.add_argument("--save", help="write results to this JSON file, or into this directory")
+    parser.add_argument("--compare", help="earlier JSON results; exits 1 on a regression")
+    args = parser.parse_args(argv)
+
+    root = os.getcwd()
+    tmp = tempfile.mkdtemp(prefix="ceefinance-bench-")
+    os.chdir(tmp)  # reports.py writes into ./reports and ./charts
+    try:
+        import database
+        import render
+
+        path = os.path.join(tmp, "bench.db")
+        start = time.perf_counter()
+        written = generate(path, args.users, args.entries, args.seed, args.days)
+        heavy, typical = user_profile(path)
+        print(f"seeded {sum(written.values()):,} entries for {args.users} users in "
+              f"{time.perf_counter() - start:.1f}s (heavy user {heavy}, typical user {typical})")
+
+        render.warm_up()
+        cases = [c for c in build_cases({"heavy": heavy, "typical": typical})
+                 if not args.k or any(k in c.name for k in args.k)]
+        results = {}
+        print(f"{'case':60} {'median':>10} {'mean':>10} {'stddev':>10} {'ops/s':>10} {'rounds':>7}")
+        for case in cases:
+            r = results[case.name] = run_case(case, args.min_time, args.min_rounds, args.max_rounds)
+            print(f"{case.name:60} {r['median'] * 1000:8.3f}ms {r['mean'] * 1000:8.3f}ms "
+                  f"{r['stddev'] * 1000:8.3f}ms {r['ops']:10,.0f} {r['rounds']:7}")
+        render.shutdown()
+        database.close_all()
+    finally:
+        os.chdir(root)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    run = {
+        "environment": environment(),
+        "params": {"users": args.users, "entries": args.entries, "days": args.days, "seed": args.seed,
+                   "shards": database.SHARDS},
+        "results": results,
+    }
+    if args.save:
+        target = args.save
+        if os.path.isdir(target) or target.endswith(os.sep):
+            os.makedirs(target, exist_ok=True)
+            env = run["environment"]
+            target = os.path.join(target, f"{env['timestamp'].replace(':', '')}-{env['commit']}.json")
+        with open(target, "w") as fh:
+            json.dump(run, fh, indent=2)
+        print(f"saved {target}")
+    if args.compare:
+        with open(args.compare) as fh:
+            regressed = compare(json.load(fh), run)
+        if regressed:
+            print(f"{len(regressed)} case(s) regressed by more than {TOLERANCE:.2f}x")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
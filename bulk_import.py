@@ -0,0 +1,266 @@
+# bulk_import.py
+#
+# Bulk ingestion of CSV / XLSX files into the ledgers. Files are read as a
+# stream and inserted in chunks: each chunk is validated, then written with
+# executemany inside one transaction. A chunk with a bad row is rolled back
+# as a whole and reported; the rest of the file carries on (or stops, with
+# strict=True). Memory use depends on the chunk size, not the file size.
+#
+# Two layouts are understood, by header name (case-insensitive):
+#   ledger:    kind, amount, label, [date], [roi], [interval]
+#   statement: date, description, amount  - negative amounts become expenses,
+#              positive ones income (a bank statement export)
+# The label column may also be called category, source, type, reason,
+# description or memo.
+#
+# CLI: python bulk_import.py FILE --user USER_ID [--kind expenses] [--strict]
+
+import os
+import sys
+import csv
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+
+import db
+from database import connection, user_db
+from units import to_cents, to_ts, now_ts
+
+CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+
+KIND_ALIASES = {
+    "expense": "expenses", "expenses": "expenses",
+    "income": "income", "incomes": "income",
+    "investment": "investments", "investments": "investments",
+    "loss": "losses", "losses": "losses",
+}
+LABEL_COLUMNS = ("label", "category", "source", "type", "reason", "description", "memo")
+DATE_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d", "%d/%m/%Y")
+INSERTS = {
+    "expenses": db.INSERT_EXPENSE,
+    "income": db.INSERT_INCOME,
+    "investments": db.INSERT_INVESTMENT,
+    "losses": db.INSERT_LOSS,
+}
+
+
+class RowError(ValueError):
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}" if line else message)  # 0: the file as a whole
+        self.line = line
+
+
+# --- READERS ---
+def _decode(lines):
+    # UTF-8 (with or without BOM) as written by most tools; a line that isn't
+    # is taken as Windows-1252, which is what Excel saves "CSV" as.
+    for n, raw in enumerate(lines):
+        try:
+            line = raw.decode("utf-8-sig" if n == 0 else "utf-8")
+        except UnicodeDecodeError:
+            line = raw.decode("cp1252", errors="replace")
+        yield line
+
+
+def read_csv(path):
+    with open(path, "rb") as fh:
+        try:
+            yield from csv.reader(_decode(fh))
+        except csv.Error as exc:
+            raise RowError(0, f"not a readable CSV file: {exc}") from None
+
+
+def read_xlsx(path):
+    from openpyxl import load_workbook
+
+    try:
+        wb = load_workbook(path, read_only=True, data_only=True)
+    except Exception as exc:  # zipfile, XML and openpyxl errors all mean the same here
+        raise RowError(0, f"not a readable .xlsx file ({type(exc).__name__})") from None
+    try:
+        for row in wb.active.iter_rows(values_only=True):
+            yield ["" if v is None else v for v in row]
+    except Exception as exc:
+        raise RowError(0, f"the .xlsx file is damaged ({type(exc).__name__})") from None
+    finally:
+        wb.close()
+
+
+def read_rows(path):
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        return read_xlsx(path)
+    return read_csv(path)
+
+
+# --- VALIDATION ---
+def parse_amount(value):
+    """Amount cell -> integer cents."""
+    if isinstance(value, (int, float)):
+        return to_cents(value)
+    text = str(value).strip().replace(",", "")
+    for symbol in ("$", "€", "£", "₦"):
+        text = text.replace(symbol, "")
+    if text.startswith("(") and text.endswith(")"):  # accounting negative
+        text = "-" + text[1:-1]
+    return to_cents(text)
+
+
+def parse_date(value):
+    """Date cell -> wall-clock epoch seconds; an empty cell means now."""
+    if isinstance(value, datetime):
+        return to_ts(value)
+    text = str(value).strip()
+    if not text:
+        return now_ts()
+    for candidate in DATE_FORMATS:
+        try:
+            return to_ts(datetime.strptime(text, candidate))
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognised date {text!r}")
+
+
+def column_map(header):
+    names = [str(h).strip().lower() for h in header]
+    mapping = {name: i for i, name in enumerate(names)}
+    if "amount" not in mapping:
+        raise RowError(1, "header must have an amount column")
+    label = next((mapping[c] for c in LABEL_COLUMNS if c in mapping), None)
+    if label is None:
+        raise RowError(1, f"header needs one of: {', '.join(LABEL_COLUMNS)}")
+    return {
+        "kind": mapping.get("kind"),
+        "amount": mapping["amount"],
+        "label": label,
+        "date": next((mapping[c] for c in ("date", "start_date", "posted", "transaction date") if c in mapping), None),
+        "roi": mapping.get("roi"),
+        "interval": mapping.get("interval"),
+    }
+
+
+def validate(row, cols, line, user_id, default_kind):
+    """Turn one file row into (kind, params for the kind's INSERT)."""
+    def cell(name):
+        i = cols[name]
+        return row[i] if i is not None and i < len(row) else ""
+
+    try:
+        amount = parse_amount(cell("amount"))
+        if cols["kind"] is not None and str(cell("kind")).strip():
+            kind = KIND_ALIASES.get(str(cell("kind")).strip().lower())
+            if kind is None:
+                raise ValueError(f"unknown kind {cell('kind')!r}")
+        elif default_kind:
+            kind = default_kind
+        else:
+            kind = "expenses" if amount < 0 else "income"
+            amount = abs(amount)
+        if amount < 0:
+            raise ValueError("amount must not be negative")
+        label = str(cell("label")).strip()
+        if not label:
+            raise ValueError("label is empty")
+        if kind == "investments":
+            roi = float(str(cell("roi") or 0).strip().rstrip("%"))
+            interval = str(cell("interval")).strip() or "yearly"
+            return kind, (user_id, amount, label, roi, interval, parse_date(cell("date")))
+        return kind, (user_id, amount, label, parse_date(cell("date")))
+    except (ValueError, TypeError, ArithmeticError) as exc:
+        raise RowError(line, str(exc)) from None
+
+
+# --- IMPORT ---
+def chunks(rows, size):
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def insert_chunk(conn, chunk, cols, user_id, default_kind):
+    by_kind = {kind: [] for kind in INSERTS}
+    for line, row in chunk:
+        kind, params = validate(row, cols, line, user_id, default_kind)
+        by_kind[kind].append(params)
+    for kind, params in by_kind.items():
+        if params:
+            conn.executemany(INSERTS[kind], params)
+
+
+def import_file(path, user_id, default_kind=None, chunk_size=CHUNK_SIZE, strict=False):
+    """Import a CSV/XLSX file for user_id. Returns a summary dict."""
+    if default_kind is not None:
+        default_kind = KIND_ALIASES[default_kind.lower()]
+    start = time.perf_counter()
+    summary = {"imported": 0, "rejected": 0, "failed_chunks": 0, "errors": []}
+
+    rows = iter(read_rows(path))
+    header = next(rows, None)
+    if header is None:
+        raise RowError(1, "file is empty")
+    cols = column_map(header)
+    numbered = ((line, row) for line, row in enumerate(rows, start=2) if any(str(v).strip() for v in row))
+
+    batches = chunks(numbered, chunk_size)
+    while True:
+        try:
+            chunk = next(batches, None)
+        except RowError as exc:  # the reader gave up; rows before this chunk are kept
+            summary["failed_chunks"] += 1
+            summary["errors"].append(f"stopped reading: {exc}")
+            break
+        if chunk is None:
+            break
+        try:
+            with connection(user_db(user_id)) as conn:
+                insert_chunk(conn, chunk, cols, user_id, default_kind)
+            summary["imported"] += len(chunk)
+        except (RowError, sqlite3.Error) as exc:
+            # connection() rolled the whole chunk back.
+            summary["rejected"] += len(chunk)
+            summary["failed_chunks"] += 1
+            summary["errors"].append(f"rows {chunk[0][0]}-{chunk[-1][0]} rolled back: {exc}")
+            if strict:
+                break
+
+    elapsed = time.perf_counter() - start
+    summary["seconds"] = elapsed
+    summary["rows_per_sec"] = summary["imported"] / elapsed if elapsed else 0.0
+    return summary
+
+
+def format_summary(summary):
+    lines = [f"Imported {summary['imported']:,} rows ({summary['rows_per_sec']:,.0f} rows/sec)."]
+    if summary["rejected"]:
+        lines.append(f"Rejected {summary['rejected']:,} rows in {summary['failed_chunks']} chunk(s):")
+    lines.extend(summary["errors"][:10])
+    return "\n".join(lines)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Bulk-import a CSV/XLSX file into the ledgers")
+    parser.add_argument("path")
+    parser.add_argument("--user", type=int, required=True, help="Telegram user id that owns the rows")
+    parser.add_argument("--kind", choices=sorted(set(KIND_ALIASES.values())),
+                        help="ledger for files without a kind column (default: sign of the amount)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--strict", action="store_true", help="stop at the first bad chunk")
+    args = parser.parse_args(argv)
+
+    db.init_db()
+    try:
+        summary = import_file(args.path, args.user, args.kind, args.chunk_size, args.strict)
+    except RowError as exc:
+        print(f"error: {exc}")
+        return 2
+    print(format_summary(summary))
+    return 1 if summary["failed_chunks"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
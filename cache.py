@@ -0,0 +1,100 @@
+# cache.py
+#
+# Content-addressed cache for rendered reports and charts. File names carry a
+# hash of (user_id, kind, flags, data version, ...), so a write by the user
+# bumps the version and the next request simply misses; stale files are never
+# served and age out through LRU eviction.
+
+import os
+import time
+import hashlib
+import threading
+
+import metrics
+
+MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+MAX_AGE = int(os.getenv("RENDER_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+EVICT_INTERVAL = 60
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+_last_evict = {}
+
+
+def cache_key(*parts):
+    return hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()[:16]
+
+
+def _count(name, n=1):
+    with _lock:
+        _stats[name] += n
+
+
+def lookup(path):
+    """Return True and refresh the file's LRU position if path is cached."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        _count("misses")
+        return False
+    _count("hits")
+    return True
+
+
+def staging_path(path):
+    """Where to render before store(); keeps half-written files out of lookup()."""
+    root, ext = os.path.splitext(path)
+    # Unique per process and thread: precompute.py may fill the cache from another process.
+    return f"{root}.{os.getpid()}.{threading.get_ident()}.partial{ext}"
+
+
+def store(staged, path):
+    os.replace(staged, path)
+    _count("stores")
+    directory = os.path.dirname(path) or "."
+    now = time.monotonic()
+    with _lock:
+        due = now - _last_evict.get(directory, 0) >= EVICT_INTERVAL
+        if due:
+            _last_evict[directory] = now
+    if due:
+        evict(directory)
+    return path
+
+
+def evict(directory, max_bytes=MAX_BYTES, max_age=MAX_AGE):
+    """Drop files older than max_age, then least recently used ones until under max_bytes."""
+    now = time.time()
+    files = []
+    for entry in os.scandir(directory):
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+
+    removed = 0
+    total = sum(size for _, size, _ in files)
+    for mtime, size, path in files:
+        if now - mtime <= max_age and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        total -= size
+        removed += 1
+    _count("evictions", removed)
+    return removed
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+    lookups = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_ratio"] = snapshot["hits"] / lookups if lookups else 0.0
+    return snapshot
+
+
+metrics.Collected("ceefinance_render_cache_total", "Render cache lookups, stores and evictions", "counter",
+                  lambda: {(name,): value for name, value in stats().items() if name != "hit_ratio"}, ["event"])
@@ -0,0 +1,159 @@
+# database.py
+
+import os
+import queue
+import atexit
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_PATH = os.getenv("FINANCE_DB", "finance.db")
+SHARDS = int(os.getenv("DB_SHARDS", "1"))
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+# --- CONNECTION POOL ---
+class ConnectionPool:
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _reset_after_fork(self):
+        # Connections must never cross a fork; children start with an empty pool.
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._pid = os.getpid()
+
+    def acquire(self):
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = self._connect()
+                self._all.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No free database connection for {self.path} after {self.timeout}s")
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+            self._idle = queue.LifoQueue()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=None):
+    path = path or DB_PATH
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path))
+    return pool
+
+
+@contextmanager
+def connection(path=None):
+    """Borrow a pooled connection; commits on success and rolls back on error."""
+    pool = get_pool(path)
+    conn = pool.acquire()
+    try:
+        yield conn
+        if conn.in_transaction:
+            conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+
+# --- SHARDS ---
+# Users are spread over SHARDS database files, each with the full schema and
+# its own write lock. Shard 0 is DB_PATH itself, so a single shard is the
+# one-file layout; shard i is "<name>.shard<i>.db" next to it. A user's shard
+# is a jump consistent hash of the user id: going from N to N+1 shards moves
+# only ~1/(N+1) of the users, and `python shards.py rebalance` moves their rows.
+def shard_path(index, base=None):
+    base = base or DB_PATH
+    if index == 0:
+        return base
+    root, ext = os.path.splitext(base)
+    return f"{root}.shard{index}{ext or '.db'}"
+
+
+def shard_paths(count=None, base=None):
+    return [shard_path(i, base) for i in range(count or SHARDS)]
+
+
+def shard_index(user_id, count=None):
+    count = count or SHARDS
+    if count == 1:
+        return 0
+    # splitmix64 finalizer spreads sequential ids before the jump hash.
+    key = (int(user_id) + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    key = ((key ^ (key >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    key = ((key ^ (key >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    key ^= key >> 31
+    # Jump consistent hash (Lamping & Veach, 2014).
+    bucket, jump = -1, 0
+    while jump < count:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def user_db(user_id):
+    """Path of the shard that holds user_id's rows."""
+    return shard_path(shard_index(user_id))
+
+
+def close_all():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+atexit.register(close_all)
@@ -1,192 +1,248 @@
 # db.py
 
-import sqlite3
-from datetime import datetime
+from database import connection, shard_paths, user_db
+from migrations import migrate
+from units import to_cents, now_ts, period, MAX_TS
+
+TABLE_MAP = {
+    "expenses": "expenses",
+    "income": "income",
+    "investments": "investments",
+    "losses": "losses"
+}
+
+# Statements are kept as module constants so every call reuses the same text
+# and hits the per-connection prepared statement cache. Amounts are integer
+# cents and times wall-clock epoch seconds (units.py). Every function takes
+# the user_id and runs on that user's shard (database.user_db); entry ids are
+# only unique within a shard, so updates and deletes match on both.
+INSERT_EXPENSE = "INSERT INTO expenses (user_id, amount_cents, category, ts) VALUES (?, ?, ?, ?)"
+INSERT_INCOME = "INSERT INTO income (user_id, amount_cents, source, ts) VALUES (?, ?, ?, ?)"
+INSERT_INVESTMENT = "INSERT INTO investments (user_id, amount_cents, type, roi, interval, ts) VALUES (?, ?, ?, ?, ?, ?)"
+INSERT_LOSS = "INSERT INTO losses (user_id, amount_cents, reason, ts) VALUES (?, ?, ?, ?)"
+
+RECENT_EXPENSES = "SELECT * FROM expenses WHERE user_id = ? ORDER BY ts DESC LIMIT ?"
+RECENT_INCOME = "SELECT * FROM income WHERE user_id = ? ORDER BY ts DESC LIMIT ?"
+RECENT_INVESTMENTS = "SELECT * FROM investments WHERE user_id = ? ORDER BY ts DESC LIMIT ?"
+RECENT_LOSSES = "SELECT * FROM losses WHERE user_id = ? ORDER BY ts DESC LIMIT ?"
+
+DATA_VERSION = "SELECT version FROM data_versions WHERE user_id = ?"
+
+UPDATE_EXPENSE = """
+    UPDATE expenses
+    SET amount_cents = ?, category = ?, ts = ?
+    WHERE id = ? AND user_id = ?
+"""
+UPDATE_INCOME = """
+    UPDATE income
+    SET amount_cents = ?, source = ?, ts = ?
+    WHERE id = ? AND user_id = ?
+"""
+UPDATE_INVESTMENT = """
+    UPDATE investments
+    SET amount_cents = ?, type = ?, ts = ?
+    WHERE id = ? AND user_id = ?
+"""
+UPDATE_LOSS = """
+    UPDATE losses
+    SET amount_cents = ?, reason = ?, ts = ?
+    WHERE id = ? AND user_id = ?
+"""
+
+# Keyset pagination on (ts, id): each page seeks straight to the cursor in
+# the (user_id, ts) index, so deep pages cost the same as the first one.
+FIRST_PAGE = """
+    SELECT * FROM {table}
+    WHERE user_id = ?
+    ORDER BY ts DESC, id DESC
+    LIMIT ?
+"""
+PAGE_AFTER = """
+    SELECT * FROM {table}
+    WHERE user_id = ? AND (ts, id) < (?, ?)
+    ORDER BY ts DESC, id DESC
+    LIMIT ?
+"""
+PAGE_BEFORE = """
+    SELECT * FROM {table}
+    WHERE user_id = ? AND (ts, id) > (?, ?)
+    ORDER BY ts ASC, id ASC
+    LIMIT ?
+"""
+DELETE_ENTRY = "DELETE FROM {table} WHERE id = ? AND user_id = ?"
+# One ranked query over the FTS5 index of all four ledgers (migration 7),
+# newest first, best match first within the same time.
+SEARCH_ENTRIES = """
+    SELECT kind, entry_id AS id, amount_cents, label, ts
+    FROM ledger_search
+    WHERE ledger_search MATCH ? AND ts >= ? AND ts < ?
+    ORDER BY ts DESC, bm25(ledger_search, 1.0, 0.0), entry_id DESC
+    LIMIT ? OFFSET ?
+"""
+
+
+def _fetch_dicts(user_id, sql, params):
+    with connection(user_db(user_id)) as conn:
+        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
 
 # --- INIT DB ---
 def init_db():
-    conn = sqlite3.connect("finance.db")
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS expenses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            amount REAL,
-            category TEXT,
-            date TEXT
-        )""")
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS income (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            amount REAL,
-            source TEXT,
-            date TEXT
-        )""")
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS investments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            amount REAL,
-            type TEXT,
-            roi REAL,
-            interval TEXT,
-            start_date TEXT
-        )""")
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS losses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            amount REAL,
-            reason TEXT,
-            date TEXT
-        )""")
-    conn.commit()
-    conn.close()
+    for path in shard_paths():
+        with connection(path) as conn:
+            migrate(conn)
+
+# --- INSERT ROWS ---
+# Each returns (sql, params) for one insert, validating the amount/ROI, so the
+# same row can be written directly or through the batching write_queue.
+def expense_row(user_id, amount, category):
+    return INSERT_EXPENSE, (user_id, to_cents(amount), category, now_ts())
+
+def income_row(user_id, amount, source):
+    return INSERT_INCOME, (user_id, to_cents(amount), source, now_ts())
+
+def investment_row(user_id, amount, inv_type, roi, interval):
+    return INSERT_INVESTMENT, (user_id, to_cents(amount), inv_type, float(str(roi).strip('%')), interval, now_ts())
+
+def loss_row(user_id, amount, reason):
+    return INSERT_LOSS, (user_id, to_cents(amount), reason, now_ts())
 
 # --- SAVE FUNCTIONS ---
 def save_expense(user_id, amount, category):
-    with sqlite3.connect("finance.db") as conn:
-        conn.execute("INSERT INTO expenses (user_id, amount, category, date) VALUES (?, ?, ?, ?)",
-                     (user_id, float(amount), category, datetime.now().strftime("%Y-%m-%d %H:%M")))
+    with connection(user_db(user_id)) as conn:
+        conn.execute(*expense_row(user_id, amount, category))
 
 def save_income(user_id, amount, source):
-    with sqlite3.connect("finance.db") as conn:
-        conn.execute("INSERT INTO income (user_id, amount, source, date) VALUES (?, ?, ?, ?)",
-                     (user_id, float(amount), source, datetime.now().strftime("%Y-%m-%d %H:%M")))
+    with connection(user_db(user_id)) as conn:
+        conn.execute(*income_row(user_id, amount, source))
 
 def save_investment(user_id, amount, inv_type, roi, interval):
-    with sqlite3.connect("finance.db") as conn:
-        conn.execute("INSERT INTO investments (user_id, amount, type, roi, interval, start_date) VALUES (?, ?, ?, ?, ?, ?)",
-                     (user_id, float(amount), inv_type, float(roi.strip('%')), interval, datetime.now().strftime("%Y-%m-%d")))
+    with connection(user_db(user_id)) as conn:
+        conn.execute(*investment_row(user_id, amount, inv_type, roi, interval))
 
 def save_loss(user_id, amount, reason):
-    with sqlite3.connect("finance.db") as conn:
-        conn.execute("INSERT INTO losses (user_id, amount, reason, date) VALUES (?, ?, ?, ?)",
-                     (user_id, float(amount), reason, datetime.now().strftime("%Y-%m-%d %H:%M")))
+    with connection(user_db(user_id)) as conn:
+        conn.execute(*loss_row(user_id, amount, reason))
 
 # --- GET RECENT FUNCTIONS ---
 def get_recent_expenses(user_id, limit=5):
-    with sqlite3.connect("finance.db") as conn:
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM expenses WHERE user_id = ? ORDER BY date DESC LIMIT ?", (user_id, limit))
-        return [dict(row) for row in cur.fetchall()]
+    return _fetch_dicts(user_id, RECENT_EXPENSES, (user_id, limit))
 
 def get_recent_income(user_id, limit=5):
-    with sqlite3.connect("finance.db") as conn:
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM income WHERE user_id = ? ORDER BY date DESC LIMIT ?", (user_id, limit))
-        return [dict(row) for row in cur.fetchall()]
+    return _fetch_dicts(user_id, RECENT_INCOME, (user_id, limit))
 
 def get_recent_investments(user_id, limit=5):
-    with sqlite3.connect("finance.db") as conn:
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM investments WHERE user_id = ? ORDER BY start_date DESC LIMIT ?", (user_id, limit))
-        return [dict(row) for row in cur.fetchall()]
+    return _fetch_dicts(user_id, RECENT_INVESTMENTS, (user_id, limit))
 
 def get_recent_losses(user_id, limit=5):
-    with sqlite3.connect("finance.db") as conn:
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM losses WHERE user_id = ? ORDER BY date DESC LIMIT ?", (user_id, limit))
-        return [dict(row) for row in cur.fetchall()]
+    return _fetch_dicts(user_id, RECENT_LOSSES, (user_id, limit))
 
 # --- UPDATE FUNCTIONS ---
-def update_expense(expense_id, new_amount, new_category):
-    with sqlite3.connect("finance.db") as conn:
-        conn.execute("""
-            UPDATE expenses
-            SET amount = ?, category = ?, date = ?
-            WHERE id = ?
-        """, (float(new_amount), new_category, datetime.now().strftime("%Y-%m-%d %H:%M"), expense_id))
-
-def update_income(income_id, new_amount, new_source):
-    with sqlite3.connect("finance.db") as conn:
-        conn.execute("""
-            UPDATE income
-            SET amount = ?, source = ?, date = ?
-            WHERE id = ?
-        """, (float(new_amount), new_source, datetime.now().strftime("%Y-%m-%d %H:%M"), income_id))
-
-def update_investment(investment_id, new_amount, new_type):
-    with sqlite3.connect("finance.db") as conn:
-        conn.execute("""
-            UPDATE investments
-            SET amount = ?, type = ?, start_date = ?
-            WHERE id = ?
-        """, (float(new_amount), new_type, datetime.now().strftime("%Y-%m-%d"), investment_id))
-
-def update_loss(loss_id, new_amount, new_reason):
-    with sqlite3.connect("finance.db") as conn:
-        conn.execute("""
-            UPDATE losses
-            SET amount = ?, reason = ?, date = ?
-            WHERE id = ?
-        """, (float(new_amount), new_reason, datetime.now().strftime("%Y-%m-%d %H:%M"), loss_id))
+# Updates and deletes return the number of rows changed: 0 when the entry is
+# gone (or isn't the user's).
+def update_expense(user_id, expense_id, new_amount, new_category):
+    with connection(user_db(user_id)) as conn:
+        cur = conn.execute(UPDATE_EXPENSE, (to_cents(new_amount), new_category, now_ts(), expense_id, user_id))
+        return cur.rowcount
+
+def update_income(user_id, income_id, new_amount, new_source):
+    with connection(user_db(user_id)) as conn:
+        cur = conn.execute(UPDATE_INCOME, (to_cents(new_amount), new_source, now_ts(), income_id, user_id))
+        return cur.rowcount
+
+def update_investment(user_id, investment_id, new_amount, new_type):
+    with connection(user_db(user_id)) as conn:
+        cur = conn.execute(UPDATE_INVESTMENT, (to_cents(new_amount), new_type, now_ts(), investment_id, user_id))
+        return cur.rowcount
+
+def update_loss(user_id, loss_id, new_amount, new_reason):
+    with connection(user_db(user_id)) as conn:
+        cur = conn.execute(UPDATE_LOSS, (to_cents(new_amount), new_reason, now_ts(), loss_id, user_id))
+        return cur.rowcount
 
 # --- PAGINATION SUPPORT ---
-def get_paginated_entries(user_id, kind, page, limit=5):
-    offset = page * limit
-    table_map = {
-        "expenses": "expenses",
-        "income": "income",
-        "investments": "investments",
-        "losses": "losses"
-    }
-    if kind not in table_map:
-        return []
-
-    table = table_map[kind]
-    with sqlite3.connect("finance.db") as conn:
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute(f"""
-            SELECT * FROM {table}
-            WHERE user_id = ?
-            ORDER BY date DESC
-            LIMIT ? OFFSET ?
-        """, (user_id, limit, offset))
-        return [dict(row) for row in cur.fetchall()]
+def _base36(number):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while True:
+        number, rem = divmod(number, 36)
+        out = digits[rem] + out
+        if not number:
+            return out
+
+def encode_cursor(entry):
+    """Pack an entry's (ts, id) into a short token that fits in callback_data."""
+    return f"{_base36(entry['ts'])}.{_base36(entry['id'])}"
+
+def decode_cursor(token):
+    ts, entry_id = token.split(".")
+    return int(ts, 36), int(entry_id, 36)
+
+def get_paginated_entries(user_id, kind, cursor=None, direction="next", limit=5):
+    """Return (entries, has_prev, has_next) for the page after/before cursor, newest first.
+
+    cursor is a (ts, id) pair from decode_cursor, or None for the newest page.
+    """
+    if kind not in TABLE_MAP:
+        return [], False, False
+
+    fmt = {"table": TABLE_MAP[kind]}
+    if cursor is None:
+        rows = _fetch_dicts(user_id, FIRST_PAGE.format(**fmt), (user_id, limit + 1))
+        return rows[:limit], False, len(rows) > limit
+    if direction == "prev":
+        rows = _fetch_dicts(user_id, PAGE_BEFORE.format(**fmt), (user_id, *cursor, limit + 1))
+        return rows[:limit][::-1], len(rows) > limit, True
+    rows = _fetch_dicts(user_id, PAGE_AFTER.format(**fmt), (user_id, *cursor, limit + 1))
+    return rows[:limit], True, len(rows) > limit
 
 # --- DELETION SUPPORT ---
-def delete_entry(kind, entry_id):
-    table_map = {
-        "expenses": "expenses",
-        "income": "income",
-        "investments": "investments",
-        "losses": "losses"
-    }
-    if kind not in table_map:
-        return
-
-    with sqlite3.connect("finance.db") as conn:
-        conn.execute(f"DELETE FROM {table_map[kind]} WHERE id = ?", (entry_id,))
+def delete_entry(user_id, kind, entry_id):
+    if kind not in TABLE_MAP:
+        return 0
+
+    with connection(user_db(user_id)) as conn:
+        return conn.execute(DELETE_ENTRY.format(table=TABLE_MAP[kind]), (entry_id, user_id)).rowcount
+
+# --- DATA VERSION ---
+def get_data_version(user_id):
+    """Counter bumped by triggers on every insert, update or delete of the user's entries."""
+    with connection(user_db(user_id)) as conn:
+        row = conn.execute(DATA_VERSION, (user_id,)).fetchone()
+        return row[0] if row else 0
 
 # --- SEARCH FUNCTIONALITY ---
-def search_entries(user_id, category, date_prefix):
-    tables = {
-        "expenses": "category",
-        "income": "source",
-        "investments": "type",
-        "losses": "reason"
-    }
-    results = []
-
-    with sqlite3.connect("finance.db") as conn:
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        for table, field in tables.items():
-            date_field = "start_date" if table == "investments" else "date"
-            cur.execute(f"""
-                SELECT * FROM {table}
-                WHERE user_id = ?
-                AND {field} LIKE ?
-                AND {date_field} LIKE ?
-                ORDER BY {date_field} DESC
-            """, (user_id, f"%{category}%", f"{date_prefix}%"))
-            results.extend([dict(row) for row in cur.fetchall()])
-
-    return sorted(results, key=lambda x: x.get("date", x.get("start_date", "")), reverse=True)
+def _match_query(user_id, terms):
+    # Every term is quoted (so user input can't inject FTS syntax) and
+    # prefix-matched; all terms must match the label. Terms without letters
+    # or digits ("&", "-") have nothing to index, so they are left out; None
+    # if that leaves no term at all.
+    query = f'owner : "u{int(user_id)}"'
+    words = terms.split()
+    tokens = ['"{}"*'.format(t.replace('"', '""')) for t in words if any(c.isalnum() for c in t)]
+    if words and not tokens:
+        return None
+    if tokens:
+        query += f" AND label : ({' AND '.join(tokens)})"
+    return query
+
+def _date_range(date_filter):
+    # "2025-05" is that month, "2025-01..2025-03" an inclusive range of
+    # periods, "" everything. A filter that isn't a date matches nothing.
+    start, _, end = date_filter.partition("..")
+    start, end = start.strip(), (end or start).strip()
+    try:
+        return (period(start)[0] if start else 0), (period(end)[1] if end else MAX_TS)
+    except (ValueError, OverflowError):
+        return 0, 0
+
+def search_entries(user_id, terms, date_filter="", limit=20, offset=0):
+    """Entries whose label matches every term (by prefix) within the date filter.
+
+    Returns dicts with kind, id, amount_cents, label and ts, newest first.
+    """
+    start, end = _date_range(date_filter)
+    match = _match_query(user_id, terms)
+    if match is None:
+        return []
+    return _fetch_dicts(user_id, SEARCH_ENTRIES, (match, start, end, limit, offset))
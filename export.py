@@ -0,0 +1,106 @@
+# export.py
+#
+# Streaming export for the Full Breakdown report. Rows are read from SQLite
+# with a cursor in fixed-size batches and written straight out, so memory
+# stays flat however long the user's history is:
+#   - xlsx: openpyxl write-only workbook, one sheet per ledger
+#   - csv / csv.gz: one file, one normalised row per entry
+# Runs in a render worker (see render.py) with its own connection.
+
+import os
+import csv
+import gzip
+
+from database import connection
+from report_queries import LEDGERS, rows_sql
+
+FETCH_SIZE = 5000
+MAX_ROWS = int(os.getenv("EXPORT_MAX_ROWS", "1000000"))
+XLSX_SHEET_ROWS = 1_048_575  # Excel's row limit, less the header
+SHEET_TITLES = {"expenses": "Expenses", "income": "Income", "investments": "Investments", "losses": "Losses"}
+CSV_COLUMNS = ["kind", "id", "amount", "label", "date", "roi", "interval"]
+
+NUMERIC_SUMS = """
+    SELECT COALESCE(SUM(id), 0), COALESCE(SUM(user_id), 0), COALESCE(SUM(amount_cents), 0)
+    FROM {table} WHERE user_id = ? AND ts >= ?
+"""
+
+
+def stream_rows(conn, user_id, kind, cutoff, limit):
+    """Yield the column names, then up to limit row tuples, for one ledger."""
+    cur = conn.execute(rows_sql(kind) + " LIMIT ?", (user_id, cutoff, limit))
+    yield [d[0] for d in cur.description]
+    while True:
+        batch = cur.fetchmany(FETCH_SIZE)
+        if not batch:
+            return
+        for row in batch:
+            yield tuple(row)
+
+
+def export_xlsx(db_path, user_id, cutoff, path, max_rows=MAX_ROWS):
+    from openpyxl import Workbook
+
+    # max_rows counts rows across all sheets, as export_csv does across ledgers;
+    # a sheet also stops at Excel's own limit.
+    wb = Workbook(write_only=True)
+    total = 0
+    with connection(db_path) as conn:
+        for kind in LEDGERS:
+            ws = wb.create_sheet(SHEET_TITLES[kind])
+            limit = min(max_rows - total, XLSX_SHEET_ROWS)
+            written = -1  # the header row
+            for row in stream_rows(conn, user_id, kind, cutoff, limit + 1):
+                if written == limit:
+                    ws.append([f"... truncated after {max_rows:,} rows" if limit < XLSX_SHEET_ROWS
+                               else f"... truncated after {limit:,} rows (Excel's sheet limit)"])
+                    break
+                ws.append(row)
+                written += 1
+            total += max(written, 0)
+    wb.save(path)
+    return path
+
+
+def export_csv(db_path, user_id, cutoff, path, max_rows=MAX_ROWS, compress=False):
+    opener = gzip.open if compress else open
+    written = 0
+    with opener(path, "wt", newline="") as fh, connection(db_path) as conn:
+        out = csv.writer(fh)
+        out.writerow(CSV_COLUMNS)
+        for kind in LEDGERS:
+            rows = stream_rows(conn, user_id, kind, cutoff, max_rows - written + 1)
+            columns = next(rows)
+            index = {name: i for i, name in enumerate(columns)}
+            label = LEDGERS[kind][1]
+            for row in rows:
+                if written == max_rows:
+                    out.writerow([f"... truncated after {max_rows:,} rows"])
+                    return path
+                out.writerow([kind, row[index["id"]], row[index["amount"]], row[index[label]], row[index["date"]],
+                              row[index["roi"]] if "roi" in index else "",
+                              row[index["interval"]] if "interval" in index else ""])
+                written += 1
+    return path
+
+
+def full_numeric_sums(db_path, user_id, cutoff):
+    """Per-column sums of the numeric fields across all four ledgers, for the PDF overview."""
+    sums = {"id": 0, "user_id": 0, "amount": 0, "roi": 0}
+    with connection(db_path) as conn:
+        for table, _ in LEDGERS.values():
+            row = conn.execute(NUMERIC_SUMS.format(table=table), (user_id, cutoff)).fetchone()
+            for name, value in zip(("id", "user_id", "amount"), row):
+                sums[name] += value
+        sums["roi"] = conn.execute("SELECT COALESCE(SUM(roi), 0) FROM investments WHERE user_id = ? AND ts >= ?",
+                                   (user_id, cutoff)).fetchone()[0]
+    sums["amount"] /= 100
+    return sums
+
+
+def export_full(db_path, user_id, cutoff, path, format_type):
+    if format_type == "xlsx":
+        return export_xlsx(db_path, user_id, cutoff, path)
+    if format_type in ("csv", "csv.gz"):
+        return export_csv(db_path, user_id, cutoff, path, compress=format_type == "csv.gz")
+    raise ValueError(f"Unsupported export format: {format_type}")
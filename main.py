@@ -1,59 +1,130 @@
 # main.py
 
 import os
+import math
+import asyncio
 import logging
+import collections
+import tempfile
+import functools
 from telegram.ext import CommandHandler
 from dotenv import load_dotenv
 from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
-    ApplicationBuilder, ContextTypes, MessageHandler,
+    ApplicationBuilder, BaseUpdateProcessor, ContextTypes, MessageHandler,
     CallbackQueryHandler, filters
 )
-from db import (
-    save_expense, save_income, save_investment, save_loss,
-    init_db, get_recent_expenses, update_expense,
+from db import init_db, encode_cursor, decode_cursor
+from units import to_cents, format_amount, format_ts
+from bulk_import import RowError, format_summary
+from async_db import (
+    save_each,
+    get_recent_expenses, update_expense,
     get_recent_income, update_income,
     get_recent_investments, update_investment,
     get_recent_losses, update_loss,
-    get_paginated_entries, delete_entry, search_entries
+    get_paginated_entries, delete_entry, search_entries,
+    generate_report, generate_chart, import_file
 )
-from reports import generate_report, generate_chart
+import async_db
+import render
+import metrics
+import webhook
+import precompute
+import throttle
 
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 load_dotenv()
 TOKEN = os.getenv("TOKEN")
-
-init_db()
+# Updates handled at once across users, and connections for their replies. Past a few dozen,
+# more only adds event-loop and connection-pool overhead (see benchmarks/bench_webhook.py).
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+BOT_API_CONNECTIONS = int(os.getenv("BOT_API_CONNECTIONS", "32"))
 
 main_menu = ReplyKeyboardMarkup([
     ["➕ Add Expense", "💵 Add Income"],
     ["📈 Add Investment", "📉 Log Incurred Losses"],
     ["📊 View Report", "📈 View Charts"],
     ["✏️ Edit Entry", "🔍 Search Data"],
-    ["🧾 View Entries"]
+    ["🧾 View Entries", "📥 Import File"]
 ], resize_keyboard=True)
 
 
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# action -> (ledger, fields per line, usage, single-entry confirmation)
+ADD_ACTIONS = {
+    "add_expense": ("expenses", 2, "amount category", "✅ Logged {0} for {1}"),
+    "add_income": ("income", 2, "amount source", "✅ Logged {0} from {1}"),
+    "add_investment": ("investments", 4, "amount type ROI% interval",
+                       "✅ Investment logged: {0} in {1} with {2} ROI ({3})"),
+    "add_loss": ("losses", 2, "amount reason", "✅ Loss of {0} logged: {1}"),
+}
+
+SEARCH_PAGE_SIZE = 20
+
+# edit_<prefix>_e<id> buttons -> the ledger of the entry they edit
+EDIT_PREFIXES = {"edit_exp": "expenses", "edit_inc": "income", "edit_inv": "investments", "edit_loss": "losses"}
+LIST_EXPIRED = "⚠️ That list has expired, please open it again."
+ENTRY_GONE = "⚠️ That entry no longer exists."
+RENDER_PREFIXES = ("rpt", "fmt", "view_totals", "view_full", "chart")
+SLOW_DOWN = "⏳ Too many reports in a row, try again in {}s."
+BUSY = "⏳ The bot is busy right now, please try again in a moment."
+
+
+def with_session(fn):
+    """Call fn(update, context, session) with the user's sessions.Session, saved if fn changed it."""
+    @functools.wraps(fn)
+    async def wrapper(update, context):
+        async with async_db.user_session(update.effective_user.id) as session:
+            return await fn(update, context, session)
+    return wrapper
+
+
+def entry_ref(ref):
+    """Entry id of a del_/edit_ button's e<id> part; None for buttons from before ids (list positions)."""
+    if ref[:1] != "e" or not ref[1:].isdigit():
+        return None
+    return int(ref[1:])
+
+
+async def send_search_page(message, chat_id, search, page):
+    terms, date = search
+    results = await search_entries(chat_id, terms, date, SEARCH_PAGE_SIZE + 1, page * SEARCH_PAGE_SIZE)
+    if not results:
+        await message.reply_text("No results found.")
+        return
+    output = "\n".join(f"{format_amount(r['amount_cents'])} {r['label']} ({format_ts(r['ts'])})"
+                       for r in results[:SEARCH_PAGE_SIZE])
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"srch_{page - 1}"))
+    if len(results) > SEARCH_PAGE_SIZE:
+        nav.append(InlineKeyboardButton("➡️ Next", callback_data=f"srch_{page + 1}"))
+    await message.reply_text(f"🔍 Results:\n{output}", reply_markup=InlineKeyboardMarkup([nav]) if nav else None)
+
+
+@metrics.handler
+@with_session
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE, session):
     text = update.message.text
     chat_id = update.effective_user.id
-    action = context.user_data.get("action")
+    action = session.action
 
     if text == "➕ Add Expense":
-        await update.message.reply_text("Enter expense as: amount category")
-        context.user_data["action"] = "add_expense"
+        await update.message.reply_text("Enter expense as: amount category (one per line for several)")
+        session.action = "add_expense"
 
     elif text == "💵 Add Income":
-        await update.message.reply_text("Enter income as: amount source")
-        context.user_data["action"] = "add_income"
+        await update.message.reply_text("Enter income as: amount source (one per line for several)")
+        session.action = "add_income"
 
     elif text == "📈 Add Investment":
-        await update.message.reply_text("Enter investment as: amount type ROI% interval")
-        context.user_data["action"] = "add_investment"
+        await update.message.reply_text("Enter investment as: amount type ROI% interval (one per line for several)")
+        session.action = "add_investment"
 
     elif text == "📉 Log Incurred Losses":
-        await update.message.reply_text("Enter loss as: amount reason")
-        context.user_data["action"] = "add_loss"
+        await update.message.reply_text("Enter loss as: amount reason (one per line for several)")
+        session.action = "add_loss"
 
     elif text == "📊 View Report":
         buttons = [
@@ -62,8 +133,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [InlineKeyboardButton("Custom Date", callback_data="rpt_custom")],
             [InlineKeyboardButton("PDF", callback_data="fmt_pdf"),
              InlineKeyboardButton("Spreadsheet", callback_data="fmt_xlsx")],
+            [InlineKeyboardButton("CSV", callback_data="fmt_csv"),
+             InlineKeyboardButton("CSV (gzip)", callback_data="fmt_csvgz")],
             [InlineKeyboardButton("Totals Only", callback_data="view_totals"),
-             InlineKeyboardButton("Full Breakdown", callback_data="view_full")]
+             InlineKeyboardButton("Full Breakdown", callback_data="view_full")],
+            [InlineKeyboardButton("Investment Projection", callback_data="rpt_proj")]
         ]
         await update.message.reply_text("Choose report options:", reply_markup=InlineKeyboardMarkup(buttons))
 
@@ -71,7 +145,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         buttons = [
             [InlineKeyboardButton("Expenses", callback_data="chart_exp"),
              InlineKeyboardButton("Income", callback_data="chart_inc")],
-            [InlineKeyboardButton("Investments", callback_data="chart_inv")],
+            [InlineKeyboardButton("Investments", callback_data="chart_inv"),
+             InlineKeyboardButton("Projection", callback_data="chart_proj")],
             [InlineKeyboardButton("Exp vs Inc", callback_data="chart_ei"),
              InlineKeyboardButton("Inc vs Inv", callback_data="chart_ii")],
             [InlineKeyboardButton("All 3", callback_data="chart_all")]
@@ -89,172 +164,240 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif text == "🧾 View Entries":
         buttons = [
-            [InlineKeyboardButton("Expenses", callback_data="view_expenses_0")],
-            [InlineKeyboardButton("Income", callback_data="view_income_0")],
-            [InlineKeyboardButton("Investments", callback_data="view_investments_0")],
-            [InlineKeyboardButton("Losses", callback_data="view_losses_0")]
+            [InlineKeyboardButton("Expenses", callback_data="pg_expenses")],
+            [InlineKeyboardButton("Income", callback_data="pg_income")],
+            [InlineKeyboardButton("Investments", callback_data="pg_investments")],
+            [InlineKeyboardButton("Losses", callback_data="pg_losses")]
         ]
         await update.message.reply_text("Choose data to view:", reply_markup=InlineKeyboardMarkup(buttons))
 
+    elif text == "📥 Import File":
+        await update.message.reply_text(
+            "Send a .csv or .xlsx file with a header row, either:\n"
+            "• kind,amount,category,date (kind: expense/income/investment/loss; "
+            "investments may add roi,interval)\n"
+            "• date,description,amount (bank statement: negative = expense, positive = income)")
+
     elif text == "🔍 Search Data":
-        await update.message.reply_text("Enter search as: category,date (e.g. groceries,2025-05)")
-        context.user_data["action"] = "search_data"
-
-    elif action == "add_expense":
-        amount, category = text.split(maxsplit=1)
-        save_expense(chat_id, amount, category)
-        await update.message.reply_text(f"✅ Logged {amount} for {category}")
-        context.user_data["action"] = None
-
-    elif action == "add_income":
-        amount, source = text.split(maxsplit=1)
-        save_income(chat_id, amount, source)
-        await update.message.reply_text(f"✅ Logged {amount} from {source}")
-        context.user_data["action"] = None
-
-    elif action == "add_investment":
-        amount, inv_type, roi, interval = text.split(maxsplit=3)
-        save_investment(chat_id, amount, inv_type, roi, interval)
-        await update.message.reply_text(f"✅ Investment logged: {amount} in {inv_type} with {roi} ROI ({interval})")
-        context.user_data["action"] = None
-
-    elif action == "add_loss":
-        amount, reason = text.split(maxsplit=1)
-        save_loss(chat_id, amount, reason)
-        await update.message.reply_text(f"✅ Loss of {amount} logged: {reason}")
-        context.user_data["action"] = None
+        await update.message.reply_text(
+            "Enter search as: words,date (e.g. groceries,2025-05 or coffee shop,2025-01..2025-03)")
+        session.action = "search_data"
+
+    elif action in ADD_ACTIONS:
+        # One entry per line, so a whole list can be pasted at once.
+        kind, fields, usage, logged = ADD_ACTIONS[action]
+        entries, bad_lines = [], []
+        for line in filter(str.strip, text.splitlines()):
+            parts = line.split(maxsplit=fields - 1)
+            try:
+                if len(parts) != fields:
+                    raise ValueError(line)
+                to_cents(parts[0])
+                if kind == "investments":
+                    float(parts[2].strip('%'))
+            except ValueError:
+                bad_lines.append(line)
+                continue
+            entries.append(parts)
+        failed = []
+        if entries:
+            try:
+                errors = await save_each(chat_id, kind, entries)
+            except Exception:
+                logger.exception("Saving %d %s for %s failed", len(entries), kind, chat_id)
+                errors = [True] * len(entries)  # nothing is known to be stored
+            failed = [" ".join(e) for e, error in zip(entries, errors) if error is not None]
+            entries = [e for e, error in zip(entries, errors) if error is None]
+        if len(entries) == 1 and not bad_lines and not failed:
+            await update.message.reply_text(logged.format(*entries[0]))
+        else:
+            reply = f"✅ Logged {len(entries)} entries to {kind}."
+            if entries and (bad_lines or failed):
+                reply += "\n" + "\n".join(" ".join(e) for e in entries[:10])
+            if bad_lines:
+                reply += f"\n⚠️ Skipped {len(bad_lines)} line(s), use: {usage}\n" + "\n".join(bad_lines[:10])
+            if failed:
+                reply += f"\n❌ Could not save {len(failed)} line(s), please try again:\n" + "\n".join(failed[:10])
+            await update.message.reply_text(reply)
+        session.action = None
 
     elif action == "search_data":
-        try:
-            category, date = text.split(",")
-            results = search_entries(chat_id, category.strip(), date.strip())
-            if results:
-                output = "\n".join([
-                    f"{r['amount']} {r.get('category') or r.get('source') or r.get('type') or r.get('reason')} ({r['date']})"
-                    for r in results
-                ])
-                await update.message.reply_text(f"🔍 Results:\n{output}")
-            else:
-                await update.message.reply_text("No results found.")
-        except:
-            await update.message.reply_text("⚠️ Use format: category,date")
-        context.user_data["action"] = None
+        terms, _, date = text.partition(",")
+        session.search = (terms.strip(), date.strip())
+        await send_search_page(update.message, chat_id, session.search, 0)
+        session.action = None
 
 
     elif action == "edit_expense":
         try:
             amount, category = [v.strip() for v in text.split(",")]
-            index = context.user_data.get("edit_index")
-            entries = context.user_data.get("edit_list")
-            entry_id = entries[index]['id']
-            update_expense(entry_id, amount, category)
-            await update.message.reply_text(f"✅ Expense updated to {amount} for {category}.")
+            if await update_expense(chat_id, session.edit_id, amount, category):
+                await update.message.reply_text(f"✅ Expense updated to {amount} for {category}.")
+            else:
+                await update.message.reply_text(ENTRY_GONE)
         except:
             await update.message.reply_text("⚠️ Invalid format. Use: amount, category")
-        context.user_data["action"] = None
+        session.action = None
 
     elif action == "edit_income":
         try:
             amount, source = [v.strip() for v in text.split(",")]
-            index = context.user_data.get("edit_index")
-            entries = context.user_data.get("edit_list")
-            entry_id = entries[index]['id']
-            update_income(entry_id, amount, source)
-            await update.message.reply_text(f"✅ Income updated to {amount} from {source}.")
+            if await update_income(chat_id, session.edit_id, amount, source):
+                await update.message.reply_text(f"✅ Income updated to {amount} from {source}.")
+            else:
+                await update.message.reply_text(ENTRY_GONE)
         except:
             await update.message.reply_text("⚠️ Invalid format. Use: amount, source")
-        context.user_data["action"] = None
+        session.action = None
 
     elif action == "edit_investment":
         try:
             amount, inv_type = [v.strip() for v in text.split(",")]
-            index = context.user_data.get("edit_index")
-            entries = context.user_data.get("edit_list")
-            entry_id = entries[index]['id']
-            update_investment(entry_id, amount, inv_type)
-            await update.message.reply_text(f"✅ Investment updated to {amount} in {inv_type}.")
+            if await update_investment(chat_id, session.edit_id, amount, inv_type):
+                await update.message.reply_text(f"✅ Investment updated to {amount} in {inv_type}.")
+            else:
+                await update.message.reply_text(ENTRY_GONE)
         except:
             await update.message.reply_text("⚠️ Invalid format. Use: amount, type")
-        context.user_data["action"] = None
+        session.action = None
 
     elif action == "edit_loss":
         try:
             amount, reason = [v.strip() for v in text.split(",")]
-            index = context.user_data.get("edit_index")
-            entries = context.user_data.get("edit_list")
-            entry_id = entries[index]['id']
-            update_loss(entry_id, amount, reason)
-            await update.message.reply_text(f"✅ Loss updated to {amount} for {reason}.")
+            if await update_loss(chat_id, session.edit_id, amount, reason):
+                await update.message.reply_text(f"✅ Loss updated to {amount} for {reason}.")
+            else:
+                await update.message.reply_text(ENTRY_GONE)
         except:
             await update.message.reply_text("⚠️ Invalid format. Use: amount, reason")
-        context.user_data["action"] = None
+        session.action = None
 
 
-async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@metrics.handler
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    document = update.message.document
+    chat_id = update.effective_user.id
+    name = (document.file_name or "").lower()
+    if not name.endswith((".csv", ".xlsx")):
+        await update.message.reply_text("⚠️ Only .csv and .xlsx files can be imported.")
+        return
+
+    await update.message.reply_text("⏳ Importing...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, os.path.basename(name))
+        telegram_file = await document.get_file()
+        await telegram_file.download_to_drive(path)
+        try:
+            summary = await import_file(chat_id, path)
+        except throttle.Busy:
+            await update.message.reply_text("⏳ Another import is running right now, please send the file again in a minute.")
+            return
+        except RowError as exc:
+            await update.message.reply_text(f"⚠️ Could not import: {exc}")
+            return
+        except Exception:
+            logger.exception("Import of %s for %s failed", name, chat_id)
+            await update.message.reply_text("⚠️ The import failed partway; some rows may already be saved, "
+                                            "so check your entries before sending the file again.")
+            return
+    await update.message.reply_text(f"📥 {format_summary(summary)}")
+
+
+@metrics.handler
+@with_session
+async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, session):
     data = update.callback_query.data
     chat_id = update.effective_user.id
+    if data.startswith(RENDER_PREFIXES):
+        wait = throttle.renders.take(chat_id)
+        if wait:
+            await update.callback_query.answer(SLOW_DOWN.format(math.ceil(wait)))
+            return
     await update.callback_query.answer()
 
     def format_entries(entries, prefix):
         return [[InlineKeyboardButton(
-            f"{e['amount']} {e.get('category') or e.get('source') or e.get('type') or e.get('reason')} ({e['date']})",
-            callback_data=f"{prefix}_{i}"
-        )] for i, e in enumerate(entries)]
-
-    if data.startswith("view_"):
-        _, kind, page = data.split("_")
-        entries = get_paginated_entries(chat_id, kind, int(page))
+            f"{format_amount(e['amount_cents'])} {e.get('category') or e.get('source') or e.get('type') or e.get('reason')} ({format_ts(e['ts'])})",
+            callback_data=f"{prefix}_e{e['id']}"
+        )] for e in entries]
+
+    if data.startswith("pg_") or (data.startswith("view_") and data not in ("view_totals", "view_full")):
+        # pg_<kind>[_<page>_<n|p><cursor>]; buttons from before keyset paging
+        # (view_<kind>_<page>) restart at the newest page.
+        parts = data.split("_")
+        kind, page, cursor, direction = parts[1], 0, None, "next"
+        if parts[0] == "pg" and len(parts) == 4:
+            page = int(parts[2])
+            direction = "prev" if parts[3][0] == "p" else "next"
+            cursor = decode_cursor(parts[3][1:])
+        entries, has_prev, has_next = await get_paginated_entries(chat_id, kind, cursor, direction)
         if not entries:
             await update.callback_query.message.reply_text("No data found.")
             return
-        context.user_data["edit_list"] = entries
         buttons = format_entries(entries, f"del_{kind}")
+        # Cursors are ~10 bytes, keeping callback_data well inside Telegram's 64-byte limit.
         nav = []
-        if int(page) > 0:
-            nav.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"view_{kind}_{int(page) - 1}"))
-        if len(entries) == 5:
-            nav.append(InlineKeyboardButton("➡️ Next", callback_data=f"view_{kind}_{int(page) + 1}"))
+        if has_prev:
+            nav.append(InlineKeyboardButton(
+                "⬅️ Prev", callback_data=f"pg_{kind}_{max(page - 1, 0)}_p{encode_cursor(entries[0])}"))
+        if has_next:
+            nav.append(InlineKeyboardButton(
+                "➡️ Next", callback_data=f"pg_{kind}_{page + 1}_n{encode_cursor(entries[-1])}"))
         if nav:
             buttons.append(nav)
         await update.callback_query.message.reply_text(
-            f"{kind.capitalize()} - Page {int(page) + 1}:", reply_markup=InlineKeyboardMarkup(buttons))
+            f"{kind.capitalize()} - Page {page + 1}:", reply_markup=InlineKeyboardMarkup(buttons))
+
+    elif data.startswith("srch_"):
+        search = session.search
+        if search is None:
+            await update.callback_query.message.reply_text("Search expired, please search again.")
+            return
+        await send_search_page(update.callback_query.message, chat_id, search, int(data.split("_")[1]))
 
     elif data.startswith("del_"):
-        _, kind, index = data.split("_")
-        entries = context.user_data.get("edit_list")
-        entry = entries[int(index)]
-        delete_entry(kind, entry['id'])
-        await update.callback_query.message.reply_text(f"🗑️ Deleted {kind[:-1]} entry.")
+        _, kind, ref = data.split("_")
+        entry_id = entry_ref(ref)
+        if entry_id is None:
+            await update.callback_query.message.reply_text(LIST_EXPIRED)
+        elif await delete_entry(chat_id, kind, entry_id):
+            await update.callback_query.message.reply_text(f"🗑️ Deleted {kind[:-1]} entry.")
+        else:
+            await update.callback_query.message.reply_text(ENTRY_GONE)
 
     elif data.startswith("edit_"):
-        index = int(data.split("_")[-1])
-        context.user_data["edit_index"] = index
+        prefix, _, ref = data.rpartition("_")
+        entry_id = entry_ref(ref)
+        if prefix not in EDIT_PREFIXES or entry_id is None:
+            await update.callback_query.message.reply_text(LIST_EXPIRED)
+            return
+        session.edit_id = entry_id
         if "exp" in data:
-            context.user_data["action"] = "edit_expense"
+            session.action = "edit_expense"
             await update.callback_query.message.reply_text("Enter the corrected value in format: amount, category")
         elif "inc" in data:
-            context.user_data["action"] = "edit_income"
+            session.action = "edit_income"
             await update.callback_query.message.reply_text("Enter the corrected value in format: amount, source")
         elif "inv" in data:
-            context.user_data["action"] = "edit_investment"
+            session.action = "edit_investment"
             await update.callback_query.message.reply_text("Enter the corrected value in format: amount, type")
         elif "loss" in data:
-            context.user_data["action"] = "edit_loss"
+            session.action = "edit_loss"
             await update.callback_query.message.reply_text("Enter the corrected value in format: amount, reason")
 
     elif data.startswith("editcat_"):
         kind = data.split("_")[1]
         if kind == "expense":
-            entries = get_recent_expenses(chat_id)
+            entries = await get_recent_expenses(chat_id)
             prefix = "edit_exp"
         elif kind == "income":
-            entries = get_recent_income(chat_id)
+            entries = await get_recent_income(chat_id)
             prefix = "edit_inc"
         elif kind == "investment":
-            entries = get_recent_investments(chat_id)
+            entries = await get_recent_investments(chat_id)
             prefix = "edit_inv"
         elif kind == "loss":
-            entries = get_recent_losses(chat_id)
+            entries = await get_recent_losses(chat_id)
             prefix = "edit_loss"
         else:
             return
@@ -262,16 +405,23 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not entries:
             await update.callback_query.message.reply_text("No recent entries to edit.")
             return
-        context.user_data["edit_list"] = entries
         buttons = format_entries(entries, prefix)
         await update.callback_query.message.reply_text("Select an entry to edit:", reply_markup=InlineKeyboardMarkup(buttons))
 
     elif data.startswith(("rpt", "fmt", "view")):
-        file = generate_report(chat_id, data)
+        try:
+            file = await generate_report(chat_id, data)
+        except throttle.Busy:
+            await update.callback_query.message.reply_text(BUSY)
+            return
         await update.callback_query.message.reply_document(open(file, "rb"))
 
     elif data.startswith("chart"):
-        file = generate_chart(chat_id, data)
+        try:
+            file = await generate_chart(chat_id, data)
+        except throttle.Busy:
+            await update.callback_query.message.reply_text(BUSY)
+            return
         await update.callback_query.message.reply_photo(photo=open(file, "rb"))
 
 
@@ -282,8 +432,91 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-app = ApplicationBuilder().token(TOKEN).build()
-app.add_handler(CommandHandler("start", start))
-app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-app.add_handler(CallbackQueryHandler(handle_callback))
-app.run_polling()
+async def post_init(app):
+    # Start the render workers in the background; polling or serving doesn't wait for them.
+    asyncio.get_running_loop().run_in_executor(None, render.warm_up)
+    try:
+        metrics.start_server()
+    except OSError as exc:  # e.g. another bot process on this host already serves METRICS_PORT
+        logger.warning("Metrics server not started on port %d: %s", metrics.METRICS_PORT, exc)
+    precompute.start()
+
+
+async def shutdown(app):
+    precompute.stop()
+    metrics.stop_server()
+    async_db.shutdown()
+    render.shutdown()
+
+
+class UserOrderedProcessor(BaseUpdateProcessor):
+    """Handles updates from different users concurrently and each user's one at a time, in order.
+
+    The handlers read and write per-user state (sessions.Session), so a user's
+    next message must not start before the previous one is done.
+
+    PTB takes one of the max_concurrent_updates slots before it calls
+    do_process_update. The first update of a user keeps its slot and then runs
+    the updates that user sent meanwhile, which were queued behind it and gave
+    their slots back straight away. A user sending a flood of updates holds
+    one slot, never all of them.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._queues = {}  # user id -> deque of coroutines waiting for the update being handled
+
+    async def do_process_update(self, update, coroutine):
+        user = getattr(update, "effective_user", None)
+        if user is None:
+            await coroutine
+            return
+        queue = self._queues.get(user.id)
+        if queue is not None:
+            queue.append(coroutine)  # run next by the update being handled for this user
+            return
+        queue = self._queues[user.id] = collections.deque([coroutine])
+        try:
+            while queue:
+                try:
+                    await queue.popleft()
+                except Exception:
+                    logger.exception("Handling an update for user %s failed", user.id)
+        finally:
+            del self._queues[user.id]
+            for pending in queue:  # cancelled at shutdown
+                pending.close()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+def build_app(token=TOKEN, base_url=None):
+    builder = ApplicationBuilder().token(token) \
+        .concurrent_updates(UserOrderedProcessor(CONCURRENT_UPDATES)) \
+        .connection_pool_size(BOT_API_CONNECTIONS) \
+        .post_init(post_init).post_shutdown(shutdown)
+    if base_url:
+        builder = builder.base_url(base_url)  # e.g. a local Bot API server, or the benchmark's stub
+    app = builder.build()
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
+    app.add_handler(CallbackQueryHandler(handle_callback))
+    return app
+
+
+def main():
+    init_db()
+    app = build_app()
+    if webhook.WEBHOOK_URL:
+        webhook.run(app)
+    else:
+        app.run_polling()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# metrics.py
+#
+# In-process instrumentation for the bot: counters and histograms that the
+# hot paths update, plus values read from other modules at scrape time. They
+# are served in the Prometheus text format by a small HTTP server bound to
+# localhost (METRICS_PORT; 0 turns it off). Recording costs a lock and a few
+# additions, so it stays on for every handler call and query.
+#
+# The same server switches an optional sampling profiler on and off:
+#   GET /metrics                     Prometheus text format
+#   GET /profile/start?slow_ms=250   sample threads inside a span older than slow_ms
+#   GET /profile/stop                stop, and return collapsed stacks (flamegraph.pl input)
+# Only spans that run on a thread (queries, report assembly, renders) are
+# sampled; the async handlers spend their slow time awaiting those.
+
+import os
+import sys
+import time
+import logging
+import functools
+import threading
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+SLOW_HANDLER_MS = int(os.getenv("SLOW_HANDLER_MS", "1000"))
+SAMPLE_INTERVAL = 0.005
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROW_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 500, 1000, 5000, 10000)
+
+logger = logging.getLogger(__name__)
+_registry = []
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join('{}="{}"'.format(n, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                     for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+# --- METRIC TYPES ---
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=SECONDS_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Collected:
+    """A gauge or counter read at scrape time; fn returns a number or {label values: number}."""
+
+    def __init__(self, name, help, type, fn, labelnames=()):
+        self.name, self.help, self.type, self.fn, self.labelnames = name, help, type, fn, tuple(labelnames)
+        _registry.append(self)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        try:
+            values = self.fn()
+        except Exception:
+            logger.exception("Collecting %s failed", self.name)
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+def expose():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+# --- HOT-PATH METRICS ---
+HANDLER_SECONDS = Histogram("ceefinance_handler_seconds", "Telegram handler latency", ["handler"])
+HANDLER_ERRORS = Counter("ceefinance_handler_errors_total", "Handler calls that raised", ["handler"])
+QUERY_SECONDS = Histogram("ceefinance_db_query_seconds", "Time in a db.py call on a db thread", ["query"])
+QUERY_ROWS = Histogram("ceefinance_db_query_rows", "Rows returned by a db.py call", ["query"], ROW_BUCKETS)
+LOCK_WAIT_SECONDS = Histogram("ceefinance_user_lock_wait_seconds", "Wait for the per-user ordering lock")
+WRITE_BATCH_SECONDS = Histogram("ceefinance_write_batch_seconds", "Group-commit transaction time")
+WRITE_BATCH_ROWS = Histogram("ceefinance_write_batch_rows", "Writes per group commit", (), ROW_BUCKETS)
+REPORT_SECONDS = Histogram("ceefinance_report_seconds", "Report/chart request time, cache hits included", ["kind"])
+RENDER_SECONDS = Histogram("ceefinance_render_seconds", "Render pool task time, queueing included", ["task"])
+PRECOMPUTE_SECONDS = Histogram("ceefinance_precompute_seconds", "Background precompute job time, cache hits included",
+                               ["flag"])
+THROTTLED = Counter("ceefinance_throttled_total", "Report/chart requests and imports refused", ["reason"])
+COALESCED = Counter("ceefinance_coalesced_total", "Report/chart requests that joined an identical one in flight")
+WEBHOOK_REQUESTS = Counter("ceefinance_webhook_requests_total", "Webhook HTTP requests by response status", ["status"])
+
+
+# --- SPANS ---
+# thread id -> stack of (name, start) for the spans open on that thread; read
+# by the sampler to decide which threads are inside a slow request.
+_spans = {}
+
+
+@contextmanager
+def span(histogram, *labels):
+    """Time the block into histogram and mark this thread as busy with it for the sampler."""
+    stack = _spans.setdefault(threading.get_ident(), [])
+    start = time.perf_counter()
+    stack.append((labels[0] if labels else histogram.name, start))
+    try:
+        yield
+    finally:
+        stack.pop()
+        histogram.observe(time.perf_counter() - start, *labels)
+
+
+def timed(histogram, *labels):
+    """Decorator form of span()."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(histogram, *labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def handler(fn):
+    """Time an async Telegram handler, count its errors and log slow calls."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            HANDLER_SECONDS.observe(elapsed, name)
+            if elapsed * 1000 >= SLOW_HANDLER_MS:
+                logger.warning("Slow %s: %.0f ms", name, elapsed * 1000)
+    return wrapper
+
+
+# --- SAMPLING PROFILER ---
+class Sampler:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.slow = 0.0
+        self.stacks = StackCounter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, slow_ms=0):
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self.slow = slow_ms / 1000
+            self.stacks = StackCounter()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Stop sampling and return the stacks in collapsed format, heaviest first."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            for ident, stack in list(_spans.items()):
+                if ident == own or not stack:
+                    continue
+                try:
+                    name, started = stack[0]
+                except IndexError:  # the span closed while we looked
+                    continue
+                frame = frames.get(ident)
+                if frame is None or now - started < self.slow:
+                    continue
+                calls = []
+                while frame is not None:
+                    calls.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join([name] + calls[::-1])] += 1
+
+
+sampler = Sampler()
+
+
+# --- HTTP ENDPOINT ---
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/metrics":
+            self._reply(200, expose(), "text/plain; version=0.0.4")
+        elif url.path == "/profile/start":
+            try:
+                slow_ms = int(query.get("slow_ms", ["0"])[0])
+                if slow_ms < 0:
+                    raise ValueError
+            except ValueError:
+                self._reply(400, "slow_ms must be a whole number of milliseconds >= 0\n")
+                return
+            started = sampler.start(slow_ms)
+            self._reply(200 if started else 409, "started\n" if started else "already running\n")
+        elif url.path == "/profile/stop":
+            self._reply(200, sampler.stop())
+        else:
+            self._reply(404, "not found\n")
+
+    def _reply(self, status, body, content_type="text/plain"):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def start_server(port=METRICS_PORT):
+    """Serve /metrics and /profile on 127.0.0.1:port in a daemon thread (no-op for port 0)."""
+    global _server
+    if not port or _server is not None:
+        return _server
+    _server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Metrics on http://127.0.0.1:%d/metrics", _server.server_address[1])
+    return _server
+
+
+def stop_server():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+    sampler.stop()
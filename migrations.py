@@ -0,0 +1,518 @@
+# migrations.py
+#
+# Versioned schema migrations. Each migration runs once, in order, inside its
+# own transaction, and is recorded in schema_version. init_db() runs them at
+# startup, on every database shard. Run `python migrations.py --check-plans`
+# to verify that every db.py query is served by an index, and `--vacuum` to
+# reclaim the space a table-rewriting migration leaves behind.
+
+import sys
+import logging
+from datetime import datetime
+
+from units import MAX_CENTS
+
+# Ledger (label, date) columns as created by migrations 1-6; migration 7
+# replaces the date column with ts (see COMPACT_SCHEMAS).
+LEDGER_TABLES = {
+    "expenses": ("category", "date"),
+    "income": ("source", "date"),
+    "investments": ("type", "start_date"),
+    "losses": ("reason", "date"),
+}
+
+LEDGER_SCHEMAS = {
+    "expenses": """
+        CREATE TABLE IF NOT EXISTS expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount REAL,
+            category TEXT,
+            date TEXT
+        )""",
+    "income": """
+        CREATE TABLE IF NOT EXISTS income (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount REAL,
+            source TEXT,
+            date TEXT
+        )""",
+    "investments": """
+        CREATE TABLE IF NOT EXISTS investments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount REAL,
+            type TEXT,
+            roi REAL,
+            interval TEXT,
+            start_date TEXT
+        )""",
+    "losses": """
+        CREATE TABLE IF NOT EXISTS losses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount REAL,
+            reason TEXT,
+            date TEXT
+        )""",
+}
+
+
+def columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+# --- MIGRATIONS ---
+def create_ledger_tables(conn):
+    for sql in LEDGER_SCHEMAS.values():
+        conn.execute(sql)
+
+
+def add_missing_id_columns(conn):
+    # Early databases were created without the id column, which edit/delete rely on.
+    for table, sql in LEDGER_SCHEMAS.items():
+        existing = columns(conn, table)
+        if "id" in existing:
+            continue
+        conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+        conn.execute(sql)
+        cols = ", ".join(existing)
+        conn.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {table}_legacy")
+        conn.execute(f"DROP TABLE {table}_legacy")
+
+
+def add_user_date_indexes(conn):
+    for table, (_, date_col) in LEDGER_TABLES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_{date_col} ON {table} (user_id, {date_col})")
+
+
+def create_daily_rollup(conn):
+    # Per-user, per-kind, per-label daily sums kept current by triggers, so
+    # totals and charts never have to read the raw ledger rows.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_rollup (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            day TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            roi_total REAL NOT NULL DEFAULT 0,
+            entries INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, kind, day, category)
+        ) WITHOUT ROWID""")
+    for table, (label, date_col) in LEDGER_TABLES.items():
+        roi = "{row}.amount * {row}.roi / 100" if table == "investments" else "0"
+        add = f"""
+            INSERT INTO daily_rollup (user_id, kind, day, category, total, roi_total, entries)
+            VALUES (NEW.user_id, '{table}', COALESCE(substr(NEW.{date_col}, 1, 10), ''), COALESCE(NEW.{label}, ''),
+                    NEW.amount, {roi.format(row="NEW")}, 1)
+            ON CONFLICT (user_id, kind, day, category) DO UPDATE SET
+                total = total + excluded.total,
+                roi_total = roi_total + excluded.roi_total,
+                entries = entries + 1;"""
+        remove = f"""
+            UPDATE daily_rollup SET
+                total = total - OLD.amount,
+                roi_total = roi_total - {roi.format(row="OLD")},
+                entries = entries - 1
+            WHERE user_id = OLD.user_id AND kind = '{table}'
+              AND day = COALESCE(substr(OLD.{date_col}, 1, 10), '') AND category = COALESCE(OLD.{label}, '');
+            DELETE FROM daily_rollup
+            WHERE user_id = OLD.user_id AND kind = '{table}'
+              AND day = COALESCE(substr(OLD.{date_col}, 1, 10), '') AND category = COALESCE(OLD.{label}, '')
+              AND entries <= 0;"""
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_insert AFTER INSERT ON {table} BEGIN {add} END")
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_delete AFTER DELETE ON {table} BEGIN {remove} END")
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_update AFTER UPDATE ON {table} BEGIN {remove} {add} END")
+        conn.execute(f"""
+            INSERT INTO daily_rollup (user_id, kind, day, category, total, roi_total, entries)
+            SELECT user_id, '{table}', COALESCE(substr({date_col}, 1, 10), ''), COALESCE({label}, ''),
+                   SUM(amount), SUM({roi.format(row=table)}), COUNT(*)
+            FROM {table} WHERE user_id IS NOT NULL
+            GROUP BY 1, 3, 4""")
+
+
+def create_data_versions(conn):
+    # Bumped by every write to a user's ledgers; cached reports and charts are
+    # keyed on it, so any change makes the old files unreachable.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )""")
+    for table in LEDGER_TABLES:
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO data_versions (user_id, version) VALUES ({row}.user_id, 1)
+                    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+                END""")
+
+
+# Stable per-ledger number used to give each entry a unique rowid in ledger_search.
+SEARCH_KINDS = {"expenses": 0, "income": 1, "investments": 2, "losses": 3}
+
+
+def create_search_index(conn):
+    # One FTS5 index over the label column of all four ledgers. owner holds a
+    # "u<user_id>" token so a MATCH only walks that user's postings.
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS ledger_search USING fts5(
+            label, owner,
+            kind UNINDEXED, entry_id UNINDEXED, amount UNINDEXED, date UNINDEXED,
+            tokenize = 'unicode61', prefix = '2 3'
+        )""")
+    for table, (label, date_col) in LEDGER_TABLES.items():
+        n = SEARCH_KINDS[table]
+        add = f"""
+            INSERT INTO ledger_search (rowid, label, owner, kind, entry_id, amount, date)
+            VALUES (NEW.id * 4 + {n}, NEW.{label}, 'u' || NEW.user_id, '{table}', NEW.id, NEW.amount, NEW.{date_col});"""
+        remove = f"DELETE FROM ledger_search WHERE rowid = OLD.id * 4 + {n};"
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_search_insert AFTER INSERT ON {table} BEGIN {add} END")
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_search_delete AFTER DELETE ON {table} BEGIN {remove} END")
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_search_update AFTER UPDATE ON {table} BEGIN {remove} {add} END")
+        conn.execute(f"""
+            INSERT INTO ledger_search (rowid, label, owner, kind, entry_id, amount, date)
+            SELECT id * 4 + {n}, {label}, 'u' || user_id, '{table}', id, amount, {date_col} FROM {table}""")
+
+
+# Schema version 7: integer cents and wall-clock epoch seconds (see units.py).
+COMPACT_SCHEMAS = {
+    "expenses": """
+        CREATE TABLE expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount_cents INTEGER NOT NULL,
+            category TEXT,
+            ts INTEGER NOT NULL
+        )""",
+    "income": """
+        CREATE TABLE income (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount_cents INTEGER NOT NULL,
+            source TEXT,
+            ts INTEGER NOT NULL
+        )""",
+    "investments": """
+        CREATE TABLE investments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount_cents INTEGER NOT NULL,
+            type TEXT,
+            roi REAL,
+            interval TEXT,
+            ts INTEGER NOT NULL
+        )""",
+    "losses": """
+        CREATE TABLE losses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount_cents INTEGER NOT NULL,
+            reason TEXT,
+            ts INTEGER NOT NULL
+        )""",
+}
+# Integer day number of a row, and its ROI in whole cents (rounded per entry
+# so the rollup triggers add and remove exactly the same amount).
+DAY_OF = "{row}.ts / 86400"
+ROI_CENTS = "CAST(ROUND({row}.amount_cents * COALESCE({row}.roi, 0) / 100.0) AS INTEGER)"
+# Legacy REAL amounts to_cents would reject: CAST saturates them to INT64 max,
+# which then overflows the rollup sums.
+LEGACY_CENTS = "ROUND(COALESCE(amount, 0) * 100)"
+IN_RANGE = f"ABS({LEGACY_CENTS}) < {float(MAX_CENTS)!r}"
+
+logger = logging.getLogger(__name__)
+
+
+def compact_ledger_storage(conn):
+    # Triggers on the ledgers refer to daily_rollup and ledger_search, which
+    # are rebuilt below, so they go first.
+    for (trigger,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN (?, ?, ?, ?)",
+            tuple(LEDGER_TABLES)).fetchall():
+        conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute("DROP TABLE IF EXISTS daily_rollup")
+    conn.execute("DROP TABLE IF EXISTS ledger_search")
+
+    for table, (label, date_col) in LEDGER_TABLES.items():
+        extra = "roi, interval, " if table == "investments" else ""
+        conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+        conn.execute(COMPACT_SCHEMAS[table])
+        skipped = conn.execute(f"SELECT id, user_id, amount FROM {table}_legacy WHERE NOT ({IN_RANGE})").fetchall()
+        for entry_id, user_id, amount in skipped:
+            logger.warning("Dropping %s id %s of user %s: amount %r is out of range", table, entry_id, user_id, amount)
+        if skipped:
+            logger.warning("Dropped %d %s row(s) with out-of-range amounts", len(skipped), table)
+        # strftime('%s') reads the stored local time as UTC: exactly the
+        # wall-clock epoch. Unparseable or missing dates become 0.
+        conn.execute(f"""
+            INSERT INTO {table} (id, user_id, amount_cents, {label}, {extra}ts)
+            SELECT id, user_id, CAST({LEGACY_CENTS} AS INTEGER), {label}, {extra}
+                   COALESCE(CAST(strftime('%s', {date_col}) AS INTEGER), 0)
+            FROM {table}_legacy WHERE {IN_RANGE}""")
+        # Keep AUTOINCREMENT from reusing ids of rows deleted before the move.
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+        conn.execute("UPDATE sqlite_sequence SET name = ? WHERE name = ?", (table, f"{table}_legacy"))
+        conn.execute(f"DROP TABLE {table}_legacy")
+        conn.execute(f"CREATE INDEX idx_{table}_user_ts ON {table} (user_id, ts)")
+
+    conn.execute("""
+        CREATE TABLE daily_rollup (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            roi_total INTEGER NOT NULL DEFAULT 0,
+            entries INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, kind, day, category)
+        ) WITHOUT ROWID""")
+    conn.execute("""
+        CREATE VIRTUAL TABLE ledger_search USING fts5(
+            label, owner,
+            kind UNINDEXED, entry_id UNINDEXED, amount_cents UNINDEXED, ts UNINDEXED,
+            tokenize = 'unicode61', prefix = '2 3'
+        )""")
+    for table, (label, _) in LEDGER_TABLES.items():
+        roi = ROI_CENTS if table == "investments" else "0"
+        n = SEARCH_KINDS[table]
+        add = f"""
+            INSERT INTO daily_rollup (user_id, kind, day, category, total, roi_total, entries)
+            VALUES (NEW.user_id, '{table}', {DAY_OF.format(row="NEW")}, COALESCE(NEW.{label}, ''),
+                    NEW.amount_cents, {roi.format(row="NEW")}, 1)
+            ON CONFLICT (user_id, kind, day, category) DO UPDATE SET
+                total = total + excluded.total,
+                roi_total = roi_total + excluded.roi_total,
+                entries = entries + 1;
+            INSERT INTO ledger_search (rowid, label, owner, kind, entry_id, amount_cents, ts)
+            VALUES (NEW.id * 4 + {n}, NEW.{label}, 'u' || NEW.user_id, '{table}', NEW.id, NEW.amount_cents, NEW.ts);"""
+        remove = f"""
+            UPDATE daily_rollup SET
+                total = total - OLD.amount_cents,
+                roi_total = roi_total - {roi.format(row="OLD")},
+                entries = entries - 1
+            WHERE user_id = OLD.user_id AND kind = '{table}'
+              AND day = {DAY_OF.format(row="OLD")} AND category = COALESCE(OLD.{label}, '');
+            DELETE FROM daily_rollup
+            WHERE user_id = OLD.user_id AND kind = '{table}'
+              AND day = {DAY_OF.format(row="OLD")} AND category = COALESCE(OLD.{label}, '')
+              AND entries <= 0;
+            DELETE FROM ledger_search WHERE rowid = OLD.id * 4 + {n};"""
+        conn.execute(f"CREATE TRIGGER trg_{table}_insert AFTER INSERT ON {table} BEGIN {add} END")
+        conn.execute(f"CREATE TRIGGER trg_{table}_delete AFTER DELETE ON {table} BEGIN {remove} END")
+        conn.execute(f"CREATE TRIGGER trg_{table}_update AFTER UPDATE ON {table} BEGIN {remove} {add} END")
+        conn.execute(f"""
+            INSERT INTO daily_rollup (user_id, kind, day, category, total, roi_total, entries)
+            SELECT user_id, '{table}', {DAY_OF.format(row=table)}, COALESCE({label}, ''),
+                   SUM(amount_cents), SUM({roi.format(row=table)}), COUNT(*)
+            FROM {table} WHERE user_id IS NOT NULL
+            GROUP BY 1, 3, 4""")
+        conn.execute(f"""
+            INSERT INTO ledger_search (rowid, label, owner, kind, entry_id, amount_cents, ts)
+            SELECT id * 4 + {n}, {label}, 'u' || user_id, '{table}', id, amount_cents, ts FROM {table}""")
+    create_data_versions(conn)
+
+
+
+def create_shard_moves(conn):
+    # Journal for `shards.py rebalance`: users whose rows were copied into this
+    # shard from source but not yet deleted there. Lets an interrupted move
+    # resume without copying twice.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS shard_moves (
+            user_id INTEGER PRIMARY KEY,
+            source TEXT NOT NULL,
+            moved_at TEXT
+        )""")
+
+
+def create_sessions(conn):
+    # Conversation state per user (sessions.py); entry_ids is packed int64s
+    # (dropped by migration 12).
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            user_id INTEGER PRIMARY KEY,
+            action TEXT,
+            kind TEXT,
+            entry_ids BLOB,
+            edit_id INTEGER,
+            search_terms TEXT,
+            search_date TEXT,
+            expires INTEGER NOT NULL
+        )""")
+
+
+def create_ledger_changes(conn):
+    # Log of ledger writes for `snapshot.py update`: which entries changed
+    # since the last snapshot. AUTOINCREMENT so seq keeps growing after the
+    # snapshotter trims the log.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ledger_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind INTEGER NOT NULL,
+            entry_id INTEGER NOT NULL
+        )""")
+    for table in LEDGER_TABLES:
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_changes_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO ledger_changes (kind, entry_id) VALUES ({SEARCH_KINDS[table]}, {row}.id);
+                END""")
+
+
+def gate_ledger_changes(conn):
+    # Log only while a reader is registered in change_log_readers (snapshot.py
+    # registers itself on its first update), so a deployment that never takes
+    # snapshots doesn't grow the log or pay for it on every write.
+    conn.execute("CREATE TABLE IF NOT EXISTS change_log_readers (name TEXT PRIMARY KEY, since TEXT)")
+    for table in LEDGER_TABLES:
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            trigger = f"trg_{table}_changes_{event.lower()}"
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            conn.execute(f"""
+                CREATE TRIGGER {trigger} AFTER {event} ON {table}
+                WHEN EXISTS (SELECT 1 FROM change_log_readers)
+                BEGIN
+                    INSERT INTO ledger_changes (kind, entry_id) VALUES ({SEARCH_KINDS[table]}, {row}.id);
+                END""")
+    conn.execute("DELETE FROM ledger_changes")  # nobody is registered as having read it
+
+
+def drop_session_lists(conn):
+    # Entry list buttons carry the entry id since this version, so sessions no
+    # longer remember the list last shown.
+    conn.execute("ALTER TABLE sessions DROP COLUMN kind")
+    conn.execute("ALTER TABLE sessions DROP COLUMN entry_ids")
+
+
+MIGRATIONS = [
+    (1, "create ledger tables", create_ledger_tables),
+    (2, "add missing id columns", add_missing_id_columns),
+    (3, "add (user_id, date) indexes", add_user_date_indexes),
+    (4, "add daily rollup table", create_daily_rollup),
+    (5, "add per-user data versions", create_data_versions),
+    (6, "add full-text search index", create_search_index),
+    (7, "store amounts as cents and times as epoch seconds", compact_ledger_storage),
+    (8, "add shard move journal", create_shard_moves),
+    (9, "add conversation sessions", create_sessions),
+    (10, "add ledger change log", create_ledger_changes),
+    (11, "log ledger changes only for registered readers", gate_ledger_changes),
+    (12, "drop entry lists from sessions", drop_session_lists),
+]
+
+
+# --- RUNNER ---
+def current_version(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at TEXT
+        )""")
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """Apply every pending migration up to target (default: latest). Returns the new version."""
+    if conn.in_transaction:
+        conn.commit()
+    version = current_version(conn)
+    for number, name, apply in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        # IMMEDIATE takes the write lock up front so two processes starting
+        # together cannot both apply the same migration.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(conn) >= number:
+                conn.rollback()
+                continue
+            apply(conn)
+            conn.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                         (number, name, datetime.now().strftime("%Y-%m-%d %H:%M")))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        version = number
+    return version
+
+
+# --- QUERY PLAN CHECK ---
+def db_queries():
+    """Every read/update/delete statement db.py and sessions.py issue, with sample parameters."""
+    import db
+    import sessions
+
+    queries = [
+        ("get_recent_expenses", db.RECENT_EXPENSES, (1, 5)),
+        ("get_recent_income", db.RECENT_INCOME, (1, 5)),
+        ("get_recent_investments", db.RECENT_INVESTMENTS, (1, 5)),
+        ("get_recent_losses", db.RECENT_LOSSES, (1, 5)),
+        ("update_expense", db.UPDATE_EXPENSE, (100, "x", 1735689600, 1, 1)),
+        ("update_income", db.UPDATE_INCOME, (100, "x", 1735689600, 1, 1)),
+        ("update_investment", db.UPDATE_INVESTMENT, (100, "x", 1735689600, 1, 1)),
+        ("update_loss", db.UPDATE_LOSS, (100, "x", 1735689600, 1, 1)),
+    ]
+    for table in LEDGER_TABLES:
+        queries.append((f"get_paginated_entries[{table}]", db.FIRST_PAGE.format(table=table), (1, 6)))
+        queries.append((f"get_paginated_entries[{table}, next]",
+                        db.PAGE_AFTER.format(table=table), (1, 1735689600, 1, 6)))
+        queries.append((f"get_paginated_entries[{table}, prev]",
+                        db.PAGE_BEFORE.format(table=table), (1, 1735689600, 1, 6)))
+        queries.append((f"delete_entry[{table}]", db.DELETE_ENTRY.format(table=table), (1, 1)))
+    queries.append(("search_entries", db.SEARCH_ENTRIES,
+                    ('owner : "u1" AND label : ("x"*)', 1735689600, 1767225600, 20, 0)))
+    queries.append(("sessions.load", sessions.LOAD_SESSION, (1, 1735689600)))
+    return queries
+
+
+def unindexed_plans(conn, queries=None):
+    """Return (name, plan) for each query that scans a table or sorts with a temp b-tree.
+
+    A full-text MATCH shows up as a virtual table index; sorting the rows it
+    matched is allowed.
+    """
+    failures = []
+    for name, sql, params in queries or db_queries():
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        full_text = any("VIRTUAL TABLE INDEX" in step for step in plan)
+        if any((step.startswith("SCAN ") and "VIRTUAL TABLE INDEX" not in step)
+               or ("TEMP B-TREE" in step and not full_text) for step in plan):
+            failures.append((name, plan))
+    return failures
+
+
+def main(argv):
+    import sqlite3
+    from database import connection, shard_paths
+
+    failed = False
+    for path in shard_paths():
+        with connection(path) as conn:
+            version = migrate(conn)
+            print(f"{path}: schema version {version}")
+            if "--check-plans" in argv:
+                failures = unindexed_plans(conn)
+                for name, plan in failures:
+                    print(f"NOT INDEXED {name}: {' / '.join(plan)}")
+                print(f"{len(db_queries()) - len(failures)}/{len(db_queries())} queries use an index")
+                failed = failed or bool(failures)
+        if "--vacuum" in argv:
+            # VACUUM cannot run inside a transaction, so it uses its own connection.
+            size = "SELECT page_count * page_size FROM pragma_page_count(), pragma_page_size()"
+            conn = sqlite3.connect(path, isolation_level=None)
+            before = conn.execute(size).fetchone()[0]
+            conn.execute("VACUUM")
+            after = conn.execute(size).fetchone()[0]
+            conn.close()
+            print(f"vacuumed: {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,172 @@
+# precompute.py
+#
+# Background precomputation of the reports and charts most users ask for
+# (PRECOMPUTE_FLAGS: the Last 7/30 Days reports and the main charts), so the
+# request finds them in the render cache (cache.py) instead of waiting for a
+# render at peak time. A pass walks every user with entries in the last
+# PRECOMPUTE_ACTIVE_DAYS days and calls generate_report/generate_chart
+# exactly as a button press would, so the files land under the same keys;
+# ones already cached cost a version read.
+#
+# The 7d/30d windows start at midnight and any write bumps the user's data
+# version, so files go stale daily; passes run during the off-peak hours in
+# PRECOMPUTE_HOURS, every CHECK_INTERVAL seconds, and stop when the window
+# closes. PRECOMPUTE_DUTY paces a pass: after each job it sleeps long enough
+# that rendering takes at most that share of the time, leaving the render
+# pool to interactive requests.
+#
+# By default the bot schedules passes itself (PRECOMPUTE=bot). To run them in
+# a separate worker instead, set PRECOMPUTE=off for the bot and run, from the
+# bot's working directory (the cache lives in reports/ and charts/):
+#   python precompute.py            one pass now, whatever the hour
+#   python precompute.py --serve    passes during the off-peak hours, forever
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+
+import metrics
+import throttle
+from database import connection, shard_paths
+from units import DAY, now_ts
+
+PRECOMPUTE = os.getenv("PRECOMPUTE", "bot")
+PRECOMPUTE_FLAGS = os.getenv("PRECOMPUTE_FLAGS", "rpt_7d,rpt_30d,chart_exp,chart_ei").split(",")
+PRECOMPUTE_HOURS = os.getenv("PRECOMPUTE_HOURS", "2-6")  # local time, start-end; may wrap midnight
+DEFAULT_DUTY = 0.25
+PRECOMPUTE_ACTIVE_DAYS = int(os.getenv("PRECOMPUTE_ACTIVE_DAYS", "30"))
+CHECK_INTERVAL = 600
+
+ACTIVE_USERS = "SELECT user_id FROM daily_rollup GROUP BY user_id HAVING MAX(day) >= ?"
+
+logger = logging.getLogger(__name__)
+_task = None
+
+
+def _duty(text):
+    """Parse a duty (a share of the time): above 0 and at most 1."""
+    try:
+        duty = float(text)
+    except ValueError:
+        duty = None
+    if duty is None or not 0 < duty <= 1:
+        raise argparse.ArgumentTypeError(f"duty must be above 0 and at most 1, not {text!r}")
+    return duty
+
+
+try:
+    PRECOMPUTE_DUTY = _duty(os.getenv("PRECOMPUTE_DUTY", str(DEFAULT_DUTY)))
+except argparse.ArgumentTypeError as exc:
+    logger.warning("PRECOMPUTE_DUTY: %s; using %s", exc, DEFAULT_DUTY)
+    PRECOMPUTE_DUTY = DEFAULT_DUTY
+
+
+def off_peak(hour=None, hours=PRECOMPUTE_HOURS):
+    start, _, end = hours.partition("-")
+    start, end = int(start), int(end)
+    hour = datetime.now().hour if hour is None else hour
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+def active_users(days=PRECOMPUTE_ACTIVE_DAYS):
+    """Ids of users with entries in the last `days` days, on every shard."""
+    since = now_ts() // DAY - days
+    users = []
+    for path in shard_paths():
+        with connection(path) as conn:
+            users += (row[0] for row in conn.execute(ACTIVE_USERS, (since,)))
+    return sorted(users)
+
+
+def pause(elapsed, duty=PRECOMPUTE_DUTY):
+    """Seconds to sleep after a job that took elapsed, so jobs fill at most duty of the time."""
+    return elapsed * (1 - duty) / duty
+
+
+async def run_pass(flags=PRECOMPUTE_FLAGS, duty=PRECOMPUTE_DUTY, hours=PRECOMPUTE_HOURS):
+    """Precompute flags for every active user; stops early when the off-peak window closes (hours=None: never)."""
+    import async_db
+
+    loop = asyncio.get_running_loop()
+    users = await loop.run_in_executor(None, active_users)
+    logger.info("Precomputing %s for %d active users", ",".join(flags), len(users))
+    done = 0
+    for user_id in users:
+        if hours is not None and not off_peak(hours=hours):
+            logger.info("Off-peak window closed; precomputed %d of %d users", done, len(users))
+            return done
+        for flag in flags:
+            generate = async_db.generate_chart if flag.startswith("chart") else async_db.generate_report
+            start = time.perf_counter()
+            try:
+                await generate(user_id, flag)
+            except throttle.Busy:
+                pass  # interactive requests have the render pool; the next pass catches up
+            except Exception:
+                logger.exception("Precomputing %s for user %s failed", flag, user_id)
+            elapsed = time.perf_counter() - start
+            metrics.PRECOMPUTE_SECONDS.observe(elapsed, flag)
+            await asyncio.sleep(pause(elapsed, duty))
+        done += 1
+    return done
+
+
+async def schedule(duty=PRECOMPUTE_DUTY, hours=PRECOMPUTE_HOURS):
+    """Run passes inside the off-peak window, checking every CHECK_INTERVAL seconds."""
+    while True:
+        if off_peak(hours=hours):
+            try:
+                await run_pass(duty=duty, hours=hours)
+            except Exception:
+                logger.exception("Precompute pass failed")
+        await asyncio.sleep(CHECK_INTERVAL)
+
+
+def start():
+    """Schedule passes on the running event loop (the bot's post_init), unless PRECOMPUTE is off."""
+    global _task
+    if PRECOMPUTE == "bot" and _task is None:
+        _task = asyncio.get_running_loop().create_task(schedule())
+
+
+def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
+
+
+def main(argv):
+    import db
+    import render
+    import async_db
+
+    parser = argparse.ArgumentParser(description="Precompute the common reports and charts into the render cache")
+    parser.add_argument("--serve", action="store_true", help=f"keep running passes during {PRECOMPUTE_HOURS}h")
+    parser.add_argument("--duty", type=_duty, default=PRECOMPUTE_DUTY, help="share of the time spent rendering, 0-1")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    db.init_db()
+    render.warm_up()
+    try:
+        if args.serve:
+            asyncio.run(schedule(args.duty))
+        else:
+            began = time.perf_counter()
+            done = asyncio.run(run_pass(duty=args.duty, hours=None))
+            print(f"precomputed {len(PRECOMPUTE_FLAGS)} outputs for {done} users in {time.perf_counter() - began:.1f}s")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        async_db.shutdown()
+        render.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
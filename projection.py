@@ -0,0 +1,156 @@
+# projection.py
+#
+# Investment projection engine. roi is an annual rate in percent and the
+# interval is how often it compounds, so an investment grows once per whole
+# interval since the day it was logged:
+#
+#   value(day) = amount * (1 + roi / 100 / n) ** floor((day - start) / interval)
+#
+# where n is the number of intervals in a year (365.2425 days).
+#
+# Positions are loaded as NumPy arrays and evaluated against a grid of days
+# in blocks, as one matrix per block, so tens of thousands of positions take
+# milliseconds. NumPy is only imported in render workers (see render.py);
+# the bot process never loads it.
+#
+# Fleet-wide projection from the command line:
+#   python projection.py [--user ID] [--years N]
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+from database import connection, shard_paths
+from units import DAY, now_ts, format_amount
+
+PROJECTION_YEARS = int(os.getenv("PROJECTION_YEARS", "5"))
+POINTS = 240  # grid days between the first investment and the horizon
+BLOCK = 512  # positions per matrix block; ~1 MB of float64 at POINTS stays in cache
+YEAR_DAYS = 365.2425
+INTERVAL_DAYS = {"daily": 1, "weekly": 7, "monthly": YEAR_DAYS / 12, "yearly": YEAR_DAYS}
+DEFAULT_INTERVAL = "yearly"  # unknown or missing intervals, as in bulk_import.py
+MIN_RATE = -0.9999  # per interval; -100% would wipe the position out in one step
+MAX_LOG_GROWTH = np.log(1e12)  # caps runaway rates (e.g. 40% daily for years) below overflow
+
+POSITIONS = """
+    SELECT amount_cents, COALESCE(roi, 0), CASE lower(trim(interval)) {cases} ELSE {default} END, ts / 86400
+    FROM investments {where}
+"""
+
+
+def positions_sql(user_id=None):
+    cases = " ".join(f"WHEN '{name}' THEN {days!r}" for name, days in INTERVAL_DAYS.items())
+    where = "WHERE user_id = ?" if user_id is not None else ""
+    return POSITIONS.format(cases=cases, default=INTERVAL_DAYS[DEFAULT_INTERVAL], where=where)
+
+
+def load_positions(db_path, user_id=None):
+    """(amount cents, roi %, interval days, start day) arrays for one user's investments, or everyone's."""
+    with connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.row_factory = None  # plain tuples convert to an array several times faster than sqlite3.Row
+        rows = np.array(cur.execute(positions_sql(user_id), () if user_id is None else (user_id,)).fetchall(),
+                        dtype=np.float64).reshape(-1, 4)
+    return rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+
+
+def project(amounts, rois, intervals, starts, days):
+    """Total value in cents on each of days (ascending); a position counts from its start day on."""
+    # Sorted by start, each block of positions only needs the days from its
+    # first start on, and only the days before its last start need masking.
+    order = np.argsort(starts, kind="stable")
+    amounts, intervals, starts = amounts[order], intervals[order], starts[order]
+    growth = np.log1p(np.maximum(rois[order] / 100 * intervals / YEAR_DAYS, MIN_RATE))
+    per_day = 1 / intervals
+    values = np.zeros(len(days))
+    for lo in range(0, len(amounts), BLOCK):
+        hi = min(lo + BLOCK, len(amounts))
+        first = np.searchsorted(days, starts[lo])
+        ragged = np.searchsorted(days, starts[hi - 1]) - first
+        exponent = days[None, first:] - starts[lo:hi, None]  # elapsed days, then steps, then log growth
+        not_started = exponent[:, :ragged] < 0
+        exponent *= per_day[lo:hi, None]
+        np.floor(exponent, out=exponent)
+        exponent *= growth[lo:hi, None]
+        np.minimum(exponent, MAX_LOG_GROWTH, out=exponent)
+        factor = np.exp(exponent, out=exponent)
+        factor[:, :ragged][not_started] = 0
+        values[first:] += amounts[lo:hi] @ factor
+    return values
+
+
+def invested(amounts, starts, days):
+    """Principal paid in by each of days, in cents."""
+    order = np.argsort(starts, kind="stable")
+    paid = np.concatenate(([0.0], np.cumsum(amounts[order])))
+    return paid[np.searchsorted(starts[order], days, side="right")]
+
+
+def day_grid(first, today, horizon):
+    """About POINTS days from first to horizon, always including today."""
+    step = max(1, -(-(horizon - first) // POINTS))
+    return np.union1d(np.arange(first, horizon + 1, step), [today, horizon]).astype(np.float64)
+
+
+def portfolio_series(db_path, user_id=None, years=PROJECTION_YEARS):
+    """Day numbers, invested principal and projected value (currency units) from the first investment on.
+
+    db_path is the user's shard, or a list of shards to project everyone on them.
+    """
+    paths = [db_path] if isinstance(db_path, str) else db_path
+    amounts, rois, intervals, starts = (np.concatenate(column) for column in
+                                        zip(*(load_positions(path, user_id) for path in paths)))
+    today = now_ts() // DAY
+    first = int(starts.min()) if len(starts) else today
+    days = day_grid(min(first, today), today, today + round(years * YEAR_DAYS))
+    return {
+        "days": days.astype(np.int64),
+        "today": today,
+        "invested": invested(amounts, starts, days) / 100,
+        "value": project(amounts, rois, intervals, starts, days) / 100,
+        "positions": len(amounts),
+    }
+
+
+def export_projection(db_path, user_id, path, format_type="xlsx"):
+    """Projection report: one row per grid day with principal, value and gain."""
+    from openpyxl import Workbook
+
+    if format_type != "xlsx":
+        raise ValueError(f"Unsupported projection format: {format_type}")
+    series = portfolio_series(db_path, user_id)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Projection")
+    ws.append(["date", "invested", "projected value", "gain", "projected"])
+    dates = series["days"].astype("datetime64[D]").astype(str)
+    for date, day, paid, value in zip(dates, series["days"], series["invested"], series["value"]):
+        ws.append([date, round(float(paid), 2), round(float(value), 2), round(float(value - paid), 2),
+                   "yes" if day > series["today"] else "no"])
+    wb.save(path)
+    return path
+
+
+def main(argv):
+    import time
+    from database import user_db
+
+    parser = argparse.ArgumentParser(description="Project investment values for one user or all users")
+    parser.add_argument("--user", type=int, help="user id (default: every user)")
+    parser.add_argument("--years", type=float, default=PROJECTION_YEARS)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    series = portfolio_series(shard_paths() if args.user is None else user_db(args.user), args.user, args.years)
+    elapsed = time.perf_counter() - start
+    now = int(np.searchsorted(series["days"], series["today"]))
+    print(f"{series['positions']:,} positions projected in {elapsed * 1000:.1f} ms")
+    for label, i in (("today", now), (f"in {args.years:g} years", -1)):
+        print(f"{label:>14}: invested {format_amount(round(series['invested'][i] * 100))}, "
+              f"value {format_amount(round(series['value'][i] * 100))}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,155 @@
+# render.py
+#
+# Rendering engine for charts and report files. Work runs in a pool of warm
+# worker processes that have matplotlib (Agg backend) and openpyxl imported
+# once at start-up. Callers send plain aggregated data (dicts, lists, tuples)
+# and a target path; figures are built with the object-oriented Figure API,
+# so no pyplot global state is involved. This module itself imports nothing
+# heavy, which keeps matplotlib out of the bot process.
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+RENDER_PROCESSES = int(os.getenv("RENDER_PROCESSES", str(os.cpu_count() or 2)))
+# Imported once by the fork server; every worker forked from it starts warm.
+# Only what render tasks use: not __main__, which would pull the bot (telegram,
+# handlers) into every worker.
+WORKER_PRELOAD = ["matplotlib.figure", "matplotlib.backends.backend_pdf", "openpyxl", "render", "reports", "export",
+                  "projection"]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# --- POOL (bot process) ---
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # forkserver: workers never inherit the bot's event loop or threads.
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(WORKER_PRELOAD)
+                _pool = ProcessPoolExecutor(max_workers=RENDER_PROCESSES, mp_context=context,
+                                            initializer=_warm_worker)
+    return _pool
+
+
+def warm_up():
+    """Start every worker now so the first requests don't pay for imports."""
+    pool = get_pool()
+    for future in [pool.submit(os.getpid) for _ in range(RENDER_PROCESSES)]:
+        future.result()
+
+
+def submit(fn, *args):
+    return get_pool().submit(fn, *args)
+
+
+def run(fn, *args):
+    with metrics.span(metrics.RENDER_SECONDS, fn.__name__):
+        return submit(fn, *args).result()
+
+
+def shutdown(wait=True):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait)
+            _pool = None
+
+
+# --- WORKERS ---
+def _warm_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.figure  # noqa: F401
+    import matplotlib.backends.backend_pdf  # noqa: F401
+    import openpyxl  # noqa: F401
+    import export  # noqa: F401
+    import projection  # noqa: F401
+
+
+def _figure():
+    from matplotlib.figure import Figure
+    return Figure()
+
+
+def render_totals(totals, path, format_type):
+    """Totals Only report: one row of sums as XLSX, or a bar overview as PDF."""
+    if format_type == "xlsx":
+        from openpyxl import Workbook
+        wb = Workbook()
+        ws = wb.active
+        ws.append(list(totals.keys()))
+        ws.append(list(totals.values()))
+        wb.save(path)
+    else:
+        from matplotlib.backends.backend_pdf import PdfPages
+        fig = _figure()
+        ax = fig.subplots()
+        ax.barh(list(totals.keys()), list(totals.values()))
+        ax.set_title("Financial Overview")
+        fig.tight_layout()
+        with PdfPages(path) as pdf:
+            pdf.savefig(fig)
+    return path
+
+
+def render_bar(title, labels, values, path, rotate_labels=True):
+    fig = _figure()
+    ax = fig.subplots()
+    ax.bar([str(label) for label in labels], values)
+    ax.set_title(title)
+    if rotate_labels:
+        ax.tick_params(axis="x", labelrotation=90)
+    fig.tight_layout()
+    fig.savefig(path)
+    return path
+
+
+def render_daily_lines(title, series, path):
+    """series is {name: {'YYYY-MM-DD': total}}; missing days are plotted as 0."""
+    from datetime import date
+
+    days = sorted(day for day in set().union(*(s.keys() for s in series.values())) if day)
+    x = [date.fromisoformat(day) for day in days]
+    fig = _figure()
+    ax = fig.subplots()
+    for name, values in series.items():
+        ax.plot(x, [values.get(day, 0) for day in days], label=name, marker=".")
+    ax.set_title(title)
+    ax.legend()
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    fig.savefig(path)
+    return path
+
+
+def render_projection_report(db_path, user_id, path):
+    from projection import export_projection
+    return export_projection(db_path, user_id, path)
+
+
+def render_projection(db_path, user_id, path):
+    """Invested principal and projected portfolio value; reads the positions itself (projection.py)."""
+    import numpy as np
+    from projection import portfolio_series
+
+    series = portfolio_series(db_path, user_id)
+    x = series["days"].astype("datetime64[D]")
+    fig = _figure()
+    ax = fig.subplots()
+    ax.plot(x, series["invested"], label="Invested")
+    ax.plot(x, series["value"], label="Projected value")
+    ax.axvline(np.datetime64(series["today"], "D"), color="grey", linestyle="--", linewidth=1)
+    ax.set_title(f"Investment Projection ({series['positions']} positions)")
+    ax.legend()
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    fig.savefig(path)
+    return path
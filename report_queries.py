@@ -0,0 +1,106 @@
+# report_queries.py
+#
+# Parameterized SQL for reports and charts. Totals and chart series read the
+# daily_rollup table (one row per user, kind, day and label), so their cost
+# depends on the number of active days, not the number of entries. Only the
+# Full Breakdown report reads raw ledger rows, limited to the date window.
+#
+# Each query runs on the user's shard (database.user_db). Sums are added up
+# in integer cents and converted to currency units once, in SQL; rollup days
+# are integer day numbers. A cutoff is the wall-clock epoch second (units.py)
+# of the first day in the window.
+
+from datetime import datetime, timedelta
+from database import connection, user_db
+from units import DAY, to_ts
+
+# kind -> (table, label column)
+LEDGERS = {
+    "expenses": ("expenses", "category"),
+    "income": ("income", "source"),
+    "investments": ("investments", "type"),
+    "losses": ("losses", "reason"),
+}
+
+TOTALS = """
+    SELECT kind, SUM(total) / 100.0 AS total, SUM(roi_total) / 100.0 AS roi_total
+    FROM daily_rollup
+    WHERE user_id = ? AND day >= ?
+    GROUP BY kind
+"""
+# Raw rows with readable amount and date columns, for exports.
+ROWS = """
+    SELECT id, user_id, amount_cents / 100.0 AS amount, {label}, {extra}
+           strftime('%Y-%m-%d %H:%M', ts, 'unixepoch') AS date
+    FROM {table} WHERE user_id = ? AND ts >= ? ORDER BY ts
+"""
+SUM_BY_LABEL = """
+    SELECT category, SUM(total) / 100.0 FROM daily_rollup
+    WHERE user_id = ? AND kind = ? AND day >= ?
+    GROUP BY category
+"""
+SUM_BY_DAY = """
+    SELECT date(day * 86400, 'unixepoch'), SUM(total) / 100.0 FROM daily_rollup
+    WHERE user_id = ? AND kind = ? AND day >= ?
+    GROUP BY day ORDER BY day
+"""
+SUM_ALL = "SELECT COALESCE(SUM(total), 0) / 100.0 FROM daily_rollup WHERE user_id = ? AND kind = ? AND day >= ?"
+
+ALL_TIME = 0
+
+
+def date_cutoff(flags):
+    if "7d" in flags:
+        days = 7
+    elif "30d" in flags:
+        days = 30
+    else:
+        return ALL_TIME
+    start = datetime.now() - timedelta(days=days)
+    return to_ts(start.replace(hour=0, minute=0, second=0, microsecond=0))
+
+
+def rows_sql(kind):
+    table, label = LEDGERS[kind]
+    extra = "roi, interval," if kind == "investments" else ""
+    return ROWS.format(table=table, label=label, extra=extra)
+
+
+def fetch_totals(user_id, cutoff=ALL_TIME):
+    with connection(user_db(user_id)) as conn:
+        sums = {row["kind"]: row for row in conn.execute(TOTALS, (user_id, cutoff // DAY))}
+
+    def total(kind):
+        return sums[kind]["total"] if kind in sums else 0
+
+    return {
+        "total_expenses": total("expenses"),
+        "total_income": total("income"),
+        "total_invested": total("investments"),
+        "total_roi": sums["investments"]["roi_total"] if "investments" in sums else 0,
+        "total_losses": total("losses")
+    }
+
+
+def fetch_rows(user_id, kind, cutoff=ALL_TIME):
+    """Column names and row tuples for one ledger inside the date window."""
+    with connection(user_db(user_id)) as conn:
+        cur = conn.execute(rows_sql(kind), (user_id, cutoff))
+        return [d[0] for d in cur.description], [tuple(row) for row in cur.fetchall()]
+
+
+def sum_by_label(user_id, kind, cutoff=ALL_TIME):
+    """{label: total} for one ledger, e.g. expenses per category."""
+    with connection(user_db(user_id)) as conn:
+        return dict(conn.execute(SUM_BY_LABEL, (user_id, kind, cutoff // DAY)).fetchall())
+
+
+def sum_by_day(user_id, kind, cutoff=ALL_TIME):
+    """{'YYYY-MM-DD': total} for one ledger, in date order."""
+    with connection(user_db(user_id)) as conn:
+        return dict(conn.execute(SUM_BY_DAY, (user_id, kind, cutoff // DAY)).fetchall())
+
+
+def sum_all(user_id, kind, cutoff=ALL_TIME):
+    with connection(user_db(user_id)) as conn:
+        return conn.execute(SUM_ALL, (user_id, kind, cutoff // DAY)).fetchone()[0]
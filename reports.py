@@ -1,110 +1,102 @@
 # reports.py
+#
+# Gathers the aggregated data for a report or chart and hands it to the
+# render pool (render.py). Nothing here imports pandas or matplotlib.
 
 import os
-import sqlite3
-import pandas as pd
-import matplotlib.pyplot as plt
-from datetime import datetime, timedelta
-from matplotlib.backends.backend_pdf import PdfPages
+import render
+import metrics
+import export
+import database
+from units import DAY, now_ts
+from cache import cache_key, lookup, staging_path, store
+from db import get_data_version
+from report_queries import date_cutoff, fetch_totals, sum_by_label, sum_by_day, sum_all
 
 REPORT_DIR = "reports"
 CHART_DIR = "charts"
 os.makedirs(REPORT_DIR, exist_ok=True)
 os.makedirs(CHART_DIR, exist_ok=True)
 
+CHART_LABELS = {
+    "chart_exp": ("expenses", "Expenses by Category"),
+    "chart_inc": ("income", "Income by Source"),
+    "chart_inv": ("investments", "Investments by Type"),
+}
+CHART_LINES = {
+    "chart_ei": ("Expenses vs Income", {"Expenses": "expenses", "Income": "income"}),
+    "chart_ii": ("Income vs Investments", {"Income": "income", "Investments": "investments"}),
+}
+
+def report_format(flags):
+    if "pdf" in flags:
+        return "pdf"
+    if "csvgz" in flags:
+        return "csv.gz"
+    if "csv" in flags:
+        return "csv"
+    return "xlsx"
+
+@metrics.timed(metrics.REPORT_SECONDS, "report")
 def generate_report(user_id, flags):
-    conn = sqlite3.connect("finance.db")
-
-    df_exp = pd.read_sql(f"SELECT * FROM expenses WHERE user_id={user_id}", conn)
-    df_inc = pd.read_sql(f"SELECT * FROM income WHERE user_id={user_id}", conn)
-    df_inv = pd.read_sql(f"SELECT * FROM investments WHERE user_id={user_id}", conn)
-    df_loss = pd.read_sql(f"SELECT * FROM losses WHERE user_id={user_id}", conn)
-
-    conn.close()
-
-    # Filter by date
-    if "7d" in flags:
-        cutoff = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
-    elif "30d" in flags:
-        cutoff = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
-    else:
-        cutoff = "1970-01-01"
-
-    df_exp = df_exp[df_exp['date'] >= cutoff]
-    df_inc = df_inc[df_inc['date'] >= cutoff]
-    df_loss = df_loss[df_loss['date'] >= cutoff]
-    df_inv = df_inv[df_inv['start_date'] >= cutoff]
-
-    totals = {
-        "total_expenses": df_exp['amount'].sum(),
-        "total_income": df_inc['amount'].sum(),
-        "total_invested": df_inv['amount'].sum(),
-        "total_roi": (df_inv['amount'] * df_inv['roi'] / 100).sum(),
-        "total_losses": df_loss['amount'].sum()
-    }
-
+    if "proj" in flags:
+        return generate_projection(user_id)
+    cutoff = date_cutoff(flags)
     report_type = "totals" if "totals" in flags else "full"
-    format_type = "pdf" if "pdf" in flags else "xlsx"
+    format_type = report_format(flags)
+    if report_type == "totals" and format_type != "pdf":
+        format_type = "xlsx"  # one row of totals; CSV only applies to the full breakdown
+
+    # The version is read before the data, so a concurrent write can only make
+    # this file newer than its key, never older.
+    key = cache_key(user_id, "report", report_type, format_type, cutoff, get_data_version(user_id))
+    filename = os.path.join(REPORT_DIR, f"{user_id}_report_{key}.{format_type}")
+    if lookup(filename):
+        return filename
+    staged = staging_path(filename)
 
     if report_type == "totals":
-        df_report = pd.DataFrame([totals])
-    else:
-        df_report = pd.concat([
-            df_exp.assign(type='Expense'),
-            df_inc.assign(type='Income'),
-            df_inv.assign(type='Investment'),
-            df_loss.assign(type='Loss')
-        ], ignore_index=True)
-
-    filename = os.path.join(REPORT_DIR, f"{user_id}_report.{format_type}")
-
-    if format_type == "xlsx":
-        df_report.to_excel(filename, index=False)
+        render.run(render.render_totals, fetch_totals(user_id, cutoff), staged, format_type)
+    elif format_type == "pdf":
+        render.run(render.render_totals, export.full_numeric_sums(database.user_db(user_id), user_id, cutoff), staged, "pdf")
     else:
-        with PdfPages(filename) as pdf:
-            fig, ax = plt.subplots()
-            df_report.select_dtypes(include='number').sum().plot(kind='barh', ax=ax)
-            ax.set_title("Financial Overview")
-            pdf.savefig(fig)
-            plt.close()
-
-    return filename
-
+        # The worker streams rows from SQLite itself; nothing row-sized crosses processes.
+        render.run(export.export_full, database.user_db(user_id), user_id, cutoff, staged, format_type)
+    return store(staged, filename)
+
+def generate_projection(user_id):
+    # Projections run from today, so the day is part of the key.
+    key = cache_key(user_id, "report", "projection", get_data_version(user_id), now_ts() // DAY)
+    filename = os.path.join(REPORT_DIR, f"{user_id}_projection_{key}.xlsx")
+    if lookup(filename):
+        return filename
+    staged = staging_path(filename)
+    render.run(render.render_projection_report, database.user_db(user_id), user_id, staged)
+    return store(staged, filename)
+
+@metrics.timed(metrics.REPORT_SECONDS, "chart")
 def generate_chart(user_id, flag):
-    conn = sqlite3.connect("finance.db")
-    file = os.path.join(CHART_DIR, f"{user_id}_{flag}.png")
-
-    def fetch(table, group_col, date_col):
-        df = pd.read_sql(f"SELECT {group_col}, amount, {date_col} FROM {table} WHERE user_id = {user_id}", conn)
-        df[date_col] = pd.to_datetime(df[date_col]).dt.date
-        return df
-
-    if flag == "chart_exp":
-        df = fetch("expenses", "category", "date")
-        df.groupby("category")['amount'].sum().plot(kind="bar", title="Expenses by Category")
-    elif flag == "chart_inc":
-        df = fetch("income", "source", "date")
-        df.groupby("source")['amount'].sum().plot(kind="bar", title="Income by Source")
-    elif flag == "chart_inv":
-        df = fetch("investments", "type", "start_date")
-        df.groupby("type")['amount'].sum().plot(kind="bar", title="Investments by Type")
+    dated = (now_ts() // DAY,) if flag == "chart_proj" else ()  # projections run from today
+    key = cache_key(user_id, "chart", flag, get_data_version(user_id), *dated)
+    file = os.path.join(CHART_DIR, f"{user_id}_{flag}_{key}.png")
+    if lookup(file):
+        return file
+    staged = staging_path(file)
+
+    if flag in CHART_LABELS:
+        kind, title = CHART_LABELS[flag]
+        sums = sum_by_label(user_id, kind)
+        render.run(render.render_bar, title, list(sums.keys()), list(sums.values()), staged)
     elif flag == "chart_all":
-        exp = fetch("expenses", "category", "date")['amount'].sum()
-        inc = fetch("income", "source", "date")['amount'].sum()
-        inv = fetch("investments", "type", "start_date")['amount'].sum()
-        plt.bar(["Expenses", "Income", "Investments"], [exp, inc, inv])
-        plt.title("Expenses vs Income vs Investments")
-    elif flag == "chart_ei":
-        e = fetch("expenses", "category", "date").groupby("date")['amount'].sum()
-        i = fetch("income", "source", "date").groupby("date")['amount'].sum()
-        pd.concat([e.rename("Expenses"), i.rename("Income")], axis=1).fillna(0).plot(title="Expenses vs Income")
-    elif flag == "chart_ii":
-        i = fetch("income", "source", "date").groupby("date")['amount'].sum()
-        v = fetch("investments", "type", "start_date").groupby("start_date")['amount'].sum()
-        pd.concat([i.rename("Income"), v.rename("Investments")], axis=1).fillna(0).plot(title="Income vs Investments")
-
-    plt.tight_layout()
-    plt.savefig(file)
-    plt.close()
-    conn.close()
-    return file
+        totals = [sum_all(user_id, kind) for kind in ("expenses", "income", "investments")]
+        render.run(render.render_bar, "Expenses vs Income vs Investments",
+                   ["Expenses", "Income", "Investments"], totals, staged, False)
+    elif flag == "chart_proj":
+        render.run(render.render_projection, database.user_db(user_id), user_id, staged)
+    elif flag in CHART_LINES:
+        title, kinds = CHART_LINES[flag]
+        series = {name: sum_by_day(user_id, kind) for name, kind in kinds.items()}
+        render.run(render.render_daily_lines, title, series, staged)
+    else:
+        raise ValueError(f"Unknown chart: {flag}")
+    return store(staged, file)
@@ -0,0 +1,70 @@
+# rollup.py
+#
+# Maintenance for the daily_rollup table that triggers keep in step with the
+# ledgers (see migration 7). `python rollup.py verify` compares it against the
+# raw tables; `python rollup.py rebuild` recomputes it from scratch. Both run
+# on every shard. Totals are integer cents, so the comparison is exact.
+
+import sys
+from migrations import LEDGER_TABLES, DAY_OF, ROI_CENTS
+
+
+def raw_aggregate_sql():
+    parts = []
+    for table, (label, _) in LEDGER_TABLES.items():
+        roi = ROI_CENTS.format(row=table) if table == "investments" else "0"
+        parts.append(f"""
+            SELECT user_id, '{table}' AS kind, {DAY_OF.format(row=table)} AS day,
+                   COALESCE({label}, '') AS category, SUM(amount_cents) AS total, SUM({roi}) AS roi_total,
+                   COUNT(*) AS entries
+            FROM {table} WHERE user_id IS NOT NULL
+            GROUP BY 1, 3, 4""")
+    return " UNION ALL ".join(parts)
+
+
+def rebuild(conn):
+    conn.execute("DELETE FROM daily_rollup")
+    conn.execute(f"""
+        INSERT INTO daily_rollup (user_id, kind, day, category, total, roi_total, entries)
+        {raw_aggregate_sql()}""")
+
+
+def verify(conn):
+    """Return (key, expected, actual) for every rollup row that disagrees with the ledgers."""
+    key_cols = ("user_id", "kind", "day", "category")
+    expected = {tuple(row[:4]): tuple(row[4:]) for row in conn.execute(raw_aggregate_sql())}
+    actual = {tuple(row[:4]): tuple(row[4:]) for row in conn.execute(
+        f"SELECT {', '.join(key_cols)}, total, roi_total, entries FROM daily_rollup")}
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        want, got = expected.get(key), actual.get(key)
+        if want != got:
+            mismatches.append((key, want, got))
+    return sorted(mismatches, key=lambda m: tuple(str(v) for v in m[0]))
+
+
+def main(argv):
+    from database import connection, shard_paths
+    from db import init_db
+
+    command = argv[0] if argv else "verify"
+    if command not in ("verify", "rebuild"):
+        print("usage: python rollup.py [verify|rebuild]")
+        return 2
+
+    init_db()
+    failed = False
+    for path in shard_paths():
+        with connection(path) as conn:
+            if command == "rebuild":
+                rebuild(conn)
+            mismatches = verify(conn)
+        for key, want, got in mismatches[:50]:
+            print(f"MISMATCH {path} {key}: ledgers={want} rollup={got}")
+        print(f"{path}: {len(mismatches)} mismatched rollup rows")
+        failed = failed or bool(mismatches)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
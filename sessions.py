@@ -0,0 +1,82 @@
+# sessions.py
+#
+# Per-user conversation state (the pending action and the last search), kept in the sessions table of the user's shard
+# instead of in context.user_data. Nothing stays in memory between updates,
+# so the bot's footprint doesn't grow with the number of users, and a
+# half-finished edit survives a restart.
+#
+# A session holds entry ids, never the rows themselves: an edit acts on
+# whatever the row is by then, and finds nothing if it is gone. Entry list
+# buttons carry their entry's id, so they need no session state.
+# Sessions expire SESSION_TTL seconds after their last change; expired rows
+# are ignored on load and deleted from the shard at most once per
+# PURGE_INTERVAL.
+
+import os
+import time
+import threading
+
+from database import connection, user_db
+from units import now_ts
+
+SESSION_TTL = int(os.getenv("SESSION_TTL", "86400"))
+PURGE_INTERVAL = 3600
+
+LOAD_SESSION = """
+    SELECT action, edit_id, search_terms, search_date
+    FROM sessions WHERE user_id = ? AND expires > ?
+"""
+SAVE_SESSION = """
+    INSERT INTO sessions (user_id, action, edit_id, search_terms, search_date, expires)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        action = excluded.action, edit_id = excluded.edit_id, search_terms = excluded.search_terms,
+        search_date = excluded.search_date, expires = excluded.expires
+"""
+PURGE_SESSIONS = "DELETE FROM sessions WHERE expires <= ?"
+
+_last_purge = {}  # shard path -> time.monotonic() of its last purge
+_purge_lock = threading.Lock()
+
+
+class Session:
+    """One user's conversation state.
+
+    action: what the next text message is ("add_expense", "edit_income", ...), or None
+    edit_id: the entry an edit_* action will change
+    search: (terms, date filter) of the last search, for its page buttons
+    """
+
+    __slots__ = ("action", "edit_id", "search")
+
+    def __init__(self, action=None, edit_id=None, search=None):
+        self.action = action
+        self.edit_id = edit_id
+        self.search = search
+
+    def state(self):
+        return self.action, self.edit_id, self.search
+
+
+def load(user_id):
+    """user_id's Session; a new, empty one if there is none or it expired."""
+    with connection(user_db(user_id)) as conn:
+        row = conn.execute(LOAD_SESSION, (user_id, now_ts())).fetchone()
+    if row is None:
+        return Session()
+    action, edit_id, terms, date = row
+    return Session(action, edit_id, None if terms is None else (terms, date))
+
+
+def save(user_id, session):
+    path = user_db(user_id)
+    now = now_ts()
+    terms, date = session.search or (None, None)
+    with connection(path) as conn:
+        conn.execute(SAVE_SESSION, (user_id, session.action, session.edit_id, terms, date, now + SESSION_TTL))
+        with _purge_lock:
+            due = time.monotonic() - _last_purge.get(path, float("-inf")) >= PURGE_INTERVAL
+            if due:
+                _last_purge[path] = time.monotonic()
+        if due:
+            conn.execute(PURGE_SESSIONS, (now,))
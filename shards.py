@@ -0,0 +1,175 @@
+# shards.py
+#
+# Status and rebalancing for the sharded storage in database.py. Every user
+# lives on one shard, chosen by DB_SHARDS; after changing it, some users'
+# rows sit on the wrong file until they are moved:
+#
+#   python shards.py status              users and entries per shard, and how many are misplaced
+#   python shards.py rebalance           move every misplaced user to their shard
+#
+# Stop the bot, set the new DB_SHARDS, rebalance, then start the bot again.
+# A move copies the user's rows into the target shard (triggers rebuild its
+# rollup, search index and data version there), then deletes them from the
+# source. Each step is its own transaction and the target records the move
+# in shard_moves until the source is clean, so an interrupted run resumes
+# where it stopped and never loses or duplicates rows. Entry ids are
+# assigned anew on the target, so the user's conversation session (which
+# refers to entries by id) is dropped rather than moved.
+
+import os
+import re
+import sys
+import glob
+import sqlite3
+import argparse
+from datetime import datetime
+from contextlib import contextmanager
+
+import database
+from migrations import LEDGER_TABLES, columns, migrate
+
+USER_ENTRIES = "SELECT user_id, SUM(entries) FROM daily_rollup GROUP BY user_id"
+
+
+def shard_files():
+    """(index, path) for the configured shards and any higher-numbered shard files left on disk."""
+    files = dict(enumerate(database.shard_paths()))
+    root, ext = os.path.splitext(database.DB_PATH)
+    ext = ext or ".db"
+    for path in glob.glob(f"{glob.escape(root)}.shard*{glob.escape(ext)}"):
+        match = re.fullmatch(re.escape(root) + r"\.shard(\d+)" + re.escape(ext), path)
+        if match:
+            files.setdefault(int(match.group(1)), path)
+    return sorted(files.items())
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, isolation_level=None, timeout=database.POOL_TIMEOUT)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")  # each step must be durable before the next one starts
+    return conn
+
+
+@contextmanager
+def _transaction(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def user_entries(path):
+    """{user_id: entries} for the users with rows in the shard at path."""
+    conn = _connect(path)
+    try:
+        return dict(conn.execute(USER_ENTRIES).fetchall())
+    finally:
+        conn.close()
+
+
+def move_user(source, target, user_id):
+    """Move user_id's ledger rows from the shard at source to the one at target. Returns rows moved."""
+    conn = _connect(source)
+    name = os.path.basename(source)
+    moved = 0
+    try:
+        conn.execute("ATTACH DATABASE ? AS target", (target,))
+        pending = conn.execute("SELECT source FROM target.shard_moves WHERE user_id = ?", (user_id,)).fetchone()
+        if pending is not None and pending[0] != name:
+            raise RuntimeError(f"user {user_id} is still being moved into {target} from {pending[0]}")
+        if pending is None:
+            with _transaction(conn):
+                for table in LEDGER_TABLES:
+                    cols = ", ".join(c for c in columns(conn, table) if c != "id")
+                    moved += conn.execute(f"""
+                        INSERT INTO target.{table} ({cols})
+                        SELECT {cols} FROM main.{table} WHERE user_id = ? ORDER BY id""", (user_id,)).rowcount
+                # Versions only ever grow, so no cached report from either shard can match again.
+                conn.execute("""
+                    INSERT INTO target.data_versions (user_id, version)
+                    SELECT user_id, version + 1 FROM main.data_versions WHERE user_id = ?
+                    ON CONFLICT (user_id) DO UPDATE SET version = max(version, excluded.version) + 1""",
+                             (user_id,))
+                conn.execute("INSERT INTO target.shard_moves (user_id, source, moved_at) VALUES (?, ?, ?)",
+                             (user_id, name, datetime.now().strftime("%Y-%m-%d %H:%M")))
+        with _transaction(conn):
+            for table in LEDGER_TABLES:
+                conn.execute(f"DELETE FROM main.{table} WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM main.sessions WHERE user_id = ?", (user_id,))
+        with _transaction(conn):
+            conn.execute("DELETE FROM target.shard_moves WHERE user_id = ?", (user_id,))
+    finally:
+        conn.close()
+    return moved
+
+
+def resume_moves(files):
+    """Finish moves an earlier run left half done. Returns the number finished."""
+    by_name = {os.path.basename(path): path for _, path in files}
+    finished = 0
+    for _, target in files:
+        conn = _connect(target)
+        try:
+            pending = conn.execute("SELECT user_id, source FROM shard_moves").fetchall()
+        finally:
+            conn.close()
+        for user_id, source in pending:
+            move_user(by_name[source], target, user_id)
+            finished += 1
+    return finished
+
+
+def status(files):
+    misplaced = 0
+    print(f"{'shard':>5} {'path':40} {'users':>8} {'entries':>10} {'misplaced':>10}")
+    for index, path in files:
+        entries = user_entries(path)
+        wrong = [u for u in entries if database.shard_index(u) != index]
+        misplaced += len(wrong)
+        note = "" if index < database.SHARDS else "  (beyond DB_SHARDS)"
+        print(f"{index:>5} {path:40} {len(entries):>8,} {sum(entries.values()):>10,} {len(wrong):>10,}{note}")
+    return misplaced
+
+
+def rebalance(files):
+    resumed = resume_moves(files)
+    if resumed:
+        print(f"finished {resumed} interrupted move(s)")
+    users = rows = 0
+    for index, path in files:
+        for user_id in sorted(user_entries(path)):
+            home = database.shard_index(user_id)
+            if home != index:
+                rows += move_user(path, database.shard_path(home), user_id)
+                users += 1
+        print(f"{path}: done")
+    print(f"moved {users:,} users ({rows:,} rows)")
+    for index, path in files:
+        if index >= database.SHARDS:
+            print(f"{path} is beyond DB_SHARDS={database.SHARDS} and now empty; it can be deleted")
+
+
+def main(argv):
+    from db import init_db
+
+    parser = argparse.ArgumentParser(description="Inspect or rebalance the database shards")
+    parser.add_argument("command", choices=["status", "rebalance"])
+    args = parser.parse_args(argv)
+
+    init_db()  # creates any new shard files and brings every configured shard up to date
+    files = shard_files()
+    for _, path in files[database.SHARDS:]:
+        with database.connection(path) as conn:
+            migrate(conn)
+    if args.command == "rebalance":
+        rebalance(files)
+    misplaced = status(files)
+    database.close_all()
+    return 1 if misplaced else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,415 @@
+# snapshot.py
+#
+# Columnar snapshot of the four ledgers for fleet-wide analytics, so totals
+# per user, label distributions and monthly trends across every user never
+# run against the live databases. Each ledger is stored as Parquet under
+# SNAPSHOT_DIR, partitioned by shard:
+#
+#   snapshots/<ledger>/shard=<i>/part-000000.parquet, part-000001.parquet, ...
+#   snapshots/manifest.json      per shard: change-log position and live parts
+#
+# The first `update` writes every row. Later ones read the ledger_changes log
+# (migration 10) from where the last one stopped and append one part per
+# ledger with the current version of each changed entry, and a tombstone
+# (deleted = true) for each deleted one; then they trim the log. A reader
+# keeps the last version of every id in part order. `compact` rewrites each
+# shard's parts as a single part sorted by ts, which drops superseded rows
+# and lets time filters skip whole row groups; the parts it replaces are
+# deleted by the next update or compact, so queries already running finish.
+#
+#   python snapshot.py update                 snapshot what changed since the last update
+#   python snapshot.py compact                merge every shard's parts into one
+#   python snapshot.py stop                   stop logging changes (no more updates)
+#   python snapshot.py users|labels|monthly [--kind expenses] [--period 2025-05] [--limit 20]
+#
+# Writes are only logged once the first update has registered the snapshot
+# in change_log_readers (migration 11), and the log keeps growing until the
+# next update trims it: schedule update regularly, or run stop. update reads
+# each shard in one read-only transaction and otherwise only writes the
+# registration and the trim; queries only read SNAPSHOT_DIR. Run update and compact
+# from one place at a time, e.g. a cron job.
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+from urllib.parse import quote
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import database
+from shards import shard_files
+from migrations import LEDGER_TABLES, SEARCH_KINDS, migrate
+from units import format_amount, period
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+KINDS = list(LEDGER_TABLES)
+CHUNK = 250_000  # rows per record batch read from SQLite
+ROW_GROUP = 1_000_000
+
+SCHEMA = pa.schema([
+    ("id", pa.int64()), ("user_id", pa.int64()), ("amount_cents", pa.int64()), ("label", pa.string()),
+    ("ts", pa.int64()), ("deleted", pa.bool_()),
+])
+SCHEMAS = {kind: SCHEMA for kind in KINDS}
+SCHEMAS["investments"] = SCHEMA.append(pa.field("roi", pa.float64())).append(pa.field("interval", pa.string()))
+
+LOG_POSITION = "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'ledger_changes'), 0)"
+LOG_START = "SELECT MIN(seq) FROM ledger_changes"
+TRIM_LOG = "DELETE FROM ledger_changes WHERE seq <= ?"
+REGISTER = "INSERT OR IGNORE INTO change_log_readers (name, since) VALUES ('snapshot', ?)"
+UNREGISTER = "DELETE FROM change_log_readers WHERE name = 'snapshot'"
+CLEAR_LOG = "DELETE FROM ledger_changes WHERE NOT EXISTS (SELECT 1 FROM change_log_readers)"
+
+
+def _select(kind):
+    label = LEDGER_TABLES[kind][0]
+    extra = ", t.roi, t.interval" if kind == "investments" else ""
+    return f"t.user_id, t.amount_cents, t.{label}, t.ts, t.id IS NULL{extra}"
+
+
+def all_rows(kind):
+    return f"SELECT t.id, {_select(kind)} FROM {kind} t"
+
+
+def changed_rows(kind):
+    # Deleted entries come back with NULL columns: the tombstones.
+    return f"""
+        SELECT c.entry_id, {_select(kind)}
+        FROM (SELECT DISTINCT entry_id FROM ledger_changes
+              WHERE kind = {SEARCH_KINDS[kind]} AND seq > ? AND seq <= ?) c
+        LEFT JOIN {kind} t ON t.id = c.entry_id
+        ORDER BY c.entry_id"""
+
+
+# --- MANIFEST ---
+def read_manifest(directory=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(directory, "manifest.json")) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {"shards": {}}
+
+
+def write_manifest(manifest, directory=SNAPSHOT_DIR):
+    path = os.path.join(directory, "manifest.json")
+    with open(path + ".partial", "w") as fh:
+        json.dump(manifest, fh, indent=2)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(path + ".partial", path)
+
+
+def part_path(directory, kind, shard, n):
+    return os.path.join(directory, kind, f"shard={shard}", f"part-{n:06d}.parquet")
+
+
+def live_parts(manifest, kind, directory=SNAPSHOT_DIR):
+    """{shard: [part paths, oldest first]} for one ledger."""
+    parts = {}
+    for shard, state in manifest["shards"].items():
+        span = state["parts"].get(kind)
+        if span and span[0] < span[1]:
+            parts[shard] = [part_path(directory, kind, shard, n) for n in range(*span)]
+    return parts
+
+
+# --- UPDATE ---
+def _batches(conn, sql, params, schema):
+    cur = conn.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(CHUNK)
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        columns[5] = [bool(d) for d in columns[5]]
+        yield pa.RecordBatch.from_arrays([pa.array(c, f.type) for c, f in zip(columns, schema)], schema=schema)
+
+
+def _write_part(path, batches, schema):
+    """Write batches to path; returns the row count (0: no file)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    staged = path + ".partial"
+    rows = 0
+    writer = None
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = pq.ParquetWriter(staged, schema, compression="zstd")
+            writer.write_batch(batch, row_group_size=ROW_GROUP)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    if rows:
+        os.replace(staged, path)
+    return rows
+
+
+def _read_only(path):
+    conn = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True, isolation_level=None,
+                           timeout=database.POOL_TIMEOUT)
+    conn.execute("BEGIN")  # one read snapshot for the log position and every ledger
+    return conn
+
+
+def update_shard(index, path, manifest, directory=SNAPSHOT_DIR):
+    """Append what changed on one shard since the last update. Returns {kind: rows written}."""
+    shard = str(index)
+    state = manifest["shards"].get(shard)
+    if state is not None and state["db"] != os.path.abspath(path):
+        raise SystemExit(f"{directory} holds a snapshot of {state['db']}, not {path}")
+    # Writes are only logged while a reader is registered, so register before
+    # reading; if this registers anew, changes since the last update were lost.
+    with database.connection(path) as live:  # rolled back if this raises
+        registered = live.execute(REGISTER, (datetime.now().strftime("%Y-%m-%d %H:%M"),)).rowcount
+        if registered and state is not None:
+            raise SystemExit(f"ledger changes on {path} were not logged since this snapshot (seq {state['seq']}); "
+                             f"remove {directory} and update again for a full snapshot")
+    written = {}
+    conn = _read_only(path)
+    try:
+        high = conn.execute(LOG_POSITION).fetchone()[0]
+        if state is None:
+            state = {"db": os.path.abspath(path), "seq": 0, "parts": {}}
+            queries = {kind: (all_rows(kind), ()) for kind in KINDS}
+        else:
+            start = conn.execute(LOG_START).fetchone()[0]
+            if start is not None and start > state["seq"] + 1:
+                raise SystemExit(f"ledger_changes on {path} was trimmed past this snapshot (seq {state['seq']}); "
+                                 f"remove {directory} and update again for a full snapshot")
+            queries = {kind: (changed_rows(kind), (state["seq"], high)) for kind in KINDS}
+        for kind, (sql, params) in queries.items():
+            first, n = state["parts"].get(kind, (0, 0))
+            written[kind] = _write_part(part_path(directory, kind, shard, n),
+                                        _batches(conn, sql, params, SCHEMAS[kind]), SCHEMAS[kind])
+            if written[kind]:
+                state["parts"][kind] = (first, n + 1)
+    finally:
+        conn.close()
+
+    state["seq"] = high
+    manifest["shards"][shard] = state
+    write_manifest(manifest, directory)
+    with database.connection(path) as live:
+        live.execute(TRIM_LOG, (high,))
+    return written
+
+
+def stop():
+    """Stop logging ledger changes on every shard and drop the log; the snapshot can't be updated after this."""
+    for _, path in shard_files():
+        with database.connection(path) as live:
+            live.execute(UNREGISTER)
+            live.execute(CLEAR_LOG)
+
+
+def update(directory=SNAPSHOT_DIR):
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    _sweep(manifest, directory)
+    totals = dict.fromkeys(KINDS, 0)
+    for index, path in shard_files():
+        for kind, rows in update_shard(index, path, manifest, directory).items():
+            totals[kind] += rows
+    return totals
+
+
+# --- READ ---
+def _current(tables):
+    """Concatenate one shard's parts (oldest first) and keep the last version of each id."""
+    table = pa.concat_tables(tables)
+    if len(tables) > 1:
+        ids = table["id"].to_numpy()
+        order = np.argsort(ids, kind="stable")
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = ids[order][1:] != ids[order][:-1]
+        table = table.take(np.sort(order[last]))
+    return table.filter(pc.invert(table["deleted"]))
+
+
+def load(kind, columns=None, since=None, until=None, directory=SNAPSHOT_DIR):
+    """Current rows of one ledger across every shard as a pyarrow Table, optionally with since <= ts < until."""
+    columns = list(columns or SCHEMAS[kind].names)
+    manifest = read_manifest(directory)
+    shards = []
+    for paths in live_parts(manifest, kind, directory).values():
+        if len(paths) == 1:
+            # One part has no superseded rows, so the time filter can go to the reader.
+            table = _in_period(_read(paths[0], _needed(columns, since, until), _filters(since, until)), since, until)
+        else:
+            parts = [_read(p, _needed(columns, since, until, "id")) for p in paths]
+            table = _in_period(_current(parts), since, until)
+        shards.append(table.select(columns))
+    if not shards:
+        return SCHEMAS[kind].empty_table().select(columns)
+    return pa.concat_tables(shards).unify_dictionaries()
+
+
+def _read(path, columns, filters=None):
+    # Labels come back dictionary-encoded, as stored: grouping by them then works on integer codes.
+    labels = [name for name in ("label", "interval") if name in columns]
+    return pq.read_table(path, columns=columns, filters=filters, read_dictionary=labels)
+
+
+def _needed(columns, since, until, *extra):
+    needed = set(columns) | {"deleted", *extra}
+    if since is not None or until is not None:
+        needed.add("ts")
+    return [name for name in SCHEMA.names + ["roi", "interval"] if name in needed]
+
+
+def _filters(since, until):
+    filters = [("deleted", "=", False)]
+    if since is not None:
+        filters.append(("ts", ">=", since))
+    if until is not None:
+        filters.append(("ts", "<", until))
+    return filters
+
+
+def _in_period(table, since, until):
+    table = table.filter(pc.invert(table["deleted"]))
+    if since is not None:
+        table = table.filter(pc.greater_equal(table["ts"], since))
+    if until is not None:
+        table = table.filter(pc.less(table["ts"], until))
+    return table
+
+
+# --- QUERIES ---
+def totals_per_user(kind="expenses", since=None, until=None, directory=SNAPSHOT_DIR):
+    """user_id, entries, total_cents for every user, largest total first."""
+    table = load(kind, ["user_id", "amount_cents"], since, until, directory)
+    result = table.group_by("user_id").aggregate([("amount_cents", "count"), ("amount_cents", "sum")])
+    result = result.rename_columns(["user_id", "entries", "total_cents"])
+    return result.sort_by([("total_cents", "descending"), ("user_id", "ascending")])
+
+
+def label_totals(kind="expenses", since=None, until=None, directory=SNAPSHOT_DIR):
+    """label, entries, total_cents and share of the fleet total, largest first."""
+    table = load(kind, ["label", "amount_cents"], since, until, directory)
+    result = table.group_by("label").aggregate([("amount_cents", "count"), ("amount_cents", "sum")])
+    result = result.rename_columns(["label", "entries", "total_cents"])
+    total = pc.sum(result["total_cents"]).as_py() or 0
+    share = pc.divide(pc.cast(result["total_cents"], pa.float64()), total or 1)
+    return result.append_column("share", share).sort_by([("total_cents", "descending")])
+
+
+def monthly_totals(since=None, until=None, directory=SNAPSHOT_DIR):
+    """month (YYYYMM) and one total_cents column per ledger, oldest month first."""
+    merged = None
+    for kind in KINDS:
+        table = load(kind, ["ts", "amount_cents"], since, until, directory)
+        moment = pc.cast(table["ts"], pa.timestamp("s"))  # wall-clock epoch: UTC fields are the local ones
+        month = pc.add(pc.multiply(pc.year(moment), 100), pc.month(moment))
+        sums = pa.table({"month": month, kind: table["amount_cents"]}).group_by("month").aggregate([(kind, "sum")])
+        sums = sums.rename_columns(["month", kind])
+        merged = sums if merged is None else merged.join(sums, "month", join_type="full outer")
+    months = merged.select(["month"] + KINDS).sort_by("month")
+    return pa.table({name: pc.fill_null(months[name], 0) for name in months.column_names})
+
+
+# --- COMPACTION ---
+def compact(directory=SNAPSHOT_DIR):
+    """Rewrite every shard's parts of every ledger as one part. Returns how many were merged."""
+    manifest = read_manifest(directory)
+    _sweep(manifest, directory)
+    merged = 0
+    for kind in KINDS:
+        for shard, paths in live_parts(manifest, kind, directory).items():
+            first, n = manifest["shards"][shard]["parts"][kind]
+            if n - first == 1:
+                continue
+            table = _current([pq.read_table(p) for p in paths]).sort_by("ts")
+            written = _write_part(part_path(directory, kind, shard, n), table.to_batches(CHUNK), SCHEMAS[kind])
+            manifest["shards"][shard]["parts"][kind] = (n, n + 1) if written else (n, n)
+            manifest["retired"] = manifest.get("retired", []) + paths
+            write_manifest(manifest, directory)
+            merged += len(paths)
+    return merged
+
+
+def _sweep(manifest, directory=SNAPSHOT_DIR):
+    # Parts a compact replaced stay on disk until the next update or compact,
+    # so a query that read the manifest before that compact can still open them.
+    retired = manifest.pop("retired", [])
+    if retired:
+        write_manifest(manifest, directory)
+        for path in retired:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+# --- CLI ---
+def _print(table, amounts, limit):
+    names = table.column_names
+    print("  ".join(f"{name:>14}" for name in names))
+    for row in table.slice(0, limit).to_pylist():
+        cells = []
+        for name in names:
+            value = row[name]
+            if name in amounts:
+                value = format_amount(value)
+            elif isinstance(value, float):
+                value = f"{value:.1%}"
+            cells.append(f"{value!s:>14}")
+        print("  ".join(cells))
+    if table.num_rows > limit:
+        print(f"... {table.num_rows - limit} more")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Snapshot the ledgers to Parquet and query them fleet-wide")
+    parser.add_argument("command", choices=["update", "compact", "stop", "users", "labels", "monthly"])
+    parser.add_argument("--kind", choices=KINDS, default="expenses")
+    parser.add_argument("--period", help="only entries in this year, month or day (YYYY[-MM[-DD]])")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command in ("update", "stop"):
+        from db import init_db
+        init_db()  # brings every shard to the schema with ledger_changes
+        for _, path in shard_files()[database.SHARDS:]:  # left over from a change of DB_SHARDS
+            with database.connection(path) as conn:
+                migrate(conn)
+    if args.command == "update":
+        written = update()
+        database.close_all()
+        print(f"snapshot updated in {time.perf_counter() - start:.1f}s: "
+              + ", ".join(f"{rows:,} {kind}" for kind, rows in written.items()))
+        return 0
+    if args.command == "stop":
+        stop()
+        database.close_all()
+        print(f"ledger changes are no longer logged; remove {SNAPSHOT_DIR} or run update again for a new snapshot")
+        return 0
+    if args.command == "compact":
+        merged = compact()
+        print(f"merged {merged} parts in {time.perf_counter() - start:.1f}s")
+        return 0
+
+    since, until = period(args.period) if args.period else (None, None)
+    if args.command == "users":
+        result, amounts = totals_per_user(args.kind, since, until), {"total_cents"}
+    elif args.command == "labels":
+        result, amounts = label_totals(args.kind, since, until), {"total_cents"}
+    else:
+        result, amounts = monthly_totals(since, until), set(KINDS)
+    elapsed = time.perf_counter() - start
+    _print(result, amounts, args.limit)
+    print(f"({elapsed * 1000:.0f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
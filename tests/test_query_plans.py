@@ -0,0 +1,22 @@
+# tests/test_query_plans.py
+#
+# Every read/update/delete statement in db.py and sessions.py must be served
+# by an index on a freshly migrated database (same check as
+# `python migrations.py --check-plans`).
+
+import sqlite3
+
+from migrations import MIGRATIONS, db_queries, migrate, unindexed_plans
+
+
+def test_migrations_reach_latest_version(tmp_path):
+    conn = sqlite3.connect(tmp_path / "plans.db")
+    assert migrate(conn) == MIGRATIONS[-1][0]
+    assert migrate(conn) == MIGRATIONS[-1][0]  # a second run applies nothing
+
+
+def test_every_query_uses_an_index(tmp_path):
+    conn = sqlite3.connect(tmp_path / "plans.db")
+    migrate(conn)
+    assert db_queries()
+    assert unindexed_plans(conn) == []
@@ -0,0 +1,19 @@
+# tests/test_throttle.py
+#
+# The per-user render token bucket: a burst goes through, the next tap waits,
+# and a rate or burst of 0 turns the limit off (as the README says).
+
+from throttle import TokenBucket
+
+
+def test_burst_then_wait():
+    bucket = TokenBucket(rate=1 / 60, burst=2)
+    assert bucket.take(1) == 0
+    assert bucket.take(1) == 0
+    assert bucket.take(1) > 0
+    assert bucket.take(2) == 0  # other users have their own bucket
+
+
+def test_zero_turns_the_limit_off():
+    for bucket in (TokenBucket(rate=0, burst=4), TokenBucket(rate=1 / 60, burst=0)):
+        assert all(bucket.take(1) == 0 for _ in range(100))
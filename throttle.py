@@ -0,0 +1,54 @@
+# throttle.py
+#
+# Limits on report and chart requests. Each user has a token bucket that
+# refills at RENDER_RATE requests per minute and holds at most RENDER_BURST,
+# so a few taps in a row go through and a tap storm gets "slow down" instead
+# of a render each. Across all users, at most RENDER_MAX_PENDING renders may
+# be running or queued at once (async_db enforces it and raises Busy), which
+# keeps a retry storm from piling up behind the render pool.
+
+import os
+import time
+
+import metrics
+
+RENDER_RATE = float(os.getenv("RENDER_RATE", "12"))  # per user, per minute
+RENDER_BURST = int(os.getenv("RENDER_BURST", "4"))
+RENDER_MAX_PENDING = int(os.getenv("RENDER_MAX_PENDING", "32"))
+PRUNE_SIZE = 10_000  # buckets kept before full ones are dropped
+
+
+class Busy(Exception):
+    """Too many renders or imports pending across all users; try again shortly."""
+
+
+class TokenBucket:
+    """Per-key token buckets. Used from the event loop only, so there is no lock."""
+
+    def __init__(self, rate=RENDER_RATE / 60, burst=RENDER_BURST):
+        self.rate, self.burst = rate, burst
+        self._buckets = {}  # key -> (tokens, time.monotonic() of the last update)
+
+    def take(self, key):
+        """Spend a token for key. Returns 0 if one was available, else the seconds until one is."""
+        if self.rate <= 0 or self.burst <= 0:  # 0 turns the limit off
+            return 0.0
+        now = time.monotonic()
+        tokens, stamp = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            metrics.THROTTLED.inc("rate")
+            return (1 - tokens) / self.rate
+        self._buckets[key] = (tokens - 1, now)
+        if len(self._buckets) > PRUNE_SIZE:
+            self._prune(now)
+        return 0.0
+
+    def _prune(self, now):
+        # A bucket that has refilled is the same as no bucket.
+        full = self.burst / self.rate
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < full}
+
+
+renders = TokenBucket()
@@ -0,0 +1,70 @@
+# units.py
+#
+# Storage units for ledger rows (schema version 7). Amounts are integer cents
+# and times are integer "wall-clock" epoch seconds: the local time an entry
+# was recorded, counted as if it were UTC. SQLite's date functions then work
+# on them exactly, with no time-zone lookup, and the calendar day of a row is
+# simply ts // DAY. Text only appears at the edges: user input, messages and
+# exports.
+
+import calendar
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from datetime import datetime, timedelta
+
+DAY = 86400
+EPOCH = datetime(1970, 1, 1)
+MAX_TS = 1 << 62
+MAX_CENTS = 1 << 63  # exclusive: SQLite INTEGER is 64-bit
+
+
+# --- MONEY ---
+def to_cents(value):
+    """'12.5', 12.5 or Decimal('12.5') -> 1250, rounding half up to the cent."""
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"invalid amount {value!r}") from None
+    if not amount.is_finite():
+        raise ValueError(f"invalid amount {value!r}")
+    try:
+        cents = int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except InvalidOperation:  # more digits than the decimal context holds, e.g. '1e30'
+        raise ValueError(f"amount out of range {value!r}") from None
+    if abs(cents) >= MAX_CENTS:
+        raise ValueError(f"amount out of range {value!r}")
+    return cents
+
+
+def format_amount(cents):
+    sign = "-" if cents < 0 else ""
+    whole, frac = divmod(abs(cents), 100)
+    return f"{sign}{whole}.{frac:02d}"
+
+
+# --- TIME ---
+def to_ts(moment):
+    return calendar.timegm(moment.timetuple())
+
+
+def now_ts():
+    return to_ts(datetime.now())
+
+
+def format_ts(ts, fmt="%Y-%m-%d %H:%M"):
+    return (EPOCH + timedelta(seconds=ts)).strftime(fmt)
+
+
+def period(text):
+    """'2025', '2025-05' or '2025-05-03' -> (start, end) in epoch seconds, end exclusive."""
+    parts = [int(p) for p in text.split("-")]
+    if len(parts) == 1:
+        start, end = datetime(parts[0], 1, 1), datetime(parts[0] + 1, 1, 1)
+    elif len(parts) == 2:
+        year, month = parts
+        start, end = datetime(year, month, 1), datetime(year + month // 12, month % 12 + 1, 1)
+    elif len(parts) == 3:
+        start = datetime(*parts)
+        end = start + timedelta(days=1)
+    else:
+        raise ValueError(f"invalid date {text!r}")
+    return to_ts(start), to_ts(end)
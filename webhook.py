@@ -0,0 +1,200 @@
+# webhook.py
+#
+# Webhook mode: Telegram POSTs each update to a local HTTP server instead of
+# the bot long-polling getUpdates. Set WEBHOOK_URL to the public https URL
+# Telegram should call (a reverse proxy terminates TLS and forwards to
+# WEBHOOK_LISTEN:WEBHOOK_PORT); the URL's path is the one served here.
+#
+# The server is a small HTTP/1.1 keep-alive server on asyncio, running in
+# the bot's event loop. A request is answered as soon as its update is on
+# the application's update queue, so Telegram never waits for a handler.
+# WEBHOOK_SECRET is required: it is registered with Telegram, and requests
+# that don't carry it in X-Telegram-Bot-Api-Secret-Token are refused, since
+# anyone who can reach the server could otherwise post updates as any user.
+#
+# On SIGINT/SIGTERM the server stops accepting connections, finishes the
+# requests it is reading, then the application handles every queued update
+# before shutting down (up to WEBHOOK_DRAIN_TIMEOUT seconds for the server).
+
+import os
+import re
+import hmac
+import json
+import signal
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+from telegram import Update
+
+import metrics
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Telegram's limit is 1-100
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+MAX_BODY = 1 << 20  # updates are a few KB; Telegram caps them well below this
+MAX_HEAD = 16 << 10
+SECRET_FORMAT = re.compile(r"[A-Za-z0-9_-]{1,256}")  # what Telegram accepts as a secret_token
+
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+           411: "Length Required", 413: "Payload Too Large"}
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookServer:
+    """Accepts Telegram's update POSTs on listen:port and puts them on app.update_queue."""
+
+    def __init__(self, app, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, path="/", secret=WEBHOOK_SECRET):
+        if not SECRET_FORMAT.fullmatch(secret):
+            raise SystemExit("WEBHOOK_SECRET must be set to 1-256 characters from A-Z, a-z, 0-9, _ and - "
+                             "for webhook mode")
+        self.app = app
+        self.listen, self.port, self.path = listen, port, path or "/"
+        self.secret = secret.encode()
+        self._server = None
+        self._connections = {}  # writer -> True while a request is being read and answered
+        self._idle = asyncio.Event()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.listen, self.port, limit=MAX_HEAD)
+        self.port = self._server.sockets[0].getsockname()[1]  # the real one when port was 0
+        logger.info("Webhook server on http://%s:%d%s", self.listen, self.port, self.path)
+        return self.port
+
+    async def stop(self, timeout=WEBHOOK_DRAIN_TIMEOUT):
+        """Stop accepting, let requests in progress finish, and close every connection."""
+        self._server.close()
+        for writer, busy in list(self._connections.items()):
+            if not busy:
+                writer.close()  # its reader sees EOF and the connection ends
+        if any(self._connections.values()):
+            self._idle.clear()
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Webhook requests still open after %.0fs; closing them", timeout)
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self._connections[writer] = False
+        try:
+            while self._server.is_serving():
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                self._connections[writer] = True
+                status, keep_alive = await self._handle(head, reader)
+                metrics.WEBHOOK_REQUESTS.inc(str(status))
+                keep_alive = keep_alive and self._server.is_serving()
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Length: 0\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode())
+                await writer.drain()
+                self._connections[writer] = False
+                if not any(self._connections.values()):
+                    self._idle.set()
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self._connections[writer]
+            if not any(self._connections.values()):
+                self._idle.set()
+            writer.close()
+
+    async def _handle(self, head, reader):
+        """Read one request's body and queue its update. Returns (status, keep-alive)."""
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            return 400, False
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        try:
+            length = int(headers["content-length"])
+        except (KeyError, ValueError):
+            length = None
+        if length is not None and length > MAX_BODY:
+            return 413, False
+        body = await reader.readexactly(length) if length else b""
+
+        if urlsplit(target).path != self.path:
+            return 404, keep_alive
+        if method != "POST":
+            return 405, keep_alive
+        if not hmac.compare_digest(
+                headers.get("x-telegram-bot-api-secret-token", "").encode(), self.secret):
+            return 403, keep_alive
+        if length is None:
+            return 411, False
+        try:
+            data = json.loads(body)
+            if not isinstance(data, dict):
+                raise ValueError("not a JSON object")
+            update = Update.de_json(data, self.app.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as exc:
+            logger.warning("Rejected a webhook body: %s", exc)
+            return 400, keep_alive
+        await self.app.update_queue.put(update)
+        return 200, keep_alive
+
+
+# --- LIFECYCLE ---
+# Application.run_webhook would do this, but it needs tornado; these are the
+# same steps around the server above.
+async def start(app, url=WEBHOOK_URL, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, secret=WEBHOOK_SECRET):
+    """Initialize and start app, serve updates, and register url with Telegram (if given). Returns the server."""
+    server = WebhookServer(app, listen, port, urlsplit(url).path, secret)  # checks the secret first
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    await server.start()
+    if url:
+        await app.bot.set_webhook(url, allowed_updates=Update.ALL_TYPES, secret_token=secret,
+                                  max_connections=WEBHOOK_MAX_CONNECTIONS)
+    return server
+
+
+async def drain(app, server, timeout=WEBHOOK_DRAIN_TIMEOUT):
+    """Take no more updates, handle every one already received, then shut app down."""
+    await server.stop(timeout)
+    await app.stop()  # waits for the update queue to empty and running handlers to return
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+
+
+async def serve(app, stop, **options):
+    """Run app in webhook mode until the stop event is set."""
+    server = await start(app, **options)
+    try:
+        await stop.wait()
+        logger.info("Draining webhook updates")
+    finally:
+        await drain(app, server)
+
+
+def run(app, **options):
+    """Webhook counterpart of app.run_polling(): serve until SIGINT or SIGTERM."""
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await serve(app, stop, **options)
+
+    asyncio.run(main())
@@ -0,0 +1,165 @@
+# write_queue.py
+#
+# Group commit for ledger inserts. Writers from every chat submit
+# (sql, params) and get a Future back; a background thread collects pending
+# writes and commits them together, one executemany per statement inside a
+# single transaction, once WRITE_BATCH_SIZE writes are waiting or
+# WRITE_BATCH_DELAY_MS has passed since the oldest one. A Future only
+# resolves after its batch has committed, so a caller that waits on it (as
+# the bot does before replying) never acknowledges a write that could be
+# lost. stop() drains everything still queued before returning.
+#
+# Each database shard has its own queue and flusher thread, so commits on
+# different shards never wait for each other.
+
+import os
+import time
+import atexit
+import logging
+import threading
+from concurrent.futures import Future
+
+import metrics
+import database
+from database import connection
+
+BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "500"))
+BATCH_DELAY = int(os.getenv("WRITE_BATCH_DELAY_MS", "20")) / 1000
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue:
+    def __init__(self, path=None, batch_size=BATCH_SIZE, delay=BATCH_DELAY):
+        self.path = path
+        self.batch_size = batch_size
+        self.delay = delay
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self.batches = 0
+        self.writes = 0
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+                self._thread.start()
+
+    def submit(self, sql, params):
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write queue is stopped")
+            self._pending.append((sql, params, future))
+            # Wake the flusher for the first write (starts the delay window) and
+            # when a full batch is ready.
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        if self._thread is None:
+            self.start()
+        return future
+
+    def stop(self):
+        """Stop accepting writes, flush everything queued and wait for the flusher."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if self._pending and not self._closed and len(self._pending) < self.batch_size:
+                # Give other writers a moment to join this batch.
+                self._cond.wait(self.delay)
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._commit(batch)
+
+    def _commit(self, batch):
+        grouped = {}
+        for sql, params, _ in batch:
+            grouped.setdefault(sql, []).append(params)
+        start = time.perf_counter()
+        try:
+            with connection(self.path) as conn:
+                for sql, rows in grouped.items():
+                    conn.executemany(sql, rows)
+        except Exception:
+            logger.exception("Batched write of %d rows failed; retrying one by one", len(batch))
+            self._commit_individually(batch)
+            return
+        metrics.WRITE_BATCH_SECONDS.observe(time.perf_counter() - start)
+        metrics.WRITE_BATCH_ROWS.observe(len(batch))
+        self.batches += 1
+        self.writes += len(batch)
+        for _, _, future in batch:
+            future.set_result(None)
+
+    def _commit_individually(self, batch):
+        # Isolates the bad write so the rest of the batch still lands.
+        for sql, params, future in batch:
+            try:
+                with connection(self.path) as conn:
+                    conn.execute(sql, params)
+            except Exception as exc:
+                future.set_exception(exc)
+            else:
+                self.batches += 1
+                self.writes += 1
+                future.set_result(None)
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+_stopped = False
+
+
+def get_queue(path=None):
+    path = path or database.DB_PATH
+    queue = _queues.get(path)
+    if queue is None:
+        with _queues_lock:
+            if _stopped:
+                raise RuntimeError("write queue is stopped")
+            queue = _queues.setdefault(path, WriteQueue(path))
+    return queue
+
+
+def submit(sql, params, path=None):
+    """Queue one write for the database at path (default: DB_PATH); returns a Future."""
+    return get_queue(path).submit(sql, params)
+
+
+def stop():
+    global _stopped
+    with _queues_lock:
+        _stopped = True
+        queues = list(_queues.values())
+    for queue in queues:
+        queue.stop()
+
+
+def stats():
+    queues = list(_queues.values())
+    return {"batches": sum(q.batches for q in queues), "writes": sum(q.writes for q in queues),
+            "pending": sum(len(q._pending) for q in queues)}
+
+
+metrics.Collected("ceefinance_write_queue_pending", "Writes waiting for a group commit", "gauge",
+                  lambda: {(os.path.basename(path),): len(q._pending) for path, q in list(_queues.items())},
+                  ["shard"])
+
+
+atexit.register(stop)